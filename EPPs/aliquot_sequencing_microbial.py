@@ -5,8 +5,7 @@ Maya Brandi
 """
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 from genologics.epp import EppLogger
@@ -93,10 +92,8 @@ if __name__ == "__main__":
     parser = ArgumentParser(description=DESC)
     parser.add_argument('--pid',
                         help='Lims id for current Process')
+    add_run_options(parser)
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-
-    main(lims, args)
+    run(main, args)
 
@@ -8,6 +8,9 @@ from genologics.config import BASEURI,USERNAME,PASSWORD
 from genologics.entities import Process
 from genologics.epp import EppLogger
 
+from clinical_EPPs.lineage import LineageIndex
+from clinical_EPPs.batch import get_batch
+
 import logging
 import sys
 
@@ -23,58 +26,57 @@ class CopyUDF():
         self.failded_udfs = ''
         self.falied_processes = ''
         self.aggregate_qc_steps = aggregate_qc_steps
+        self.histories = {}
+        self.process_types = {}
 
     def get_artifacts(self):
         all_artifacts = self.process.all_outputs(unique=True)
         self.artifacts = filter(lambda a: a.output_type == "Analyte" , all_artifacts)
 
+    def get_history(self):
+        """Walk the history of all artifacts together. Completed processes
+        are read from the process cache."""
+
+        lineage = LineageIndex(self.process.lims)
+        self.histories = lineage.history(self.artifacts, analytes_only=True)
+        self.process_types = dict((process.id, lineage.process_type(process))
+                                  for steps in self.histories.values() for process, parent_input in steps)
+        get_batch(self.process.lims, [parent_input for steps in self.histories.values()
+                                      for process, parent_input in steps])
+
     def get_udfs_from_lowpriostep(self, outpt):
         sample = outpt.samples[0].name
-        child_processes = []
-        parent_process = outpt.parent_process
-        while parent_process:
-            parent_inputs = [a for a in parent_process.all_inputs() if a.type=='Analyte']
-            for parent_input in parent_inputs:
-                sample_names = [s.name  for s in parent_input.samples]
-                if sample in sample_names:
-                    for aggregate_qc_step in self.aggregate_qc_steps:
-                        child_processes =  lims.get_processes(type = aggregate_qc_step,
-                                                inputartifactlimsid = parent_input.id)
-                        if child_processes:
-                            break
-                    if child_processes:
-                        for udf in self.udfs:
-                            try:
-                                outpt.udf[udf] = parent_input.udf[udf]
-                                outpt.put()
-                                logging.info('Sample {0}: Copied "Concentration (nM)" from output artifact of "{1}" to output artifact of current process'.format(sample, aggregate_qc_step))
-                            except:
-                                self.failded_udfs = 'Failed to copy some udfs.'
-                        return True
-                    else:
-                        parent_process = parent_input.parent_process
-
+        for parent_process, parent_input in self.histories[outpt]:
+            if parent_input is None:
+                continue
+            child_processes = []
+            for aggregate_qc_step in self.aggregate_qc_steps:
+                child_processes =  lims.get_processes(type = aggregate_qc_step,
+                                        inputartifactlimsid = parent_input.id)
+                if child_processes:
+                    break
+            if child_processes:
+                for udf in self.udfs:
+                    try:
+                        outpt.udf[udf] = parent_input.udf[udf]
+                        outpt.put()
+                        logging.info('Sample {0}: Copied "Concentration (nM)" from output artifact of "{1}" to output artifact of current process'.format(sample, aggregate_qc_step))
+                    except:
+                        self.failded_udfs = 'Failed to copy some udfs.'
+                return True
         return False
 
     def get_udfs_from_highpriostep(self, artifact, stop_process):
         sample = artifact.samples[0].name
-        parent_process = artifact.parent_process
-        while parent_process:
-            parent_inputs = [a for a in parent_process.all_inputs() if a.type=='Analyte']
-            for parent_input in parent_inputs:
-                sample_names = [s.name  for s in parent_input.samples]
-                if sample in sample_names:
-                    if parent_process.type.name == stop_process:
-                        try:
-                            artifact.udf['Concentration (nM)'] = parent_process.udf['Final Concentration (nM)']
-                            artifact.put()
-                            logging.info('Sample {0}: Copied "Final Concentration (nM)" from process "{1}" to output artifact udf "Concentration (nM)"'.format(sample, stop_process))
-                        except:
-                            self.failded_udfs = 'Failed to copy some udfs.'
-                        return True
-                    else:
-                        parent_process = parent_input.parent_process
-                    break
+        for parent_process, parent_input in self.histories[artifact]:
+            if self.process_types[parent_process.id] == stop_process:
+                try:
+                    artifact.udf['Concentration (nM)'] = parent_process.udf['Final Concentration (nM)']
+                    artifact.put()
+                    logging.info('Sample {0}: Copied "Final Concentration (nM)" from process "{1}" to output artifact udf "Concentration (nM)"'.format(sample, stop_process))
+                except:
+                    self.failded_udfs = 'Failed to copy some udfs.'
+                return True
         return False
 
 
@@ -83,6 +85,7 @@ def main(lims, args):
     process = Process(lims, id = args.pid)
     CUDF = CopyUDF(process, args.udfs, args.qcstep)
     CUDF.get_artifacts()
+    CUDF.get_history()
     for art in CUDF.artifacts:
         if args.priostep:
             if not CUDF.get_udfs_from_highpriostep(art, args.priostep):
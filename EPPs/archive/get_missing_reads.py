@@ -9,6 +9,7 @@ from genologics.entities import Process
 from genologics.epp import EppLogger
 from clinical_EPPs.config import CG_URL
 from clinical_EPPs.cg_face import CgFace
+from clinical_EPPs.parallel import pmap, MapError
 import logging
 import sys
 
@@ -33,50 +34,57 @@ class MissingReads():
 
 
     def get_missing_reads(self):
-        for art in self.artifacts:
-            samples = art.samples
-            udfs_ok = True
-            try:
-                reads_total = samples[0].udf['Total Reads (M)']
-                app_tag = samples[0].udf['Sequencing Analysis']
-                data_analysis = samples[0].udf.get('Data Analysis')
-            except:
-                udfs_ok = False
-            if udfs_ok:
-                try:
-                    target_amount_reads = self.cgface_obj.apptag(tag_name = app_tag, key = 'target_reads')
-                except:
-                    sys.exit("Could not find application tag: "+app_tag+' in database.')
-                # Converting from reads to milion reads, as all ather vareables are in milions.
-                target_amount = target_amount_reads/1000000                  
-                if app_tag[0:3]=='WGS' or app_tag[0:3]=='WGT':
-                    if data_analysis=='MIP':
-                        # minimum reads is 92% of target reads for MIP samples
-                        reads_min = 0.92*target_amount
-                    else:
-                        # minimum reads is 100% of target reads for other WGS and WGT samples
-                        reads_min = target_amount
-                else:
-                    # minimum reads is 75% of target reads for all other samples
-                    reads_min = 0.75*target_amount
-                reads_missing = reads_min - reads_total
-                if reads_missing > 0:
-                    for sample in samples:
-                        sample.udf['Reads missing (M)'] = target_amount - reads_total
-                        sample.put()
-                    art.udf['Rerun'] = True
-                    art.qc_flag = 'FAILED'
-                else:
-                    for sample in samples:
-                        sample.udf['Reads missing (M)'] = 0
-                        sample.put()
-                    art.udf['Rerun'] = False
-                    art.qc_flag = 'PASSED'
-                art.put()
+        try:
+            udfs_ok = pmap(self._set_missing_reads, self.artifacts)
+        except MapError as e:
+            sys.exit(str(e))
+        for art, ok in zip(self.artifacts, udfs_ok):
+            if ok:
                 self.passed_arts.append(art)
             else:
                 self.failed_arts.append(art)
 
+    def _set_missing_reads(self, art):
+        """Set Reads missing (M) on the samples of art, and Rerun and the QC flag
+        on art. Return False if the sample udfs needed are missing."""
+        samples = art.samples
+        try:
+            reads_total = samples[0].udf['Total Reads (M)']
+            app_tag = samples[0].udf['Sequencing Analysis']
+            data_analysis = samples[0].udf.get('Data Analysis')
+        except:
+            return False
+        try:
+            target_amount_reads = self.cgface_obj.apptag(tag_name = app_tag, key = 'target_reads')
+        except:
+            raise ValueError("Could not find application tag: "+app_tag+' in database.')
+        # Converting from reads to milion reads, as all ather vareables are in milions.
+        target_amount = target_amount_reads/1000000                  
+        if app_tag[0:3]=='WGS' or app_tag[0:3]=='WGT':
+            if data_analysis=='MIP':
+                # minimum reads is 92% of target reads for MIP samples
+                reads_min = 0.92*target_amount
+            else:
+                # minimum reads is 100% of target reads for other WGS and WGT samples
+                reads_min = target_amount
+        else:
+            # minimum reads is 75% of target reads for all other samples
+            reads_min = 0.75*target_amount
+        reads_missing = reads_min - reads_total
+        if reads_missing > 0:
+            for sample in samples:
+                sample.udf['Reads missing (M)'] = target_amount - reads_total
+                sample.put()
+            art.udf['Rerun'] = True
+            art.qc_flag = 'FAILED'
+        else:
+            for sample in samples:
+                sample.udf['Reads missing (M)'] = 0
+                sample.put()
+            art.udf['Rerun'] = False
+            art.qc_flag = 'PASSED'
+        art.put()
+        return True
 
 
 def main(lims, args):
@@ -29,6 +29,12 @@ class glsapiutil2:
         self.version = "v2"
         self.uri = ""
         self.base_uri = ""
+        self.session = None
+
+    def setSession( self, session ):
+        ## share the pooled keep-alive session of a clinical_EPPs.lims_client.PooledLims
+        if DEBUG > 0: print( "%s:%s called" % ( self.__module__, sys._getframe().f_code.co_name ) )
+        self.session = session
 
     def setHostname( self, hostname ):
         if DEBUG > 0: print( "%s:%s called" % ( self.__module__, sys._getframe().f_code.co_name ) )
@@ -74,6 +80,9 @@ class glsapiutil2:
         responseText = ""
         thisXML = ""
 
+        if self.session is not None:
+            return self.__sessionRequest( 'GET', url )
+
         try:
             thisXML = urllib2.urlopen( url ).read()
         except urllib2.HTTPError, e:
@@ -98,6 +107,9 @@ class glsapiutil2:
 
         if DEBUG > 0: print( "%s:%s called" % ( self.__module__, sys._getframe().f_code.co_name ) )
 
+        if self.session is not None:
+            return self.__sessionRequest( 'PUT', url, xmlObject )
+
         opener = urllib2.build_opener(self.auth_handler)
 
         req = urllib2.Request(url)
@@ -121,6 +133,9 @@ class glsapiutil2:
 
         if DEBUG > 0: print( "%s:%s called" % ( self.__module__, sys._getframe().f_code.co_name ) )
 
+        if self.session is not None:
+            return self.__sessionRequest( 'POST', url, xmlObject )
+
         opener = urllib2.build_opener(self.auth_handler)
 
         req = urllib2.Request(url)
@@ -140,6 +155,24 @@ class glsapiutil2:
 
         return responseText
 
+    def __sessionRequest( self, method, url, xmlObject=None ):
+
+        ## same return values as the urllib2 versions: the body, or an error text
+        headers = { 'Accept': 'application/xml', 'Content-Type': 'application/xml' }
+        try:
+            response = self.session.request( method, url, data=xmlObject, headers=headers )
+        except Exception, e:
+            print( "Error trying to access " + url )
+            print( str( e ) )
+            return ""
+
+        if method == 'GET' and response.status_code != 200:
+            print( "Error trying to access " + url )
+            print( response.reason )
+            return ""
+
+        return response.content
+
     ## API Helper methods
 
     @staticmethod
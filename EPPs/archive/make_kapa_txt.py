@@ -5,6 +5,7 @@ from genologics.lims import Lims
 from genologics.config import BASEURI,USERNAME,PASSWORD
 
 from genologics.entities import Process
+from clinical_EPPs.parallel import pmap, MapError
 
 import csv
 import sys
@@ -44,8 +45,17 @@ class ToCSV():
         hamilton_csv = open( hamilton_file , 'w')
         wr = csv.writer(hamilton_csv)
         wr.writerow(['LIMS ID', 'Sample Well', 'Ligation Master Mix', 'Index Well', 'PCR Plate'])
-        for art in self.artifacts:
-            sample = art.samples[0].id  
+        sample_ids = [art.samples[0].id for art in self.artifacts]
+        try:
+            amounts = pmap(self.get_amount, sample_ids)
+            missing = []
+        except MapError as e:
+            amounts = e.results
+            missing = e.failed
+        for art, sample, amount in zip(self.artifacts, sample_ids, amounts):
+            if sample in missing:
+                self.failed_samples.append(sample)
+                continue
             if art.reagent_labels:
                 reagent_label = art.reagent_labels[0]
                 index_well_col = str(int(reagent_label.split(' ')[0][1:3]))
@@ -54,7 +64,6 @@ class ToCSV():
             else:
                 index_well = '-'
             well = art.location[1].replace(':','')
-            amount = self.get_amount(sample)
             if amount<=10:
                 amount=10
             mix_plate = self.translate_amount.get(amount)
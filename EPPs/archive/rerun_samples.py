@@ -7,6 +7,8 @@ from genologics.entities import Process , Workflow
 from xml.dom.minidom import parseString
 import sys
 from EPPs.archive import glsapiutil
+from clinical_EPPs.batch import get_batch
+from clinical_EPPs.parallel import pmap, MapError
 import platform
 
 HOSTNAME = platform.node()
@@ -58,10 +60,15 @@ class PassSamples():
     def _get_rerun_arts(self, art):
         """For each sample/pool to rerun, find in history the artifact to rerun"""
         all_arts_in_sort=[]
-        for sample in art.samples:
-            sample_id = sample.id
-            out_arts = lims.get_artifacts(samplelimsid = sample_id,
-                            process_type = self.rerun_steps)
+        try:
+            sample_arts = pmap(lambda sample: lims.get_artifacts(samplelimsid = sample.id,
+                                        process_type = self.rerun_steps), art.samples)
+            get_batch(lims, [out_art for out_arts in sample_arts for out_art in out_arts])
+            pmap(lambda process: process.get(),
+                 set(out_art.parent_process for out_arts in sample_arts for out_art in out_arts))
+        except MapError as e:
+            sys.exit('Could not get the history of ' + art.id + '. ' + str(e))
+        for out_arts in sample_arts:
             all_arts_in_sort += out_arts
         correct_process=None
         for art in all_arts_in_sort:
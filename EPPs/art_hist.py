@@ -1,63 +1,47 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD,VERSION
+from clinical_EPPs.lims_client import get_lims
+from clinical_EPPs.epp_run import add_run_options, run
+from clinical_EPPs.lineage import LineageIndex
+from clinical_EPPs.batch import prefetch_process, prefetch_artifacts
+from genologics.config import BASEURI,USERNAME,PASSWORD
 from genologics.entities import Process, Artifact
 import sys
 
 DESC="""script to make hist_dict...."""
 BASEURI='http://localhost:9080'
 
-lims = Lims(BASEURI, USERNAME, PASSWORD, VERSION)
-lims.check_version()
+lims = get_lims(BASEURI, USERNAME, PASSWORD)
 
-def make_hist_dict_no_stop(process_id):
-    """ arg stop_processes: list of process type names - eg: 
-        ['CG002 - Aliquot Samples for Library Pooling', 'CG002 - Sort HiSeq X Samples (HiSeq X)']
-
-        For each output artifact (assumed not to be pooles) of the current process:
-        walk throuh its history untill a stop_process is encountered. 
-        Get its corresponding input artifact to the stop_process.
+def make_hist_dict_no_stop(process_id, lineage=None):
+    """ For each output artifact (assumed not to be pooles) of the current process:
+        walk throuh its history to the first process of its sample.
+        Get its corresponding input artifact to the first process.
         Add to the hist_dict
             key:    output artifact of current process
-            value:  input artifact of the stop process"""
-    current_process = Process(lims, id = process_id)
+            value:  input artifact of the first process
+
+        arg lineage: a LineageIndex to share between calls"""
+    lineage = lineage or LineageIndex(lims)
+    current_process = Process(lineage.lims, id = process_id)
+    prefetch_process(current_process, samples=False, containers=False)
     out_arts = [a for a in current_process.all_outputs() if a.type=='Analyte']
     if not out_arts:
         out_arts = [a for a in current_process.all_inputs() if a.type=='Analyte']
 
     hist_dict = {}
-    for out_art in out_arts:
-        sample = out_art.samples[0].name
-        parent_process = out_art.parent_process
-        first_process = parent_process
-        while parent_process:
-            #We folow the sample history until it's parent process is the one we look for
-            parent_inputs = [a for a in parent_process.all_inputs() if a.type=='Analyte']
-            for parent_input in parent_inputs:
-                sample_names = [s.name  for s in parent_input.samples]
-                if sample in sample_names:
-                    parent_process = parent_input.parent_process
-                    if parent_process:
-                        first_process = parent_process
-                    break
-        # Appends the in_art to the stop_process, that corresponds to the out_art of 
-        # the current_process. Assumes a 1-1 relation.
+    first_processes = lineage.walk(out_arts, analytes_only=True)
+    for out_art, first_process in first_processes.items():
         if not first_process:
             first_process = current_process
-        parent_inputs = [a for a in first_process.all_inputs() if a.type=='Analyte']
-        for parent_input in parent_inputs:
-            sample_names = [s.name  for s in parent_input.samples]
-            if sample in sample_names:
-                hist_dict[out_art] = parent_input
-                break
-                #   assumes only one in_art analyte per out_art analyte, to the stop_ptocess
-
-
+        # Assumes only one in_art analyte per out_art analyte, to the first process
+        parent_input = lineage.input_for(first_process, out_art.samples[0].id, analytes_only=True)
+        if parent_input:
+            hist_dict[out_art] = parent_input
     return hist_dict
 
 
-def make_hist_dict(process_id, stop_processes):
+def make_hist_dict(process_id, stop_processes, lineage=None):
     """ arg stop_processes: list of process type names - eg: 
         ['CG002 - Aliquot Samples for Library Pooling', 'CG002 - Sort HiSeq X Samples (HiSeq X)']
 
@@ -66,63 +50,77 @@ def make_hist_dict(process_id, stop_processes):
         Get its corresponding input artifact to the stop_process.
         Add to the hist_dict
             key:    output artifact of current process
-            value:  input artifact of the stop process"""
-    current_process = Process(lims, id = process_id)
+            value:  input artifact of the stop process
+
+        arg lineage: a LineageIndex to share between calls"""
+    lineage = lineage or LineageIndex(lims)
+    current_process = Process(lineage.lims, id = process_id)
+    prefetch_process(current_process, inputs=False, samples=False, containers=False)
     out_arts = [a for a in current_process.all_outputs() if a.type=='Analyte']
     hist_dict = {}
-    for out_art in out_arts:
-        sample = out_art.samples[0].name
-        parent_process = out_art.parent_process
-        while parent_process and parent_process.type.name not in stop_processes: 
-            #We folow the sample history until it's parent process is the one we look for
-            parent_inputs = parent_process.all_inputs()
-            for parent_input in parent_inputs:
-                sample_names = [s.name  for s in parent_input.samples]
-                if sample in sample_names:
-                    parent_process = parent_input.parent_process
-                    break
-        if not parent_process:
+    stop_process_dict = lineage.walk(out_arts, stop_processes)
+    for out_art, stop_process in stop_process_dict.items():
+        sample = out_art.samples[0]
+        if not stop_process:
             # This will hapen if the sample did never pass throuh any of the stop_processes
-            sys.exit('Sample ' + sample + ' did never pass through processes: '+ ', '.join(stop_processes))
-        else:
-            # Appends the in_art to the stop_process, that corresponds to the out_art of 
-            # the current_process. Assumes a 1-1 relation.
-            parent_inputs = parent_process.all_inputs()
-            for parent_input in parent_inputs:
-                sample_names = [s.name  for s in parent_input.samples]
-                if sample in sample_names:
-                    hist_dict[out_art] = parent_input
-                    break
-                    #   assumes only one in_art analyte per out_art analyte, to the stop_ptocess
-
-
+            sys.exit('Sample ' + sample.name + ' did never pass through processes: '+ ', '.join(stop_processes))
+        # Assumes only one in_art analyte per out_art analyte, to the stop_process
+        parent_input = lineage.input_for(stop_process, sample.id)
+        if parent_input:
+            hist_dict[out_art] = parent_input
     return hist_dict
 
 
-def procHistory(proc, samplename):
-    """Quick wat to get the ids of parent processes from the given process, 
-    while staying in a sample scope"""
-    hist=[]
-    artifacts = lims.get_artifacts(sample_name = samplename, type = 'Analyte')
-    not_done=True
-    starting_art=proc.input_per_sample(samplename)[0].id
-    while not_done:
-        not_done=False
-        for o in artifacts:
-            if o.id == starting_art:
-                if o.parent_process is None:
-                    #flow control : if there is no parent process, we can stop iterating, we're done.
-                    not_done=False
-                    break #breaks the for artifacts, we are done anyway.
-                else:
-                    not_done=True #keep the loop running
-                hist.append(o.parent_process)
-                for i in o.parent_process.all_inputs():
-                    if i in artifacts:
-                        # while increment
-                        starting_art=i.id
-                        break #break the for allinputs, if we found the right one
-                break # breaks the for artifacts if we matched the current one
+def procHistory(proc, samplenames, lineage=None):
+    """Quick way to get the parent processes from the given process,
+    while staying in a sample scope.
+
+    arg samplenames: a sample name, or a list of sample names. 
+    Returns the list of parent processes, or for a list of sample names 
+    a dict sample name -> list of parent processes.
+
+    The analytes of all samples are fetched with one query and hydrated with
+    batch calls, and kept by id. Each parent process is read once, from the 
+    process cache if completed, and shared between the samples."""
+    lineage = lineage or LineageIndex(proc.lims)
+    names = [samplenames] if isinstance(samplenames, basestring) else list(samplenames)
+    artifacts = lineage.lims.get_artifacts(sample_name = names, type = 'Analyte')
+    prefetch_artifacts(lineage.lims, artifacts, containers=False)
+    artifact_dict = dict((art.id, art) for art in artifacts)
+    sample_art_ids = dict((name, set()) for name in names)
+    sample_ids = dict((name, []) for name in names)
+    for art in artifacts:
+        for sample in art.samples:
+            if sample.name in sample_art_ids:
+                sample_art_ids[sample.name].add(art.id)
+                if sample.id not in sample_ids[sample.name]:
+                    sample_ids[sample.name].append(sample.id)
+
+    hist = dict((name, []) for name in names)
+    walks = []
+    for name in names:
+        # The process records have sample ids, the names are resolved here
+        for sample_id in sample_ids[name]:
+            starting_art = lineage.input_for(proc, sample_id)
+            if starting_art:
+                walks.append((name, starting_art.id))
+                break
+    while walks:
+        #flow control : if there is no parent process, we're done with that sample.
+        walks = [(name, art_id) for name, art_id in walks 
+                 if art_id in artifact_dict and artifact_dict[art_id].parent_process]
+        lineage.load([artifact_dict[art_id].parent_process for name, art_id in walks])
+        next_walks = []
+        for name, art_id in walks:
+            parent_process = artifact_dict[art_id].parent_process
+            hist[name].append(parent_process)
+            for parent_input in lineage.inputs(parent_process):
+                if parent_input['id'] in sample_art_ids[name]:
+                    next_walks.append((name, parent_input['id']))
+                    break #the first input of the sample
+        walks = next_walks
+    if isinstance(samplenames, basestring):
+        return hist[samplenames]
     return hist
 
 def main(lims, args):
@@ -135,8 +133,9 @@ if __name__ == "__main__":
                        help='Lims id for current Process')
     parser.add_argument('--proc', default=None, nargs='*',
                        help=('File name for qPCR result file.'))
+    add_run_options(parser)
 
     args = parser.parse_args()
-    main(lims, args)
+    run(main, args, lims=lims)
 
 
@@ -4,9 +4,8 @@ import os
 import glob
 
 from argparse import ArgumentParser
-from genologics.lims import Lims
+from clinical_EPPs.epp_run import add_run_options, run
 from genologics.entities import Process
-from genologics.config import BASEURI, USERNAME, PASSWORD
 
 DESC = """EPP for attaching RunInfo.xml and RunParameters.xml from NovaSeq run dir, and copying run parameters from the previous step"""
 
@@ -47,8 +46,7 @@ if __name__ == "__main__":
     parser = ArgumentParser(description=DESC)
     parser.add_argument('--pid',
                         help='Lims id for current Process')
+    add_run_options(parser)
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
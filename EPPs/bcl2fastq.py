@@ -2,135 +2,28 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 from clinical_EPPs.config import SQLALCHEMY_DATABASE_URI
+from clinical_EPPs.cgstats import get_engine, get_demux_data
+from clinical_EPPs.demux_stats import get_demux_stats
+from clinical_EPPs.batch import WriteBuffer, prefetch_process
 
 from genologics.entities import Process
 from genologics.epp import EppLogger
 
 import sys
+import time
 
-from BeautifulSoup import BeautifulSoup, Comment
 
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import (Column, Integer, String, DateTime, Text, Enum,
-                        ForeignKey, UniqueConstraint, Numeric, Date)
-from sqlalchemy.orm import relationship, backref
+DESC = """epp script to load demultiplexing statistics from the cgstats database,
+or from the bcl2fastq Stats files, to the output artifacts of one or many 
+sequencing processes.
 
-import os
-
-
-DESC = """
+Many processes can be given, eg. to catch up after a cgstats outage, either
+by process id or by flowcell name with the type of the sequencing process.
+The demultiplexing statistics of all flowcells are fetched with one query.
 """
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = SQLALCHEMY_DATABASE_URI 
-db = SQLAlchemy(app)
-
-
-##--------------------------------------------------------------------------------
-##----------------------------------MODELS----------------------------------------
-##--------------------------------------------------------------------------------
-
-
-
-class Project(db.Model):
-    __tablename__ = 'project'
-    project_id = Column(Integer, primary_key=True)
-    projectname = Column(String(255), nullable=False)
-    time = Column(DateTime, nullable=False)
-    def __repr__(self):
-        return (u"{self.__class__.__name__}: {self.project_id}"
-                .format(self=self))
-
-class Sample(db.Model):
-    __tablename__ = 'sample'
-    sample_id = Column(Integer, primary_key=True)
-    project_id = Column(Integer, ForeignKey('project.project_id'),
-                        nullable=False)
-    samplename = Column(String(255), nullable=False)
-    barcode = Column(String(255), nullable=True)
-    time = Column(db.DateTime, nullable=True)
-    project = relationship('Project', backref=backref('samples'))
-
-
-class Demux(db.Model):
-    __tablename__ = 'demux'
-    demux_id = Column(Integer, primary_key=True)
-    flowcell_id = Column(Integer, ForeignKey('flowcell.flowcell_id'),
-                         nullable=False)
-    datasource_id = Column(Integer, ForeignKey('datasource.datasource_id'),
-                           nullable=False)
-    basemask = Column(String(255), nullable=True)
-    time = Column(DateTime, nullable=True)
-    UniqueConstraint('flowcell', 'basemask', name='demux_ibuk_1')
-    datasource = relationship('Datasource', backref=backref('demuxes'))
-    flowcell = relationship('Flowcell', backref=backref('demuxes'))
-
-
-class Datasource(db.Model):
-    __tablename__ = 'datasource'
-    datasource_id = Column(Integer, primary_key=True)
-    supportparams_id = Column(Integer,
-                              ForeignKey('supportparams.supportparams_id'),
-                              nullable=False)
-    runname = Column(String(255), nullable=True)
-    machine = Column(String(255), nullable=True)
-    rundate = Column(DateTime, nullable=True)
-    document_path = Column(String(255), nullable=False)
-    document_type = Column(Enum('html', 'xml', 'undefined'), nullable=False,
-                           default='html')
-    server = Column(String(255), nullable=True)
-    time = Column(DateTime, nullable=True)
-    supportparams = relationship('Supportparams',
-                                 backref=backref('datasources'))
-
-class Supportparams(db.Model):
-    __tablename__ = 'supportparams'
-    supportparams_id = Column(Integer, primary_key=True)
-    document_path = Column(String(255), nullable=False)
-    systempid = Column(String(255), nullable=True)
-    systemos = Column(String(255), nullable=True)
-    systemperlv = Column(String(255), nullable=True)
-    systemperlexe = Column(String(255), nullable=True)
-    idstring = Column(String(255), nullable=True)
-    program = Column(String(255), nullable=True)
-    commandline = Column(Text)
-    sampleconfig_path = Column(String(255), nullable=True)
-    sampleconfig = Column(Text)
-    time = Column(DateTime, nullable=True)
-
-
-class Flowcell(db.Model):
-    __tablename__ = 'flowcell'
-    flowcell_id = Column(Integer, primary_key=True)
-    flowcellname = Column(String(255), nullable=False)
-    flowcell_pos = Column(Enum('A', 'B'), nullable=False)
-    time = Column(DateTime)
-    UniqueConstraint('flowcellname', name='flowcellname')
-    datasource = relationship('Demux', backref=backref('flowcells'))
-
-class Unaligned(db.Model):
-    __tablename__ = 'unaligned'
-    unaligned_id = Column(Integer, primary_key=True)
-    sample_id = Column(Integer, ForeignKey('sample.sample_id'), nullable=False)
-    demux_id = Column(Integer, ForeignKey('demux.demux_id'), nullable=False)
-    lane = Column(Integer, nullable=True)
-    yield_mb = Column(Integer, nullable=True)
-    passed_filter_pct = Column(Numeric(10, 5), nullable=True)
-    readcounts = Column(Integer, nullable=True)
-    raw_clusters_per_lane_pct = Column(Numeric(10, 5), nullable=True)
-    perfect_indexreads_pct = Column(Numeric(10, 5), nullable=True)
-    q30_bases_pct = Column(Numeric(10, 5), nullable=True)
-    mean_quality_score = Column(Numeric(10, 5), nullable=True)
-    time = Column(DateTime, nullable=True)
-    demux = relationship('Demux', backref=backref('unaligned'))
-    sample = relationship('Sample', backref=backref('unaligned'))
-
-
-
 
 ##--------------------------------------------------------------------------------
 ##--------------------------------LIMS EPP----------------------------------------
@@ -143,10 +36,13 @@ class BCLconv():
         self.updated_arts = 0
         self.q30treshhold = process.udf.get('Threshold for % bases >= Q30')
         self.reads_treshold = 1000
+        prefetch_process(process)
         all_artifacts = self.process.all_outputs(unique=True)
         self.demux_data = []
         self.not_updated_arts = len(filter(lambda a: len(a.samples) == 1 , all_artifacts))
         self.failed_arts = 0
+        self.not_saved_arts = 0
+        self.write_buffer = WriteBuffer(process.lims)
 
     def get_artifacts(self):
         """Prepparing output artifact dict."""
@@ -170,13 +66,6 @@ class BCLconv():
             sys.exit('Could not get FC id from Container name')
 
 
-    def get_demux_data(self):
-        """Geting the demultiplex statistics from the demultiplex database cgstats."""
-        try:
-            self.demux_data = Unaligned.query.join(Demux).join(Flowcell).filter(Flowcell.flowcellname == self.flowcellname).all()
-        except:
-            sys.exit('Error getting data from the demultiplexing database. Maybe the flowcell id is wrong: '+ self.flowcellname)
-
     def get_qc(self, q30, reads):
         if q30 >= self.q30treshhold and reads >= self.reads_treshold:
             return 'PASSED'
@@ -188,46 +77,119 @@ class BCLconv():
         """Setting the demultiplex udfs"""
         for samp in self.demux_data:
             #The sample.samplename in the demux database corresponds to the LIMS <sample.id>_<index>
-            sample_name = samp.sample.samplename.split('_')[0]
+            sample_name = samp.samplename.split('_')[0]
             if sample_name in self.artifacts:
                 art = self.artifacts[sample_name].get(str(samp.lane))
                 art.udf['% Perfect Index Read'] =  float(samp.perfect_indexreads_pct)
                 art.udf['# Reads'] =  samp.readcounts
                 art.udf['% Bases >=Q30'] =  float(samp.q30_bases_pct)
                 art.qc_flag = self.get_qc(float(samp.q30_bases_pct), samp.readcounts)
-                art.put()
+                self.write_buffer.add(art)
                 self.updated_arts += 1
                 self.not_updated_arts -= 1
 
+    def save_artifacts(self):
+        for art in self.write_buffer.flush():
+            if art.qc_flag == 'FAILED':
+                self.failed_arts -= 1
+            self.updated_arts -= 1
+            self.not_saved_arts += 1
+
+
+def load_demux_data(engine, BCLs, stats_dirs=None):
+    """Geting the demultiplex statistics of the flowcells of all BCLconvs
+    with one query to the demultiplex database cgstats, or from the bcl2fastq 
+    Stats files in stats_dirs."""
+
+    flowcellnames = [BCL.flowcellname for BCL in BCLs]
+    try:
+        if stats_dirs:
+            demux_data = []
+            for stats_dir in stats_dirs:
+                demux_data += get_demux_stats(stats_dir)
+        else:
+            demux_data = get_demux_data(engine, flowcellnames)
+    except:
+        sys.exit('Error getting demultiplexing data for flowcells: '+ ', '.join(flowcellnames))
+    for BCL in BCLs:
+        BCL.demux_data = [samp for samp in demux_data if samp.flowcellname == BCL.flowcellname]
 
-def main(lims, args):
-    process = Process(lims, id = args.pid)
-    if not 'Threshold for % bases >= Q30' in process.udf:
-        sys.exit('Threshold for % bases >= Q30 has not ben set.')
-    BCL = BCLconv(process)
-    BCL.get_fc_id()
-    BCL.get_artifacts()
-    BCL.get_demux_data()
-    BCL.set_udfs()
 
+def get_processes(lims, flowcellnames, process_type):
+    """Get the latest process of type process_type run on each flowcell."""
 
-    d = {'ca': BCL.updated_arts, 'wa' : BCL.not_updated_arts}
-    abstract = ("Updated {ca} artifact(s). Skipped {wa} due to missing data in the demultiplex database. ").format(**d)
+    processes = []
+    for flowcellname in flowcellnames:
+        containers = lims.get_containers(name = flowcellname)
+        if not containers:
+            sys.exit('Could not find flowcell: '+ flowcellname)
+        placed_arts = containers[0].get_placements().values()
+        fc_processes = lims.get_processes(type = process_type, inputartifactlimsid = placed_arts[0].id)
+        if not fc_processes:
+            sys.exit('Could not find a ' + process_type + ' process for flowcell: ' + flowcellname)
+        processes.append(sorted(fc_processes, key = lambda p: p.date_run)[-1])
+    return processes
 
-    if BCL.failed_arts:
-        abstract = abstract + str(BCL.failed_arts) + ' samples failed QC!'
 
-    if BCL.failed_arts or BCL.not_updated_arts:
-        sys.exit(abstract)
+def main(lims, args):
+    processes = [Process(lims, id = pid) for pid in args.pids or []]
+    if args.flowcells:
+        processes += get_processes(lims, args.flowcells, args.process_type)
+    engine = None if args.stats_dirs else get_engine(SQLALCHEMY_DATABASE_URI)
+
+    BCLs = []
+    for process in processes:
+        if not 'Threshold for % bases >= Q30' in process.udf:
+            sys.exit('Threshold for % bases >= Q30 has not ben set on process ' + process.id)
+        start = time.time()
+        BCL = BCLconv(process)
+        BCL.get_fc_id()
+        BCL.get_artifacts()
+        BCL.read_time = time.time() - start
+        BCLs.append(BCL)
+
+    start = time.time()
+    load_demux_data(engine, BCLs, args.stats_dirs)
+    print >> sys.stderr, 'Fetched demultiplex data for %s flowcell(s) in %.2f s' % (len(BCLs), time.time() - start)
+
+    abstracts = []
+    for BCL in BCLs:
+        start = time.time()
+        BCL.set_udfs()
+        BCL.save_artifacts()
+        print >> sys.stderr, ('Flowcell %s (%s): read LIMS in %.2f s, updated %s artifact(s) in %.2f s' 
+                             % (BCL.flowcellname, BCL.process.id, BCL.read_time, BCL.updated_arts, time.time() - start))
+
+        d = {'ca': BCL.updated_arts, 'wa' : BCL.not_updated_arts}
+        abstract = ("Updated {ca} artifact(s). Skipped {wa} due to missing data in the demultiplex database. ").format(**d)
+
+        if BCL.failed_arts:
+            abstract = abstract + str(BCL.failed_arts) + ' samples failed QC! '
+        if BCL.not_saved_arts:
+            abstract = abstract + 'Failed to save ' + str(BCL.not_saved_arts) + ' artifact(s).'
+        if len(BCLs) > 1:
+            abstract = BCL.flowcellname + ': ' + abstract
+        abstracts.append(abstract.strip())
+
+    if any(BCL.failed_arts or BCL.not_updated_arts or BCL.not_saved_arts for BCL in BCLs):
+        sys.exit(' '.join(abstracts))
     else:
-        print >> sys.stderr, abstract
+        print >> sys.stderr, ' '.join(abstracts)
 
 if __name__ == "__main__":
     parser = ArgumentParser(description=DESC)
-    parser.add_argument('-p', dest = 'pid',
-                        help='Lims id for current Process')
+    parser.add_argument('-p', dest = 'pids', nargs='+',
+                        help='Lims id for current Process, or many processes')
+    parser.add_argument('-f', dest = 'flowcells', nargs='+',
+                        help='Flowcell names, to load the data of many flowcells at once')
+    parser.add_argument('-t', dest = 'process_type', 
+                        help='Type of the sequencing processes of the flowcells given with -f')
+    parser.add_argument('-s', dest = 'stats_dirs', nargs='+',
+                        help=('bcl2fastq output directories of the flowcells. Read the demultiplex '
+                              'data from their Stats/Stats.json and ConversionStats.xml instead of cgstats'))
+    add_run_options(parser)
 
     args = parser.parse_args()
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    if args.flowcells and not args.process_type:
+        parser.error('-t is required with -f')
+    run(main, args)
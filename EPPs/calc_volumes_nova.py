@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
+from clinical_EPPs.batch import get_batch, WriteBuffer
 
 import sys
 
@@ -29,6 +29,7 @@ class NovaSeqSampleVolumes():
         self.total_reads = None
         self.artifacts = []
         self.missing_samp_udf = False
+        self.write_buffer = WriteBuffer(process.lims)
         self.run_mode_dict =  {'NovaSeq Standard' : {'S1': 100, 'S2': 150, 'S4': 310, 'SP': 100},
                                 'NovaSeq Xp'      : {'S1': 18 , 'S2': 22 , 'S4': 30, 'SP': 18}}
 
@@ -36,7 +37,9 @@ class NovaSeqSampleVolumes():
         """Get outpout artifacts and count nr samples"""
 
         all_artifacts = self.process.all_outputs(unique=True)
+        get_batch(self.process.lims, all_artifacts)
         self.artifacts = filter(lambda a: a.output_type == "Analyte" , all_artifacts)
+        self.write_buffer.track(self.artifacts)
         self.nr_samples = len(self.artifacts)
 
     def get_process_udfs(self):
@@ -69,7 +72,7 @@ class NovaSeqSampleVolumes():
                 continue
             sample_vol = fraction_of_pool*(((self.final_conc * (5/1000.0) ) / float(art.udf['Concentration (nM)']) ) * self.bulk_pool_vol )
             art.udf['Per Sample Volume (ul)'] = sample_vol
-            art.put()
+            self.write_buffer.add(art)
 
             if not self.min_sample:
                 self.min_sample = art
@@ -88,7 +91,7 @@ class NovaSeqSampleVolumes():
             ratio = 1
         for art in self.artifacts:
             art.udf['Adjusted Per Sample Volume (ul)'] = art.udf.get('Per Sample Volume (ul)',0)*ratio
-            art.put()
+            self.write_buffer.add(art)
         self.adjusted_bulk_pool_vol = self.bulk_pool_vol*ratio
 
     def calculate_RSB_volume(self):
@@ -97,6 +100,12 @@ class NovaSeqSampleVolumes():
         self.total_sample_vol = sum([art.udf['Adjusted Per Sample Volume (ul)'] for art in self.artifacts])
         self.RSB_vol = self.adjusted_bulk_pool_vol - self.total_sample_vol
 
+    def save_artifacts(self):
+        """Save the per sample volumes of all artifacts in batch calls"""
+
+        if self.write_buffer.flush():
+            self.warning.append('Failed to save the per sample volumes for some samples.')
+
     def set_pool_info(self):
         """Set process level UDFs"""
 
@@ -120,6 +129,7 @@ def main(lims, args):
     NSSV.calculate_average_reads_to_sequence()
     NSSV.calculate_per_sample_volume()
     NSSV.calculate_adjusted_per_sample_volume()
+    NSSV.save_artifacts()
     NSSV.calculate_RSB_volume()
     NSSV.set_pool_info()
 
@@ -135,8 +145,7 @@ if __name__ == "__main__":
     parser = ArgumentParser(description=DESC)
     parser.add_argument('-p', dest = 'pid',
                         help='Lims id for current Process')
+    add_run_options(parser)
     args = parser.parse_args()
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
 
@@ -8,9 +8,9 @@ Maya Brandi
 Science for Life Laboratory, Stockholm, Sweden
 """ 
 from argparse import ArgumentParser
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 from genologics.entities import Process
+from clinical_EPPs.batch import get_batch, WriteBuffer
 import sys
 
 class CalculationsTwist:
@@ -22,12 +22,15 @@ class CalculationsTwist:
         self.failed = 0
         self.missing_udfs = []
         self.low_conc = 0
+        self.write_buffer = WriteBuffer(process.lims)
 
     def get_artifacts(self, process_type):
         if process_type== 'libval':
             self.artifacts = [io[1]['uri'] for io in self.iom if io[1]['output-generation-type'] == 'PerInput']
+            get_batch(self.process.lims, self.artifacts)
         else:
             all_artifacts = self.process.all_outputs(unique=True)
+            get_batch(self.process.lims, all_artifacts)
             self.artifacts = filter(lambda a: a.output_type == "Analyte" , all_artifacts)
 
     def calculate_volumes_for_aliquot(self):
@@ -49,7 +52,7 @@ class CalculationsTwist:
             art.udf['Amount needed (ng)'] = amount_needed
             art.udf['Sample Volume (ul)'] = amount_needed/float(concentration)
             art.udf['Volume H2O (ul)'] = 30 - art.udf['Sample Volume (ul)']
-            art.put()
+            self.write_buffer.add(art)
             self.okej +=1
             
 
@@ -67,9 +70,14 @@ class CalculationsTwist:
                 art.qc_flag = 'FAILED'
             else:
                 art.qc_flag = 'PASSED'
-            art.put()
+            self.write_buffer.add(art)
             self.okej +=1
 
+    def save_artifacts(self):
+        not_saved = len(self.write_buffer.flush())
+        self.okej -= not_saved
+        self.failed += not_saved
+
 def main(lims,args):
     process = Process(lims, id = args.pid)
     AT = CalculationsTwist(process)
@@ -80,6 +88,7 @@ def main(lims,args):
         AT.calculate_volumes_for_aliquot()
     else:
         sys.exit('Non valid argument given. -c can take pooling/libval/aliquot')
+    AT.save_artifacts()
     
     if AT.failed:
         missing = ', '.join( list(set(AT.missing_udfs)))
@@ -95,9 +104,7 @@ if __name__ == "__main__":
     parser.add_argument('-p', dest = 'pid',
                         help='Lims id for current Process')
     parser.add_argument("-c", dest='calculate', help = 'libval/aliquot')
+    add_run_options(parser)
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-
-    main(lims, args)
+    run(main, args)
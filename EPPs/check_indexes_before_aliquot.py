@@ -2,8 +2,10 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
+from clinical_EPPs.reagent_types import ReagentTypeIndex
+from clinical_EPPs.batch import get_batch
+from clinical_EPPs.index_collisions import find_collisions, find_close_pairs
 
 from genologics.entities import Process, ReagentType
 from genologics.epp import EppLogger
@@ -25,21 +27,28 @@ class CheckIndex():
         self.duplicates = []
         self.index_dict = {}
         self.all_indexes = []
+        self.collisions = []
+        self.close_pairs = []
+        self.unresolved = []
         self.logfile = None
+        self.reagent_index = ReagentTypeIndex(process.lims)
 
     def get_artifacts(self):
         all_artifacts = self.process.all_inputs()
+        get_batch(self.process.lims, all_artifacts)
         self.all_artifacts = filter(lambda a: a.output_type == "Analyte" , all_artifacts)
 
     def get_samples(self):
+        sequences = self.reagent_index.sequences([name for art in self.all_artifacts for name in art.reagent_labels])
         for art in self.all_artifacts:
             reagent_label_names = art.reagent_labels
             for name in reagent_label_names:
-                reagent_types = lims.get_reagent_types(name=name)
-                if len(reagent_types)==1: #(Will never be morte than one. names are unique)
-                    sequence = reagent_types[0].sequence
+                sequence = sequences[name]
+                if sequence is None:
+                    self.unresolved.append((art, name))
+                else:
                     sequence_short = sequence.split('-')[0]
-                    self.all_indexes.append(sequence_short)
+                    self.all_indexes.append((sequence_short, art))
                     if sequence_short in self.index_dict.keys():
                         self.index_dict[sequence_short][art] = {'name':name,'sequence':sequence}
                     else:
@@ -47,22 +56,41 @@ class CheckIndex():
 
 
     def check_dupl(self):
-        for i, index1 in enumerate(self.all_indexes):
-            for j, index2 in enumerate(self.all_indexes):
-                if i!=j:
-                    min_lengt = min(len(index1),len(index2))
-                    if index1[:min_lengt]==index2[:min_lengt]:
-                        self.duplicates.append(index1)
-                        self.duplicates.append(index2)
-        self.duplicates=list(set(self.duplicates))
+        self.collisions = find_collisions(self.all_indexes)
+        self.duplicates = [sequence for group in self.collisions for sequence in group]
+
+    def check_distance(self, max_distance):
+        indexes = [(index_info['sequence'], (art, index_info['name']))
+                   for art_dict in self.index_dict.values() for art, index_info in art_dict.items()]
+        self.close_pairs = find_close_pairs(indexes, max_distance)
+        self.duplicates = [sequence for pair in self.close_pairs for sequence in (pair[0], pair[2])]
 
     def make_log(self, log_file):
         self.logfile = open(log_file, 'a')
         self.logfile.write(', '.join(['sample','index name', 'index sequence']))
-        for index in self.duplicates:
-            art_dict = self.index_dict[index]
-            for art, index_info in art_dict.items():
-                self.logfile.write('\n'+', '.join([art.name, index_info['name'], index_info['sequence']]))
+        for group in self.collisions:
+            self.logfile.write('\n')
+            for index in group:
+                art_dict = self.index_dict[index]
+                for art, index_info in art_dict.items():
+                    self.logfile.write('\n'+', '.join([art.name, index_info['name'], index_info['sequence']]))
+        self.logfile.close()
+
+    def make_unresolved_log(self, log_file):
+        self.logfile = open(log_file, 'a')
+        self.logfile.write('No index sequence found for reagent labels\n')
+        self.logfile.write(', '.join(['sample', 'index name']))
+        for art, name in self.unresolved:
+            self.logfile.write('\n' + ', '.join([art.name, name]))
+        self.logfile.write('\n\n')
+        self.logfile.close()
+
+    def make_close_pairs_log(self, log_file):
+        self.logfile = open(log_file, 'a')
+        self.logfile.write(', '.join(['sample','index name', 'index sequence']*2 + ['mismatches']))
+        for sequence1, (art1, name1), sequence2, (art2, name2), distances in self.close_pairs:
+            self.logfile.write('\n'+', '.join([art1.name, name1, sequence1, art2.name, name2, sequence2,
+                                              '-'.join(str(distance) for distance in distances)]))
         self.logfile.close()
 
 def main(lims, args):
@@ -70,12 +98,23 @@ def main(lims, args):
     CI = CheckIndex(process)
     CI.get_artifacts()
     CI.get_samples()
-    CI.check_dupl()
-
-
-    if CI.duplicates:
+    if args.max_distance is None:
+        CI.check_dupl()
+    else:
+        CI.check_distance(args.max_distance)
+
+    warnings = []
+    if CI.unresolved:
+        CI.make_unresolved_log(args.log)
+        warnings.append('No index sequence found for %s reagent label(s), they were not checked' % len(CI.unresolved))
+    if CI.close_pairs:
+        CI.make_close_pairs_log(args.log)
+        warnings.append('Indexes within %s mismatches' % args.max_distance)
+    elif CI.duplicates:
         CI.make_log(args.log)
-        sys.exit('Warning: Duplicated indexes. See log file!')
+        warnings.append('Duplicated indexes')
+    if warnings:
+        sys.exit('Warning: %s. See log file!' % '. '.join(warnings))
     else:
         print >> sys.stderr, 'No duplicate indexes'
 
@@ -86,9 +125,11 @@ if __name__ == "__main__":
                         help='Lims id for current Process')
     parser.add_argument('-l', default = None , dest = 'log',
                         help='Log file')
+    parser.add_argument('-d', default = None , dest = 'max_distance', type=int,
+                        help='Check for indexes within this many mismatches, per index read, '
+                             'instead of only for duplicated index prefixes')
+    add_run_options(parser)
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
 
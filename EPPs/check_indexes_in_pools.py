@@ -2,8 +2,10 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
+from clinical_EPPs.reagent_types import ReagentTypeIndex
+from clinical_EPPs.batch import get_batch
+from clinical_EPPs.index_collisions import find_collisions, find_close_pairs
 
 from genologics.entities import Process, ReagentType
 from genologics.epp import EppLogger
@@ -17,14 +19,19 @@ Written by Maya Brandi, Science for Life Laboratory, Stockholm, Sweden
 """
 
 class Pool():
-    def __init__(self, pool):
+    def __init__(self, pool, reagent_index):
         self.pool = pool
+        self.reagent_index = reagent_index
         self.pooled_arts = [] 
         self.index_dict = {}
         self.duplicates = []
         self.all_indexes = []
+        self.collisions = []
+        self.close_pairs = []
+        self.unresolved = []
 
     def _recursive_find_samples_in_pool(self, artifact_list):
+        get_batch(self.pool.lims, artifact_list)
         for art in artifact_list:
             if len(art.samples)==1:
                 self.pooled_arts.append(art)
@@ -33,34 +40,40 @@ class Pool():
 
     def get_indexes(self):
         self._recursive_find_samples_in_pool(self.pool.input_artifact_list())
+        sequences = self.reagent_index.sequences([name for art in self.pooled_arts for name in art.reagent_labels])
         for art in self.pooled_arts:
             reagent_label_names = art.reagent_labels
             for name in reagent_label_names:
-                reagent_types = lims.get_reagent_types(name=name)
-                sequence = reagent_types[0].sequence #(Will never be morte than one. names are unique)
-                self.all_indexes.append(sequence)
+                sequence = sequences[name]
+                if sequence is None:
+                    self.unresolved.append((art, name))
+                    continue
+                self.all_indexes.append((sequence, art))
                 if sequence in self.index_dict.keys():
                     self.index_dict[sequence][art] = {'name':name,'sequence':sequence}
                 else:
                     self.index_dict[sequence] = {art : {'name':name,'sequence':sequence}}
 
     def check_dupl(self):
-        for i, index1 in enumerate(self.all_indexes):
-            for j, index2 in enumerate(self.all_indexes):
-                if i!=j:
-                    min_lengt = min(len(index1),len(index2))
-                    if index1[:min_lengt]==index2[:min_lengt]:
-                        self.duplicates.append(index1)
-                        self.duplicates.append(index2)
-        self.duplicates=list(set(self.duplicates))
+        self.collisions = find_collisions(self.all_indexes)
+        self.duplicates = [sequence for group in self.collisions for sequence in group]
+
+    def check_distance(self, max_distance):
+        indexes = [(index_info['sequence'], (art, index_info['name']))
+                   for art_dict in self.index_dict.values() for art, index_info in art_dict.items()]
+        self.close_pairs = find_close_pairs(indexes, max_distance)
+        self.duplicates = [sequence for pair in self.close_pairs for sequence in (pair[0], pair[2])]
 
 class CheckIndex():
 
-    def __init__(self, process, log_file):
+    def __init__(self, process, log_file, max_distance=None):
         self.logfile = open(log_file, 'a')
         self.process = process
+        self.max_distance = max_distance
+        self.reagent_index = ReagentTypeIndex(process.lims)
         self.pools = []
         self.duplicates = False
+        self.unresolved = 0
 
     def get_artifacts(self):
         all_artifacts = self.process.all_outputs()
@@ -68,33 +81,64 @@ class CheckIndex():
 
     def check_each_pool(self):
         for pool in self.pools:
-            P = Pool(pool)
+            P = Pool(pool, self.reagent_index)
             P.get_indexes()
-            P.check_dupl()
-            if P.duplicates:
-                self.add_to_log(P)
+            if P.unresolved:
+                self.add_unresolved_to_log(P)
+            if self.max_distance is None:
+                P.check_dupl()
+                if P.duplicates:
+                    self.add_to_log(P)
+            else:
+                P.check_distance(self.max_distance)
+                if P.close_pairs:
+                    self.add_close_pairs_to_log(P)
 
     def add_to_log(self, P):
         self.logfile.write('\n\nDuplicates in Pool: '+ P.pool.name +'\n')
         self.logfile.write(', '.join(['sample','index name', 'index sequence']))
-        for index in P.duplicates:
+        for group in P.collisions:
             self.duplicates = True
-            art_dict = P.index_dict[index]
-            for art, index_info in art_dict.items():
-                self.logfile.write('\n'+', '.join([art.name, index_info['name'], index_info['sequence']]))
+            self.logfile.write('\n')
+            for index in group:
+                art_dict = P.index_dict[index]
+                for art, index_info in art_dict.items():
+                    self.logfile.write('\n'+', '.join([art.name, index_info['name'], index_info['sequence']]))
+
+    def add_unresolved_to_log(self, P):
+        self.unresolved += len(P.unresolved)
+        self.logfile.write('\n\nNo index sequence found for reagent labels in Pool: ' + P.pool.name + '\n')
+        self.logfile.write(', '.join(['sample', 'index name']))
+        for art, name in P.unresolved:
+            self.logfile.write('\n' + ', '.join([art.name, name]))
+
+    def add_close_pairs_to_log(self, P):
+        self.duplicates = True
+        self.logfile.write('\n\nIndexes within %s mismatches in Pool: ' % self.max_distance + P.pool.name +'\n')
+        self.logfile.write(', '.join(['sample','index name', 'index sequence']*2 + ['mismatches']))
+        for sequence1, (art1, name1), sequence2, (art2, name2), distances in P.close_pairs:
+            self.logfile.write('\n'+', '.join([art1.name, name1, sequence1, art2.name, name2, sequence2,
+                                              '-'.join(str(distance) for distance in distances)]))
 
     def close_log(self):
         self.logfile.close()
 
 def main(lims, args):
     process = Process(lims, id = args.pid)
-    CI = CheckIndex(process, args.log)
+    CI = CheckIndex(process, args.log, args.max_distance)
     CI.get_artifacts()
     CI.check_each_pool()
     CI.close_log()
 
-    if CI.duplicates:
-        sys.exit('Warning: Duplicated indexes. See log file!')
+    warnings = []
+    if CI.unresolved:
+        warnings.append('No index sequence found for %s reagent label(s), they were not checked' % CI.unresolved)
+    if CI.duplicates and args.max_distance is not None:
+        warnings.append('Indexes within %s mismatches' % args.max_distance)
+    elif CI.duplicates:
+        warnings.append('Duplicated indexes')
+    if warnings:
+        sys.exit('Warning: %s. See log file!' % '. '.join(warnings))
     else:
         print >> sys.stderr, 'No duplicate indexes'
 
@@ -105,9 +149,11 @@ if __name__ == "__main__":
                         help='Lims id for current Process')
     parser.add_argument('-l', default = None , dest = 'log',
                         help='Log file')
+    parser.add_argument('-d', default = None , dest = 'max_distance', type=int,
+                        help='Check for indexes within this many mismatches, per index read, '
+                             'instead of only for duplicated index prefixes')
+    add_run_options(parser)
 
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
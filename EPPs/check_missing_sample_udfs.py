@@ -1,8 +1,7 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 import sys
@@ -29,7 +28,7 @@ def main(lims, args):
 if __name__ == "__main__":
     parser = ArgumentParser(description=DESC)
     parser.add_argument('-p', help='Lims id for current Process')
+    add_run_options(parser)
 
     args = parser.parse_args()
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    main(lims, args)
+    run(main, args, check_version=False)
@@ -1,8 +1,7 @@
 #!/usr/bin/env python
 from __future__ import division
 from argparse import ArgumentParser
-from genologics.lims import Lims
-from genologics.config import BASEURI, USERNAME, PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 import sys
@@ -91,8 +90,7 @@ if __name__ == "__main__":
                         help='Standard step')
     parser.add_argument('-x', dest='xp',
                         help='XP step')
+    add_run_options(parser)
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
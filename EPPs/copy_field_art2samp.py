@@ -2,11 +2,11 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 from genologics.epp import EppLogger
+from clinical_EPPs.batch import prefetch_process, WriteBuffer
 
 import sys
 
@@ -17,6 +17,8 @@ DESC = """
 
 class CopyUDF():
     def __init__(self, process, sample_udf, art_udf):
+        prefetch_process(process, inputs=False, containers=False)
+        self.write_buffer = WriteBuffer(process.lims)
         self.artifacts = [a for a in process.all_outputs() if a.type=='Analyte']
         self.sample_udf = sample_udf
         self.art_udf = art_udf
@@ -28,9 +30,10 @@ class CopyUDF():
             udf = art.udf.get(self.art_udf)
             if udf is not None:
                 sample.udf[self.sample_udf] = udf
-                sample.put()
+                self.write_buffer.add(sample)
             else:
                 self.failed_udfs += 1
+        self.failed_udfs += len(self.write_buffer.flush())
 
 def main(lims, args):
     process = Process(lims, id = args.pid)
@@ -50,6 +53,6 @@ if __name__ == "__main__":
     parser.add_argument('-s', dest = 'sample_udf', help=(''))
     parser.add_argument('-a', dest = 'art_udf',
                         help=(''))
+    add_run_options(parser)
     args = parser.parse_args()
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    main(lims, args)
+    run(main, args, check_version=False)
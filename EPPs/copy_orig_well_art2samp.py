@@ -2,11 +2,11 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 from genologics.epp import EppLogger
+from clinical_EPPs.batch import prefetch_process, WriteBuffer
 import logging
 import sys
 
@@ -20,7 +20,9 @@ class CopyUDFS():
 
     def __init__(self, process):
         self.process = process
+        prefetch_process(process, outputs=False)
         self.artifacts = process.all_inputs(unique=True)
+        self.write_buffer = WriteBuffer(process.lims)
         self.passed_arts = 0
         self.failed_arts = 0
 
@@ -34,10 +36,13 @@ class CopyUDFS():
             try:
                 sample.udf['Original Well'] = art.location[1]
                 sample.udf['Original Container'] = art.location[0].name
-                sample.put()
+                self.write_buffer.add(sample)
                 self.passed_arts +=1
             except:
                 self.failed_arts +=1
+        not_saved = len(self.write_buffer.flush())
+        self.passed_arts -= not_saved
+        self.failed_arts += not_saved
 
 def main(lims, args):
     process = Process(lims, id = args.pid)
@@ -60,7 +65,6 @@ if __name__ == "__main__":
     parser = ArgumentParser(description=DESC)
     parser.add_argument('--pid',
                         help='Lims id for current Process')
+    add_run_options(parser)
     args = parser.parse_args()
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
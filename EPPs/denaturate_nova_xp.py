@@ -2,10 +2,10 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
+from clinical_EPPs.batch import prefetch_process, WriteBuffer
 
 import sys
 
@@ -25,6 +25,8 @@ class DenaturateXP():
     def __init__(self, process):
         self.process = process
         self.artifacts = []
+        self.failed_arts = 0
+        self.write_buffer = WriteBuffer(process.lims)
         self.process_settings = {'S1': {'DPX1 Volume (ul)': 126,
                                         'DPX2 Volume (ul)': 18,
                                         'DPX3 Volume (ul)': 66},
@@ -69,9 +71,10 @@ class DenaturateXP():
     def get_artifacts(self):
         """Get output artifacts"""
 
+        prefetch_process(self.process, samples=False, containers=False)
         all_artifacts = self.process.all_outputs(unique=True)
         self.artifacts = filter(lambda a: a.output_type == "Analyte" , all_artifacts)
- 
+        self.write_buffer.track(self.artifacts + [self.process])
 
     def set_udfs(self):
         """Set pprocess level udfs and artifact level udfs based on Flowcell Type.
@@ -82,12 +85,13 @@ class DenaturateXP():
 
         for key, val in self.process_settings[flowcell_type].items():
             self.process.udf[key] = val
-        self.process.put()
+        self.write_buffer.add(self.process)
 
         for art in self.artifacts:
             for key, val in self.artifact_settings[flowcell_type].items():
                 art.udf[key] = val
-                art.put()
+            self.write_buffer.add(art)
+        self.failed_arts = len(self.write_buffer.flush())
 
 
 def main(lims, args):
@@ -96,13 +100,15 @@ def main(lims, args):
     DXP.get_artifacts()
     DXP.set_udfs()
 
+    if DXP.failed_arts:
+        sys.exit('Failed to set udfs on %s artifact(s).' % (str(DXP.failed_arts)))
+
 
 if __name__ == "__main__":
     parser = ArgumentParser(description=DESC)
     parser.add_argument('--pid',
                         help='Lims id for current Process')
+    add_run_options(parser)
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+DESC = """Client of the EPP worker daemon (epp_worker.py). Runs an EPP script in
+the worker, with the arguments given after the script name:
+
+    epp_client.py bcl2fastq.py -p {processLuid}
+
+The stdout and stderr of the script are written to the stdout and stderr of
+the client, and the client exits with the exit status of the script. If no
+worker is running, the client runs the script itself.
+"""
+
+from clinical_EPPs.worker import call
+
+import os
+import sys
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] in ('-h', '--help'):
+        sys.exit(DESC)
+    script, argv = os.path.basename(sys.argv[1]), sys.argv[2:]
+    code = call(script, argv)
+    if code is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+        os.execv(sys.executable, [sys.executable, path] + argv)
+    sys.exit(code)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+
+from clinical_EPPs.worker import serve, SOCKET_PATH
+
+import os
+
+DESC = """EPP worker daemon. Imports the modules used by the EPPs, reads the
+config files and checks the LIMS version once, and then runs the EPP
+scripts sent by epp_client.py on the Unix socket
+~/.cache/clinical_EPPs/epp_worker.sock, each in a process forked
+from the warm daemon. Run it as the user running the EPPs, eg. under
+supervisord or systemd, and let the automation strings run the EPPs with
+epp_client.py:
+
+    bash -c "/home/glsai/miniconda2/envs/epp_master/bin/epp_client.py bcl2fastq.py -p {processLuid}"
+"""
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('-d', dest = 'scripts_dir', default = os.path.dirname(os.path.abspath(__file__)),
+                        help='Directory of the EPP scripts')
+    parser.add_argument('--no-version-check', dest = 'check_version', action='store_false',
+                        help='Do not check the LIMS version at start, leave it to each run')
+    args = parser.parse_args()
+    serve(SOCKET_PATH, args.scripts_dir, args.check_version)
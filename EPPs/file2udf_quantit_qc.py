@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 from genologics.entities import Process
+from clinical_EPPs.batch import get_batch, WriteBuffer
+from clinical_EPPs.result_files import read_result_file
 
-import pandas as pd
 import sys
 import os
 
@@ -27,10 +27,12 @@ class File2UDF():
     def __init__(self, process):
         self.process = process
         self.all_artifacts = process.all_outputs(unique=True)
+        get_batch(process.lims, self.all_artifacts)
         self.artifacts = {}
         self.passed_arts = []
         self.failed_arts = []
         self.result_file = None
+        self.write_buffer = WriteBuffer(process.lims)
 
 
     def get_artifacts(self):
@@ -56,18 +58,25 @@ class File2UDF():
                 self.result_file = qubit_files[0].files[0].content_location.split('scilifelab.se')[1]
 
     def set_udfs(self):
-        df = pd.read_excel(self.result_file, header=None)
-        for i, row in df.iterrows():
-            well = row[0]
+        try:
+            values = read_result_file(self.result_file, [2], well_column=0, header=False)
+        except ValueError as e:
+            sys.exit(str(e))
+        for well, (conc, ) in values.items():
             if well in self.artifacts:
                 art = self.artifacts[well]
                 try:
-                    conc = int(row[2]) # will fail if nan
-                    art.udf['Concentration'] = row[2]
+                    int(conc) # will fail if nan
+                    art.udf['Concentration'] = float(conc)
                     self.passed_arts.append(art.id)
                 except:
                     self.failed_arts.append(art.id)
-                art.put()
+                self.write_buffer.add(art)
+        for art in self.write_buffer.flush():
+            if art.id in self.passed_arts:
+                self.passed_arts.remove(art.id)
+            if art.id not in self.failed_arts:
+                self.failed_arts.append(art.id)
 
 
 
@@ -100,10 +109,9 @@ if __name__ == "__main__":
     parser.add_argument('--result_file', default=None,
                        help=(''))
 
+    add_run_options(parser)
 
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
 
@@ -2,8 +2,7 @@
 from argparse import ArgumentParser
 import pandas as pd
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 
@@ -94,10 +93,9 @@ if __name__ == "__main__":
                               'for runtime information and problems.'))
     parser.add_argument('-f', dest = 'MAF_file',
                         help=('File path to new Plate Layout file'))
+    add_run_options(parser)
 
     args = parser.parse_args()
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
     logging.basicConfig(
                     level=logging.DEBUG,
                     format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
@@ -105,4 +103,4 @@ if __name__ == "__main__":
                     filename = args.log,
                     filemode='w')
 
-    main(lims, args)
+    run(main, args)
@@ -2,8 +2,7 @@
 from argparse import ArgumentParser
 import pandas as pd
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 
@@ -111,9 +110,8 @@ if __name__ == "__main__":
     parser.add_argument('-f', dest = 'MAF_file',
                         help=('File path to new MAF-xlsx file'))    
                         
+    add_run_options(parser)
     args = parser.parse_args()
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
     logging.basicConfig(
                     level=logging.DEBUG,
                     format='%(asctime)s %(name)-12s %(levelname)-8s %(message)s',
@@ -121,4 +119,4 @@ if __name__ == "__main__":
                     filename = args.log,
                     filemode='w')
 
-    main(lims, args)
+    run(main, args)
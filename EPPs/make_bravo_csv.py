@@ -2,8 +2,7 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 from genologics.epp import EppLogger
@@ -108,9 +107,8 @@ if __name__ == "__main__":
                         help=('csv file'))
     parser.add_argument('--buffer_volume_udf', default=None,
                         help=("udf for buffer volume (eg: 'Volume Buffer (ul)' or 'Volume H2O (ul)')"))
+    add_run_options(parser)
 
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
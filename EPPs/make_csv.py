@@ -1,10 +1,10 @@
 #!/home/glsai/miniconda2/envs/epp_master/bin/python
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
+from clinical_EPPs.batch import prefetch_process
 
 import csv
 import sys
@@ -23,6 +23,7 @@ class ToCSV():
         self.csv_files = []
 
     def get_artifacts(self):
+        prefetch_process(self.process, inputs=False, samples=False)
         all_artifacts = self.process.all_outputs(unique=True)
         self.artifacts = filter(lambda a: a.output_type == "Analyte" , all_artifacts)
         for art in all_artifacts:
@@ -84,9 +85,8 @@ if __name__ == "__main__":
                         help=('csv files'))
     parser.add_argument('--udf', dest = 'udf', default = None,
                             help='udfs to add')
+    add_run_options(parser)
 
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
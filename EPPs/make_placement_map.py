@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
+from clinical_EPPs.epp_run import add_run_options, run
+from clinical_EPPs.lineage import LineageIndex
+from clinical_EPPs.batch import prefetch_artifacts, prefetch_process
 from genologics.config import BASEURI,USERNAME,PASSWORD
 from genologics.entities import Process
 
@@ -42,15 +44,18 @@ class SamplePlacementMap():
         hist_dict = None
         artifacts = None
 
+        lineage = LineageIndex(self.process.lims)
         if self.original_source:
-            hist_dict = make_hist_dict_no_stop(self.process.id)
+            hist_dict = make_hist_dict_no_stop(self.process.id, lineage)
         elif self.other_source:
-            hist_dict = make_hist_dict(self.process.id, [self.other_source])
+            hist_dict = make_hist_dict(self.process.id, [self.other_source], lineage)
         else:
+            prefetch_process(self.process)
             all_artifacts = self.process.all_outputs(unique=True)
             artifacts = filter(lambda a: a.output_type == "Analyte" , all_artifacts)
 
         if hist_dict:
+            prefetch_artifacts(self.process.lims, hist_dict.keys() + hist_dict.values())
             for dest_art, source_art in hist_dict.items():
                 self._make_source_dest_dict(source_art, dest_art)
             return
@@ -237,8 +242,7 @@ if __name__ == "__main__":
                                    'EB Volume (ul)', 
                                    'PCR Plate', 
                                    'Ligation Master Mix'])
+    add_run_options(parser)
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
+from clinical_EPPs.epp_run import add_run_options, run
 from genologics.config import BASEURI,USERNAME,PASSWORD
 from genologics.entities import Process
 
@@ -114,8 +114,7 @@ if __name__ == "__main__":
                         help='Lims id for current Process')
     parser.add_argument('--res', default=sys.stdout,
                         help=('Result file'))
+    add_run_options(parser)
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
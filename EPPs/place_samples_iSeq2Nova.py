@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 from __future__ import division
 from argparse import ArgumentParser
-from genologics.lims import Lims
+from clinical_EPPs.epp_run import add_run_options, run
 from genologics.config import BASEURI,USERNAME,PASSWORD
 from genologics.entities import Process , Workflow
 from xml.dom.minidom import parseString
@@ -94,6 +94,7 @@ class PassSamples():
             self.passed=True
 
 def main(lims, args):
+    api.setSession(lims.request_session)
     process = Process(lims, id = args.pid)
     PS = PassSamples(process, args.process_types, args.nova_seq_step)
     PS.get_samples()
@@ -114,9 +115,8 @@ if __name__ == "__main__":
     parser.add_argument('-s', dest = 'nova_seq_step', 
                         help='Place samples in this step)')
                 
+    add_run_options(parser)
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
 
@@ -2,11 +2,11 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 from genologics.epp import EppLogger
+from clinical_EPPs.batch import prefetch_process, WriteBuffer
 
 import logging
 import sys
@@ -22,6 +22,7 @@ class ArtQC2SampUDF():
     def __init__(self, process, dest_udf, sequencing):
         self.process = process
         self.dest_udf = dest_udf
+        prefetch_process(self.process, inputs=not sequencing, outputs=sequencing, containers=False)
         if sequencing:
             all_artifacts = self.process.all_outputs(unique=True)
             self.artifacts = filter(lambda a: a.output_type == "Analyte" ,all_artifacts)
@@ -29,6 +30,7 @@ class ArtQC2SampUDF():
             self.artifacts = self.process.all_inputs(unique=True)
         self.passed_samps = []
         self.failed_samps = []
+        self.write_buffer = WriteBuffer(process.lims)
 
 
     def set_udf(self):
@@ -38,15 +40,20 @@ class ArtQC2SampUDF():
                     for samp in art.samples:
                         ## if art is pool, the art.qc_flagg is "copied" to all samps in the pool
                         samp.udf[self.dest_udf] = 'True'
-                        samp.put()
+                        self.write_buffer.add(samp)
                         self.passed_samps.append(samp)
                 else:
                     for samp in art.samples:
                         samp.udf[self.dest_udf] = 'False'
-                        samp.put()
+                        self.write_buffer.add(samp)
                         self.passed_samps.append(samp)
             except:
                 self.failed_samps.append(art)
+        not_saved = [samp.id for samp in self.write_buffer.flush()]
+        for samp in self.passed_samps:
+            if samp.id in not_saved:
+                self.failed_samps.append(samp)
+        self.passed_samps = [samp for samp in self.passed_samps if samp.id not in not_saved]
         self.passed_samps = list(set(self.passed_samps))
         self.failed_samps = list(set(self.failed_samps))
 
@@ -78,9 +85,8 @@ if __name__ == "__main__":
                         help=("Sample udf to be set based on artifact qc_flagg"))
     parser.add_argument('--sequencing', action='store_true',
                         help=("Use this tag if current Process is a sequencing step"))
+    add_run_options(parser)
 
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    run(main, args)
@@ -2,37 +2,123 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 
 from genologics.entities import Process
 from genologics.epp import EppLogger
+from clinical_EPPs.batch import prefetch_process, WriteBuffer
+from clinical_EPPs.config import SQLALCHEMY_DATABASE_URI
+from clinical_EPPs.cgstats import get_engine, get_passed_reads
+from clinical_EPPs.reads_ledger import ReadsLedger
+from clinical_EPPs.parallel import pmap, MapError, MAX_WORKERS
 
 import sys
 import os
 
-DESC = """
+DESC = """epp script to sum the passed reads of all sequencing runs per sample 
+and set them on the sample udf Total Reads (M).
+
+By default the reads are summed from the # Reads of the passed artifacts of 
+the sequencing processes given with -s, fetched for -w samples at a time. 
+With -b cgstats, they are summed from the lanes passing the Q30 threshold 
+(-q) and the reads threshold in the demultiplex database, for all samples 
+with one grouped query. With -b ledger,
+they are taken from the local reads ledger (clinical_EPPs.reads_ledger), 
+which only reads the lanes passed since the last aggregation from the LIMS.
 """
 
 
+class LimsReads():
+    """Passed reads per sample from the artifacts of the sequencing processes,
+    fetched for max_workers samples at a time by load()."""
+
+    def __init__(self, lims, process_types, max_workers=MAX_WORKERS):
+        self.lims = lims
+        self.process_types = process_types
+        self.max_workers = max_workers
+        self.passed_reads = {}
+
+    def load(self, samples):
+        samples = list(set(samples))
+        try:
+            reads = pmap(self._passed_reads, samples, self.max_workers)
+        except MapError as e:
+            sys.exit('Could not get the sequencing artifacts of samples: ' + ', '.join(s.id for s in e.failed))
+        self.passed_reads = dict((sample.id, sample_reads) for sample, sample_reads in zip(samples, reads))
+
+    def get(self, sample):
+        if sample.id not in self.passed_reads:
+            self.passed_reads[sample.id] = self._passed_reads(sample)
+        return self.passed_reads[sample.id]
+
+    def _passed_reads(self, sample):
+        """Return the reads and number of lanes of the passed artifacts of sample."""
+        total_reads = 0.0
+        nr_lanes = 0
+        arts = self.lims.get_artifacts(samplelimsid = sample.id, process_type = self.process_types)
+        for art in arts:
+            if art.qc_flag == 'PASSED' and '# Reads' in art.udf:
+                total_reads += float(art.udf.get('# Reads'))
+                nr_lanes +=1
+        return total_reads, nr_lanes
+
+
+class CgstatsReads():
+    """Passed reads per sample from the demultiplex database, fetched for
+    all samples at once by load()."""
+
+    def __init__(self, engine, q30_threshold, reads_threshold=1000):
+        self.engine = engine
+        self.q30_threshold = q30_threshold
+        self.reads_threshold = reads_threshold
+        self.passed_reads = {}
+
+    def load(self, samples):
+        try:
+            self.passed_reads = get_passed_reads(self.engine, [sample.id for sample in samples],
+                                                 self.q30_threshold, self.reads_threshold)
+        except:
+            sys.exit('Error getting data from the demultiplexing database.')
+
+    def get(self, sample):
+        reads, nr_lanes = self.passed_reads.get(sample.id, (0, 0))
+        return float(reads), nr_lanes
+
+
+class LedgerReads():
+    """Passed reads per sample from the reads ledger, after checking the
+    passed lanes of the samples in the LIMS."""
+
+    def __init__(self, lims, process_types):
+        self.ledger = ReadsLedger(lims, process_types)
+        self.totals = {}
+
+    def load(self, samples):
+        sample_ids = [sample.id for sample in samples]
+        self.ledger.refresh(sample_ids)
+        self.ledger.backfill(sample_ids)
+        self.totals = self.ledger.totals(sample_ids)
+
+    def get(self, sample):
+        return self.totals.get(sample.id, (0.0, 0))
+
+
 class SumReadsRML():
-    def __init__(self, pools, process_types):
+    def __init__(self, lims, pools, reads_source):
+        self.lims = lims
         self.pools = pools
-        self.process_types = process_types
+        self.reads_source = reads_source
         self.passed_pool_replicates = {}
         self.failed_pools = []
         self.passed_pools = {}
+        self.write_buffer = WriteBuffer(self.lims)
 
     def _sum_reads_per_pool(self, pool):
         """Sum passed sample reads from all lanes and runs. Return total reads in Milions"""
         total_reads = 0.0
         for sample in pool.samples:
-            nr_lanes = 0
-            arts = lims.get_artifacts(samplelimsid = sample.id, process_type = self.process_types)
-            for art in arts:
-                if art.qc_flag == 'PASSED' and '# Reads' in art.udf:
-                    total_reads += float(art.udf.get('# Reads'))
-                    nr_lanes +=1
+            reads, nr_lanes = self.reads_source.get(sample)
+            total_reads += reads
             if nr_lanes:
                 self.passed_pools[pool.name] = nr_lanes
             else:
@@ -43,41 +129,49 @@ class SumReadsRML():
         """Set Total Reads on all samps"""
         for samp in pool.samples:
             samp.udf['Total Reads (M)'] =  M_reads
-            samp.put()
+            self.write_buffer.add(samp)
 
     def sum_reads(self):
+        self.reads_source.load([samp for pool in self.pools for samp in pool.samples])
         for pool in self.pools:
             M_reads = self._sum_reads_per_pool(pool)
             self._set_udfs(pool, M_reads)
+        not_saved = [samp.id for samp in self.write_buffer.flush()]
+        for pool in self.pools:
+            if [samp for samp in pool.samples if samp.id in not_saved]:
+                self.passed_pools.pop(pool.name, None)
+                self.failed_pools.append(pool.id)
 
 
 class SumReads():
-    def __init__(self, samples, process_types):
-        self.process_types = process_types
+    def __init__(self, lims, samples, reads_source):
+        self.lims = lims
+        self.reads_source = reads_source
         self.samples = samples
         self.failed_samps = 0
         self.passed_samps =0
+        self.write_buffer = WriteBuffer(self.lims)
 
     def sum_reads(self, sample):
         """Sum passed sample reads from all lanes and runs. Return total reads in Milions"""
-        total_reads = 0.0
-        arts = lims.get_artifacts(samplelimsid = sample.id, process_type = self.process_types)
-        for art in arts:
-            if art.qc_flag == 'PASSED' and '# Reads' in art.udf:
-                total_reads += float(art.udf.get('# Reads'))
+        total_reads, nr_lanes = self.reads_source.get(sample)
         return total_reads/1000000
 
     def set_udfs(self):
         """Set Total Reads on all samps"""
+        self.reads_source.load(self.samples)
         for samp in self.samples:
             M_reads = self.sum_reads(samp)
             try:
                 samp.udf['Total Reads (M)'] =  M_reads
-                samp.put()
+                self.write_buffer.add(samp)
                 self.passed_samps +=1
             except:
                 self.failed_samps +=1
                 pass
+        not_saved = len(self.write_buffer.flush())
+        self.passed_samps -= not_saved
+        self.failed_samps += not_saved
 
 class PoolsAndSamples():
     def __init__(self, process):
@@ -86,6 +180,7 @@ class PoolsAndSamples():
         self.pools = []
 
     def get_pools_and_samples(self):
+        prefetch_process(self.process, outputs=False, containers=False)
         all_artifacts = self.process.all_inputs(unique=True)
         samples = []
         for a in all_artifacts:
@@ -100,15 +195,21 @@ def main(lims, args):
     process = Process(lims, id = args.pid)
     PAS = PoolsAndSamples(process)
     PAS.get_pools_and_samples()
+    if args.backend == 'cgstats':
+        reads_source = CgstatsReads(get_engine(args.db_uri), args.q30_threshold)
+    elif args.backend == 'ledger':
+        reads_source = LedgerReads(lims, args.process_types)
+    else:
+        reads_source = LimsReads(lims, args.process_types, args.max_workers)
     abstract = ''
     if PAS.samples:
         abstract += 'Found Samples - Summing demultiplexed reads on sample level. '
-        SR = SumReads(PAS.samples, args.process_types)
+        SR = SumReads(lims, PAS.samples, reads_source)
         SR.set_udfs()
         abstract += "Reads aggregated for "+str(SR.passed_samps)+" sample(s). "
     if PAS.pools:
         abstract += 'Found pools - Summing reads from all runs. '
-        SRRML = SumReadsRML(PAS.pools, args.process_types)
+        SRRML = SumReadsRML(lims, PAS.pools, reads_source)
         SRRML.sum_reads()
         abstract += "Reads summed for: "
         for k, v in SRRML.passed_pools.items():
@@ -123,9 +224,19 @@ if __name__ == "__main__":
                         help='Lims id for current Process')
     parser.add_argument('-s', dest = 'process_types',  nargs='+', 
                         help='Aggregate reads from this process type(s)')
+    parser.add_argument('-b', dest = 'backend', choices = ['lims', 'cgstats', 'ledger'], default = 'lims',
+                        help=('Sum the reads of the LIMS artifacts, of the lanes in the demultiplex database, '
+                              'or of the lanes in the reads ledger'))
+    parser.add_argument('-q', dest = 'q30_threshold', type = float,
+                        help='Threshold for % bases >= Q30 of a lane, with -b cgstats')
+    parser.add_argument('-d', dest = 'db_uri', default = SQLALCHEMY_DATABASE_URI,
+                        help='Demultiplex database URI, with -b cgstats')
+    parser.add_argument('-w', dest = 'max_workers', type = int, default = MAX_WORKERS,
+                        help='Number of samples to get the sequencing artifacts of at a time, with -b lims')
+    add_run_options(parser)
 
     args = parser.parse_args()
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-    main(lims, args)
+    if args.backend == 'cgstats' and args.q30_threshold is None:
+        sys.exit('A Q30 threshold (-q) is needed to sum reads from the demultiplex database')
+    run(main, args)
 
@@ -5,9 +5,9 @@ Maya Brandi
 Science for Life Laboratory, Stockholm, Sweden
 """
 from argparse import ArgumentParser
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 from genologics.entities import Process, Artifact
+from clinical_EPPs.batch import prefetch_artifacts, WriteBuffer
 import sys
 
 
@@ -23,6 +23,8 @@ class SetQC:
         self.qc_fail = 0
         self.qc_pass = 0
         self.unknown = 0
+        self.not_saved = 0
+        self.write_buffer = WriteBuffer(lims)
 
     def get_tresholds(self, condition_strings):
         for condition_string in condition_strings:
@@ -35,6 +37,7 @@ class SetQC:
         else:
             artifact_ids = [io[1]['limsid'] for io in self.iom if io[1]['output-generation-type'] == 'PerInput']
         self.artifacts = [Artifact(self.lims, id=id) for id in artifact_ids if id is not None]
+        prefetch_artifacts(self.lims, self.artifacts, containers=False)
 
     def set_qc(self):
         if not self.conditions:
@@ -85,7 +88,16 @@ class SetQC:
                 self.qc_pass+=1
 
             art.qc_flag = qc_flag
-            art.put()
+            self.write_buffer.add(art)
+        self.save_artifacts()
+
+    def save_artifacts(self):
+        for art in self.write_buffer.flush():
+            if art.qc_flag == 'FAILED':
+                self.qc_fail -= 1
+            elif art.qc_flag == 'PASSED':
+                self.qc_pass -= 1
+            self.not_saved += 1
 
 def main(lims,args):
     process = Process(lims, id = args.pid)
@@ -100,9 +112,11 @@ def main(lims,args):
     if C2QC.qc_fail:
         abstract += str(C2QC.qc_fail) + ' samples failed QC. '
     if C2QC.missing_udf:
-        abstract += 'Udfs missing for some samples.'
+        abstract += 'Udfs missing for some samples. '
+    if C2QC.not_saved:
+        abstract += 'Failed to save QC-flaggs on '+str(C2QC.not_saved)+' samples.'
 
-    if C2QC.qc_fail or C2QC.missing_udf:
+    if C2QC.qc_fail or C2QC.missing_udf or C2QC.not_saved:
         sys.exit(abstract)
     else:
         print >> sys.stderr, abstract
@@ -117,11 +131,9 @@ if __name__ == "__main__":
                         help=('Strings with three elements comma separated describing a FAILING conditions: "<art udf1>,<criteria1>,<treshold1>" "<art udf2>,<criteria2>,<treshold2>" "<art udf3>,<criteria3>,<treshold3>" etc. Accepted failing conditions are: <, <=, >, >=, ==, !='))
     parser.add_argument('-ota', dest = 'output_type_analyte', action='store_true', default=False,
                         help='Select output artifacts based on output-type="Analyte". Defaule is False. Artifacts are then selected based on output-generation-type="PerAllInputs"')
+    add_run_options(parser)
 
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-
-    main(lims, args)
+    run(main, args)
 
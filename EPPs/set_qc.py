@@ -10,11 +10,11 @@ Maya Brandi
 Science for Life Laboratory, Stockholm, Sweden
 """
 from argparse import ArgumentParser
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.epp_run import add_run_options, run
 from genologics.entities import Process, Artifact
 from genologics.epp import EppLogger
 from genologics.epp import set_field
+from clinical_EPPs.batch import get_batch, WriteBuffer
 import logging
 import sys
 
@@ -33,6 +33,8 @@ class SetQC:
         self.qc_fail = 0
         self.qc_pass = 0
         self.missing_udf = 0
+        self.not_saved = 0
+        self.write_buffer = WriteBuffer(lims)
 
 
     def get_artifacts(self):
@@ -40,6 +42,7 @@ class SetQC:
             if outp.get("output-generation-type") == "PerAllInputs":
                 continue
             self.artifacts.append( Artifact(self.lims,id = outp['limsid']))
+        get_batch(self.lims, self.artifacts)
 
 
     def get_tresholds(self, tresholds, udfs):
@@ -73,7 +76,16 @@ class SetQC:
                 elif qc_flag=='PASSED':
                     self.qc_pass+=1
                 artifact.qc_flag = qc_flag
-                artifact.put()
+                self.write_buffer.add(artifact)
+            self.save_artifacts()
+
+    def save_artifacts(self):
+        for artifact in self.write_buffer.flush():
+            if artifact.qc_flag == 'FAILED':
+                self.qc_fail -= 1
+            elif artifact.qc_flag == 'PASSED':
+                self.qc_pass -= 1
+            self.not_saved += 1
 
 def main(lims,args):
     C2QC = SetQC(lims, args.pid)
@@ -87,11 +99,13 @@ def main(lims,args):
     if C2QC.qc_fail:
         abstract += str(C2QC.qc_fail) + ' samples failed QC. '
     if C2QC.missing_udf:
-        abstract += 'Could not set QC-flaggs on '+str(C2QC.missing_udf)+' samples, due to missing udfs.'
+        abstract += 'Could not set QC-flaggs on '+str(C2QC.missing_udf)+' samples, due to missing udfs. '
+    if C2QC.not_saved:
+        abstract += 'Failed to save QC-flaggs on '+str(C2QC.not_saved)+' samples.'
 
 
 
-    if C2QC.qc_fail or C2QC.missing_udf:
+    if C2QC.qc_fail or C2QC.missing_udf or C2QC.not_saved:
         sys.exit(abstract)
     else:
         print >> sys.stderr, abstract
@@ -108,11 +122,9 @@ if __name__ == "__main__":
                         help=('Trhreshold process udfs. (has to be ordered as target udfs)'))
     parser.add_argument('-u', dest = 'udfs', nargs='+',
                         help=('Target udfs. (has to be ordered as threshold udfs)'))
+    add_run_options(parser)
 
     args = parser.parse_args()
 
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
-    lims.check_version()
-
-    main(lims, args)
+    run(main, args)
 
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+
+from clinical_EPPs.lims_client import PooledLims, LimsSession
+from mock_clarity import ClarityData, start_server
+
+from datetime import date
+
+import copy
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'one_time_scripts'))
+import set_old_dates
+
+DESC = """Benchmark of one_time_scripts/set_old_dates.py, serial (one GET per
+step, artifact and sample and one PUT per changed sample) against the bulk
+set_dates (-w) with different numbers of concurrent requests.
+
+A mock LIMS with a fixed latency per request is filled with Aggregate QC
+steps, each with a number of input artifacts of random samples, and some
+samples with a prep date already set. Each run starts from the same state,
+and the sample dates after every bulk run are checked to be equal to the
+ones after the serial run.
+"""
+
+
+def make_data(nr_steps, nr_inputs, nr_samples):
+    lims_data = ClarityData()
+    for i in range(nr_samples):
+        udfs = {'Library Prep Finished': date(2019, 6, random.randint(1, 30))} if random.random() < 0.2 else {}
+        lims_data.add_sample('ACC%04d' % i, udfs=udfs)
+    for i in range(nr_steps):
+        inputs = []
+        for j in range(nr_inputs):
+            art_id = '2-%d' % (i * nr_inputs + j)
+            lims_data.add_artifact(art_id, ['ACC%04d' % random.randrange(nr_samples)], qc_flag='PASSED')
+            inputs.append((art_id, None, None))
+        date_run = '2019-%02d-%02d' % (random.randint(1, 12), random.randint(1, 28)) if i % 20 else None
+        lims_data.add_process('24-%d' % i, set_old_dates.PREP_STEPS[i % len(set_old_dates.PREP_STEPS)],
+                              inputs, date_run)
+    return lims_data
+
+
+def sample_udfs(lims_data):
+    return dict((sample_id, lims_data.udfs('samples', sample_id)) for sample_id in lims_data.entities['samples'])
+
+
+def run(base, func, pool_size):
+    lims = PooledLims(base, 'user', 'password', session=LimsSession(pool_size=pool_size))
+    start = time.time()
+    func(lims)
+    seconds = time.time() - start
+    lims.request_session.close()
+    return seconds
+
+
+def main(args):
+    random.seed(args.seed)
+    lims_data = make_data(args.steps, args.inputs, args.samples)
+    server, base = start_server(lims_data, args.latency / 1000.0)
+    initial = copy.deepcopy(lims_data.entities['samples'])
+    pool_size = max(args.workers)
+
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        serial_seconds = run(base, set_old_dates.set_prep_dates, pool_size)
+    finally:
+        sys.stdout = stdout
+    expected = sample_udfs(lims_data)
+    print('%d steps with %d inputs, %d samples, %.0f ms latency' % (
+        args.steps, args.inputs, args.samples, args.latency))
+    print('serial          %5d requests  %7.2f s' % (sum(lims_data.requests.values()), serial_seconds))
+
+    process_types, sample_udf, date_udf, passed_udf = set_old_dates.DATES['prep']
+    for workers in args.workers:
+        lims_data.entities['samples'] = copy.deepcopy(initial)
+        lims_data.requests.clear()
+        seconds = run(base, lambda lims: set_old_dates.set_dates(
+            lims, process_types, sample_udf, date_udf, passed_udf, workers), pool_size)
+        assert sample_udfs(lims_data) == expected, workers
+        print('bulk %2d workers %5d requests  %7.2f s  speedup %5.1f' % (
+            workers, sum(lims_data.requests.values()), seconds, serial_seconds / seconds))
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('-n', dest = 'steps', type=int, default=100,
+                        help='Number of Aggregate QC steps')
+    parser.add_argument('-i', dest = 'inputs', type=int, default=8,
+                        help='Number of input artifacts per step')
+    parser.add_argument('-m', dest = 'samples', type=int, default=400,
+                        help='Number of samples')
+    parser.add_argument('-l', dest = 'latency', type=float, default=20,
+                        help='Latency in ms added by the mock server to each request')
+    parser.add_argument('-w', dest = 'workers', type=int, nargs='+', default=[1, 4, 8, 16],
+                        help='Numbers of concurrent requests of the bulk runs')
+    parser.add_argument('-s', dest = 'seed', type=int, default=1,
+                        help='Random seed')
+    args = parser.parse_args()
+    main(args)
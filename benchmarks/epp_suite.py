@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+from clinical_EPPs import cgstats
+from clinical_EPPs.plate_layout import get_layout
+from mock_clarity import ClarityData, start_server
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+DESC = """Benchmark of the main EPPs against a mock Clarity LIMS
+(benchmarks/mock_clarity.py), for a number of samples.
+
+For each EPP and number of samples, the mock LIMS is filled with the
+fixtures of a step of the EPP, and the EPP script is run as it is run by the
+LIMS, in a subprocess with a ~/.genologicsrc pointing to the mock and a
+~/.clinical_eppsrc with a local SQLite demultiplex database. The wall time,
+the number of LIMS requests and the exit status of each run are reported,
+and with -v the requests per endpoint.
+
+qPCR_dilution is run with at most the 32 samples of a qPCR plate.
+"""
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROWS = 'ABCDEFGH'
+PROCESS = '24-100'
+PROJECT = 'ACC1'
+SEQUENCING = 'CG002 - Illumina Sequencing (Illumina SBS)'
+LANES = 2
+QPCR_SAMPLES = 32
+
+
+def sample_ids(data, nr_samples):
+    ids = ['%sA%d' % (PROJECT, i + 1) for i in range(nr_samples)]
+    for i, sample_id in enumerate(ids):
+        data.add_sample(sample_id, name='sample%d' % (i + 1), project=PROJECT,
+                        udfs={'Original Container': 'plate%d' % (i // 96 + 1)})
+    return ids
+
+
+def plated(data, prefix, samples, parent_process=None, output_type='Analyte', udfs=None):
+    """One artifact per sample, placed column by column in 96 well plates.
+    udfs is a function of the sample index. Returns the artifact ids."""
+
+    arts = []
+    for i, sample_id in enumerate(samples):
+        container = '27-%s%d' % (prefix, i // 96 + 1)
+        if container not in data.entities['containers']:
+            data.add_container(container, name='%s plate %d' % (prefix, i // 96 + 1))
+        well = '%s:%d' % (ROWS[i % 96 % 8], i % 96 // 8 + 1)
+        arts.append('2-%s%d' % (prefix, i + 1))
+        data.add_artifact(arts[-1], [sample_id], name=sample_id, output_type=output_type,
+                          container=container, well=well, parent_process=parent_process,
+                          udfs=udfs(i) if udfs else None)
+    return arts
+
+
+def per_input(inputs, outputs):
+    return [(inp, outp, 'PerInput') for inp, outp in zip(inputs, outputs)]
+
+
+def set_qc(data, tmp, nr_samples):
+    samples = sample_ids(data, nr_samples)
+    inputs = plated(data, 'IN', samples)
+    outputs = plated(data, 'QC', samples, PROCESS, 'ResultFile',
+                     lambda i: {'Concentration': round(random.uniform(5, 50), 2)})
+    data.add_process(PROCESS, 'CG002 - Qubit QC (Library Validation)', per_input(inputs, outputs),
+                     udfs={'Min Concentration': 2.0})
+    return ['-p', PROCESS, '-l', 'set_qc.log', '-t', 'Min Concentration', '-u', 'Concentration']
+
+
+def calc_volumes_nova(data, tmp, nr_samples):
+    samples = sample_ids(data, nr_samples)
+    inputs = plated(data, 'IN', samples)
+    outputs = plated(data, 'OUT', samples, PROCESS, udfs=lambda i: {
+        'Reads to sequence (M)': random.choice([10, 20, 50]),
+        'Concentration (nM)': round(random.uniform(1, 10), 2)})
+    data.add_process(PROCESS, 'Define Run Format and Calculate Volumes (Nova Seq)', per_input(inputs, outputs),
+                     udfs={'Flowcell Type': 'S4', 'Protocol type': 'NovaSeq Standard',
+                           'Final Loading Concentration (pM)': 250.0, 'Minimum Per Sample Volume (ul)': 0.5})
+    return ['-p', PROCESS]
+
+
+def make_placement_map(data, tmp, nr_samples):
+    samples = sample_ids(data, nr_samples)
+    inputs = plated(data, 'SOURCE', samples)
+    outputs = plated(data, 'DEST', samples, PROCESS, udfs=lambda i: {'Sample Volume (ul)': 10.0})
+    data.add_process(PROCESS, 'CG002 - Aliquot Samples for Library Pooling', per_input(inputs, outputs))
+    return ['--pid', PROCESS, '--dest_96well', '--res', 'placement_map']
+
+
+def reads_aggregation(data, tmp, nr_samples):
+    samples = sample_ids(data, nr_samples)
+    inputs = plated(data, 'IN', samples)
+    for lane in range(1, LANES + 1):
+        process_id = '24-%d' % lane
+        lane_arts = ['2-SEQ%d-%d' % (lane, i + 1) for i in range(nr_samples)]
+        for art_id, sample_id in zip(lane_arts, samples):
+            data.add_artifact(art_id, [sample_id], output_type='ResultFile', parent_process=process_id,
+                              qc_flag=random.choice(['PASSED'] * 9 + ['FAILED']),
+                              udfs={'# Reads': random.randint(1000000, 20000000)})
+        data.add_process(process_id, SEQUENCING,
+                         [(inp, outp, 'PerReagentLabel') for inp, outp in zip(inputs, lane_arts)],
+                         date_run='2019-06-%02d' % lane)
+    outputs = plated(data, 'OUT', samples, PROCESS, 'ResultFile')
+    data.add_process(PROCESS, 'CG002 - Delivery', per_input(inputs, outputs))
+    return ['-p', PROCESS, '-s', SEQUENCING]
+
+
+def bcl2fastq(data, tmp, nr_samples):
+    """A flowcell with LANES lanes holding a pool of all samples, and the
+    demultiplexing statistics of each sample and lane in cgstats."""
+
+    samples = sample_ids(data, nr_samples)
+    indexes = dict((sample_id, ''.join(random.choice('ACGT') for j in range(8))) for sample_id in samples)
+    data.add_containertype('2', 'Illumina Flow Cell', x_size=1, y_size=LANES)
+    data.add_container('27-FC', name='HFLOWCELL', container_type='2')
+    io_maps = []
+    for lane in range(1, LANES + 1):
+        pool = '2-LANE%d' % lane
+        data.add_artifact(pool, samples, name='pool', container='27-FC', well='%d:1' % lane,
+                          reagent_labels=indexes.values())
+        for i, sample_id in enumerate(samples):
+            output = '2-DEMUX%d-%d' % (lane, i + 1)
+            data.add_artifact(output, [sample_id], name=sample_id, output_type='ResultFile',
+                              parent_process=PROCESS, reagent_labels=[indexes[sample_id]])
+            io_maps.append((pool, output, 'PerReagentLabel'))
+    data.add_process(PROCESS, 'CG002 - Bcl Conversion & Demultiplexing (Illumina SBS)', io_maps,
+                     udfs={'Threshold for % bases >= Q30': 80.0})
+
+    engine = cgstats.get_engine('sqlite:///' + os.path.join(tmp, 'cgstats.sqlite'))
+    cgstats.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(cgstats.flowcell.insert(), [{'flowcell_id': 1, 'flowcellname': 'HFLOWCELL'}])
+        connection.execute(cgstats.demux.insert(), [{'demux_id': 1, 'flowcell_id': 1, 'basemask': 'Y151,I8,Y151'}])
+        connection.execute(cgstats.sample.insert(), [
+            {'sample_id': i + 1, 'project_id': 1, 'samplename': '%s_%s' % (sample_id, indexes[sample_id]),
+             'barcode': indexes[sample_id]} for i, sample_id in enumerate(samples)])
+        connection.execute(cgstats.unaligned.insert(), [
+            {'sample_id': i + 1, 'demux_id': 1, 'lane': lane, 'readcounts': random.randint(1000000, 5000000),
+             'yield_mb': 1000, 'perfect_indexreads_pct': 98.5, 'q30_bases_pct': round(random.uniform(85, 95), 2),
+             'mean_quality_score': 36.0} for lane in range(1, LANES + 1) for i in range(len(samples))])
+    return ['-p', PROCESS]
+
+
+def qPCR_dilution(data, tmp, nr_samples):
+    """Outputs in the sample wells of the qPCR layout, and a result file
+    with three replicates per sample and dilution that pass the checks."""
+
+    samples = sample_ids(data, min(nr_samples, QPCR_SAMPLES))
+    inputs = plated(data, 'IN', samples)
+    data.add_container('27-QPCR', name='qPCR plate')
+    outputs = []
+    for i, sample_id in enumerate(samples):
+        outputs.append('2-QPCR%d' % (i + 1))
+        data.add_artifact(outputs[-1], [sample_id], name=sample_id, output_type='ResultFile',
+                          container='27-QPCR', well='%s:%d' % (ROWS[i % 8], i // 8 + 1), parent_process=PROCESS)
+    path = os.path.join(tmp, 'qpcr_results.csv')
+    layout = get_layout()
+    used = set(data.entities['artifacts'][art].find('location').findtext('value') for art in outputs)
+    with open(path, 'w') as csv_file:
+        csv_file.write('Well,Cq,SQ\n')
+        for well, sample_well, d in zip(layout.wells, layout.sample_well, layout.dilution):
+            if d >= 0 and sample_well in used:
+                Cq = 12 + [0, 1.0, 3.3][d] + random.uniform(-0.1, 0.1)
+                SQ = 4e-9 / [1000, 2000, 10000][d]
+                csv_file.write('%s,%.3f,%r\n' % (well, Cq, SQ))
+    data.add_file('40-1', 'sftp://mock.scilifelab.se' + path, attached_to='92-1')
+    data.add_artifact('92-1', samples, name='qPCR Result File', output_type='ResultFile',
+                      parent_process=PROCESS, files=['40-1'])
+    io_maps = per_input(inputs, outputs) + [(inp, '92-1', 'PerAllInputs') for inp in inputs]
+    data.add_process(PROCESS, 'CG002 - qPCR QC (Library Validation)', io_maps)
+    return ['--pid', PROCESS, '--log', 'qpcr.log', '--dil_file', 'qpcr_results.csv']
+
+
+FIXTURES = OrderedDict([('bcl2fastq', bcl2fastq),
+                        ('qPCR_dilution', qPCR_dilution),
+                        ('calc_volumes_nova', calc_volumes_nova),
+                        ('set_qc', set_qc),
+                        ('make_placement_map', make_placement_map),
+                        ('reads_aggregation', reads_aggregation)])
+
+
+def write_config(tmp, base):
+    with open(os.path.join(tmp, '.genologicsrc'), 'w') as config:
+        config.write('[genologics]\nBASEURI=%s\nUSERNAME=user\nPASSWORD=password\n' % base)
+    with open(os.path.join(tmp, '.clinical_eppsrc'), 'w') as config:
+        config.write('[demultiplex data]\nSQLALCHEMY_DATABASE_URI=sqlite:///%s\n\n[CgFace]\nURL=%s\n' % (
+            os.path.join(tmp, 'cgstats.sqlite'), base))
+
+
+def run(epp, nr_samples, latency):
+    """Run the EPP on its fixtures. Returns (seconds, request counts per
+    endpoint, exit status, last line of stderr)."""
+
+    tmp = tempfile.mkdtemp(prefix='epp_suite_')
+    data = ClarityData()
+    server, base = start_server(data, latency)
+    try:
+        args = FIXTURES[epp](data, tmp, nr_samples)
+        write_config(tmp, base)
+        env = dict(os.environ, HOME=tmp, PYTHONPATH=REPO)
+        start = time.time()
+        process = subprocess.Popen([sys.executable, os.path.join(REPO, 'EPPs', epp + '.py')] + args,
+                                   cwd=tmp, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        seconds = time.time() - start
+        lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+        return seconds, data.requests, process.returncode, lines[-1] if lines else ''
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(tmp)
+
+
+def main(args):
+    print('%-20s %7s %9s %9s  %s' % ('EPP', 'samples', 'seconds', 'requests', 'exit status'))
+    for epp in args.epps:
+        sizes = [min(n, QPCR_SAMPLES) if epp == 'qPCR_dilution' else n for n in args.samples]
+        for nr_samples in sorted(set(sizes), key=sizes.index):
+            random.seed(args.seed)
+            seconds, requests, status, message = run(epp, nr_samples, args.latency / 1000.0)
+            print('%-20s %7d %9.2f %9d  %d' % (epp, nr_samples, seconds, sum(requests.values()), status))
+            if args.verbose:
+                for name, count in requests.most_common():
+                    print('    %6d  %s' % (count, name))
+                print('    ' + message)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('-e', dest = 'epps', nargs='+', choices=list(FIXTURES), default=list(FIXTURES),
+                        help='EPPs to run')
+    parser.add_argument('-n', dest = 'samples', type=int, nargs='+', default=[8, 96, 384],
+                        help='Numbers of samples')
+    parser.add_argument('-l', dest = 'latency', type=float, default=20,
+                        help='Latency in ms added by the mock server to each request')
+    parser.add_argument('-s', dest = 'seed', type=int, default=1,
+                        help='Random seed of the fixtures')
+    parser.add_argument('-v', dest = 'verbose', action='store_true',
+                        help='Print the requests per endpoint and the last message of each EPP')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+
+from clinical_EPPs.index_collisions import find_collisions, find_close_pairs
+
+import random
+import time
+
+DESC = """Benchmark of the index collision check in
+clinical_EPPs.index_collisions against the former all-pairs nested loop.
+
+Random 8 and 10 bp indexes are generated, with some 10 bp indexes extending
+an 8 bp one, and both methods are timed and checked to flag the same indexes.
+
+The mismatch check, find_close_pairs, is timed on random dual 10 bp indexes,
+with some made from an earlier index with 1-3 mismatches, and checked
+against comparing all pairs base by base.
+"""
+
+
+def nested_loop(all_indexes):
+    """The check_dupl of check_indexes_in_pools before the collision engine."""
+
+    duplicates = []
+    for i, index1 in enumerate(all_indexes):
+        for j, index2 in enumerate(all_indexes):
+            if i!=j:
+                min_lengt = min(len(index1),len(index2))
+                if index1[:min_lengt]==index2[:min_lengt]:
+                    duplicates.append(index1)
+                    duplicates.append(index2)
+    return list(set(duplicates))
+
+
+def all_pairs_distance(dual_indexes, max_distance):
+    """Brute force reference for find_close_pairs."""
+
+    pairs = []
+    for i, sequence1 in enumerate(dual_indexes):
+        for sequence2 in dual_indexes[i + 1:]:
+            distances = tuple(sum(1 for base1, base2 in zip(read1, read2) if base1 != base2)
+                              for read1, read2 in zip(sequence1.split('-'), sequence2.split('-')))
+            if max(distances) <= max_distance:
+                pairs.append((sequence1, sequence2, distances))
+    return pairs
+
+
+def make_indexes(nr_indexes, collision_rate):
+    indexes = []
+    for i in range(nr_indexes):
+        if indexes and random.random() < collision_rate:
+            indexes.append(random.choice(indexes)[:8] + ''.join(random.choice('ACGT') for j in range(2)))
+        else:
+            indexes.append(''.join(random.choice('ACGT') for j in range(random.choice([8, 10]))))
+    return indexes
+
+
+def mutate(sequence, nr_mismatches):
+    sequence = list(sequence)
+    for position in random.sample([i for i, base in enumerate(sequence) if base != '-'], nr_mismatches):
+        sequence[position] = random.choice('ACGT'.replace(sequence[position], ''))
+    return ''.join(sequence)
+
+
+def make_dual_indexes(nr_indexes, collision_rate):
+    indexes = []
+    for i in range(nr_indexes):
+        if indexes and random.random() < collision_rate:
+            indexes.append(mutate(random.choice(indexes), random.choice([1, 2, 3])))
+        else:
+            indexes.append(''.join(random.choice('ACGT') for j in range(10)) + '-' +
+                           ''.join(random.choice('ACGT') for j in range(10)))
+    return indexes
+
+
+def main(args):
+    random.seed(args.seed)
+    for nr_indexes in args.sizes:
+        indexes = make_indexes(nr_indexes, args.collision_rate)
+        start = time.time()
+        old = nested_loop(indexes)
+        old_time = time.time() - start
+        start = time.time()
+        groups = find_collisions([(sequence, i) for i, sequence in enumerate(indexes)])
+        new_time = time.time() - start
+        new = [sequence for group in groups for sequence in group]
+        assert sorted(old) == sorted(new)
+        print('%5d indexes  nested loop %9.2f ms  sorted sweep %7.2f ms  %4d colliding indexes in %d groups' % (
+            nr_indexes, 1000 * old_time, 1000 * new_time, len(new), len(groups)))
+    for nr_indexes in args.sizes:
+        dual_indexes = make_dual_indexes(nr_indexes, args.collision_rate)
+        start = time.time()
+        old = all_pairs_distance(dual_indexes, args.max_distance)
+        old_time = time.time() - start
+        start = time.time()
+        pairs = find_close_pairs([(sequence, i) for i, sequence in enumerate(dual_indexes)], args.max_distance)
+        new_time = time.time() - start
+        assert sorted(old) == sorted((sequence1, sequence2, distances) for sequence1, i, sequence2, j, distances in pairs)
+        print('%5d dual indexes  all pairs %9.2f ms  segment buckets %7.2f ms  %4d pairs within %d mismatches' % (
+            nr_indexes, 1000 * old_time, 1000 * new_time, len(pairs), args.max_distance))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('-n', dest = 'sizes', type=int, nargs='+', default=[96, 384, 1536],
+                        help='Numbers of indexes to check')
+    parser.add_argument('-r', dest = 'collision_rate', type=float, default=0.02,
+                        help='Fraction of indexes made to extend an earlier index')
+    parser.add_argument('-d', dest = 'max_distance', type=int, default=2,
+                        help='Max mismatches per index read for the mismatch check')
+    parser.add_argument('-s', dest = 'seed', type=int, default=1,
+                        help='Random seed')
+    args = parser.parse_args()
+    main(args)
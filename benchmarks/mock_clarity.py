@@ -0,0 +1,340 @@
+"""Mock Clarity LIMS REST API, served by Flask, for the benchmarks.
+
+The entities are kept as XML elements in a ClarityData, filled with its
+add_* fixture methods: projects, samples, containers and container types,
+artifacts, processes and process types, files and reagent types. The API
+serves what the EPPs use:
+
+- GET /api (versions) and GET of single entities
+- GET of entity lists, filtered on the query parameters the EPPs send:
+  processes by type and input artifact, artifacts by sample and process
+  type, containers and reagent types by name
+- PUT of entities, and POST to <entity>/batch/retrieve and batch/update
+
+The stored URIs are relative (/api/v2/...) and get the base URI of the
+server when served, so fixtures can be added before or after the server is
+started. PUT and batch/update replace the stored XML, so a run sees its own
+writes and the results of runs can be compared. Every request waits latency
+seconds first and is counted per endpoint (see clinical_EPPs.profiling).
+
+    data = ClarityData()
+    server, base = start_server(data, latency=0.02)
+    data.add_sample('ACC1A1', project='ACC1')
+    data.add_artifact('ACC1A1PA1', ['ACC1A1'])
+"""
+
+from collections import Counter, OrderedDict
+from xml.etree import ElementTree
+
+from flask import Flask, Response, request
+from werkzeug.serving import make_server
+
+from clinical_EPPs.profiling import endpoint
+
+import logging
+import threading
+import time
+
+NAMESPACES = OrderedDict([('art', 'http://genologics.com/ri/artifact'),
+                          ('con', 'http://genologics.com/ri/container'),
+                          ('ctp', 'http://genologics.com/ri/containertype'),
+                          ('file', 'http://genologics.com/ri/file'),
+                          ('prc', 'http://genologics.com/ri/process'),
+                          ('prj', 'http://genologics.com/ri/project'),
+                          ('ptp', 'http://genologics.com/ri/processtype'),
+                          ('ri', 'http://genologics.com/ri'),
+                          ('rtp', 'http://genologics.com/ri/reagenttype'),
+                          ('smp', 'http://genologics.com/ri/sample'),
+                          ('udf', 'http://genologics.com/ri/userdefined'),
+                          ('ver', 'http://genologics.com/ri/version')])
+
+# entity kind (URI path) -> (namespace prefix, tag) of its XML
+KINDS = OrderedDict([('artifacts', ('art', 'artifact')),
+                     ('containers', ('con', 'container')),
+                     ('containertypes', ('ctp', 'container-type')),
+                     ('files', ('file', 'file')),
+                     ('processes', ('prc', 'process')),
+                     ('processtypes', ('ptp', 'process-type')),
+                     ('projects', ('prj', 'project')),
+                     ('reagenttypes', ('rtp', 'reagent-type')),
+                     ('samples', ('smp', 'sample'))])
+BATCH_KINDS = ('artifacts', 'containers', 'samples')
+
+for _prefix, _uri in NAMESPACES.items():
+    ElementTree.register_namespace(_prefix, _uri)
+
+
+def _tag(prefix, tag):
+    return '{%s}%s' % (NAMESPACES[prefix], tag)
+
+
+def _sub(parent, tag, text=None, **attrib):
+    element = ElementTree.SubElement(parent, tag, attrib)
+    if text is not None:
+        element.text = text
+    return element
+
+
+def _udf_type(value):
+    if isinstance(value, bool):
+        return 'Boolean', str(value).lower()
+    if isinstance(value, (int, float)):
+        return 'Numeric', repr(value) if isinstance(value, float) else str(value)
+    if hasattr(value, 'isoformat'):
+        return 'Date', value.isoformat()
+    return 'String', value
+
+
+class ClarityData():
+    """The entities of the mock LIMS, kind -> LIMS id -> XML element, and
+    the request counts per endpoint."""
+
+    def __init__(self):
+        self.base = ''
+        self.entities = dict((kind, OrderedDict()) for kind in KINDS)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def uri(self, kind, lims_id):
+        return '/api/v2/%s/%s' % (kind, lims_id)
+
+    def _new(self, kind, lims_id, **attrib):
+        prefix, tag = KINDS[kind]
+        element = ElementTree.Element(_tag(prefix, tag), dict(uri=self.uri(kind, lims_id), **attrib))
+        if kind not in ('containertypes', 'processtypes', 'reagenttypes'):
+            element.set('limsid', lims_id)
+        self.entities[kind][lims_id] = element
+        return element
+
+    def _link(self, parent, tag, kind, lims_id):
+        return _sub(parent, tag, limsid=lims_id, uri=self.uri(kind, lims_id))
+
+    def _udfs(self, element, udfs):
+        for name, value in sorted((udfs or {}).items()):
+            udf_type, text = _udf_type(value)
+            _sub(element, _tag('udf', 'field'), text, name=name, type=udf_type)
+
+    def add_project(self, lims_id, name=None):
+        _sub(self._new('projects', lims_id), 'name', name or lims_id)
+
+    def add_sample(self, lims_id, name=None, project=None, udfs=None):
+        sample = self._new('samples', lims_id)
+        _sub(sample, 'name', name or lims_id)
+        if project:
+            if project not in self.entities['projects']:
+                self.add_project(project)
+            self._link(sample, 'project', 'projects', project)
+        self._udfs(sample, udfs)
+
+    def add_containertype(self, lims_id, name, x_size=12, y_size=8):
+        container_type = self._new('containertypes', lims_id, name=name)
+        for dimension, size in [('x-dimension', x_size), ('y-dimension', y_size)]:
+            node = _sub(container_type, dimension)
+            _sub(node, 'is-alpha', 'false' if dimension[0] == 'x' else 'true')
+            _sub(node, 'offset', '1' if dimension[0] == 'x' else '0')
+            _sub(node, 'size', str(size))
+
+    def add_container(self, lims_id, name=None, container_type=None):
+        """A container. container_type is the id of a container type, by
+        default a 96 well plate."""
+
+        if not container_type:
+            container_type = '1'
+            if '1' not in self.entities['containertypes']:
+                self.add_containertype('1', '96 well plate')
+        container = self._new('containers', lims_id)
+        _sub(container, 'name', name or lims_id)
+        node = self._link(container, 'type', 'containertypes', container_type)
+        node.set('name', self.entities['containertypes'][container_type].get('name'))
+        del node.attrib['limsid']
+        _sub(container, 'occupied-wells', '0')
+        _sub(container, 'state', 'Populated')
+
+    def add_artifact(self, lims_id, samples, name=None, output_type='Analyte', container=None, well=None,
+                     parent_process=None, qc_flag='UNKNOWN', udfs=None, reagent_labels=(), files=()):
+        """An artifact of samples (ids). It is placed in well of container,
+        and added to the placements of the container."""
+
+        art = self._new('artifacts', lims_id)
+        _sub(art, 'name', name or lims_id)
+        _sub(art, 'type', 'Analyte' if output_type == 'Analyte' else 'ResultFile')
+        _sub(art, 'output-type', output_type)
+        if parent_process:
+            self._link(art, 'parent-process', 'processes', parent_process)
+        if container:
+            location = _sub(art, 'location')
+            self._link(location, 'container', 'containers', container)
+            _sub(location, 'value', well)
+            placement = self._link(self.entities['containers'][container], 'placement', 'artifacts', lims_id)
+            _sub(placement, 'value', well)
+            occupied = self.entities['containers'][container].find('occupied-wells')
+            occupied.text = str(int(occupied.text) + 1)
+        _sub(art, 'working-flag', 'true')
+        _sub(art, 'qc-flag', qc_flag)
+        for sample in samples:
+            self._link(art, 'sample', 'samples', sample)
+        for label in reagent_labels:
+            _sub(art, 'reagent-label', name=label)
+        for file_id in files:
+            self._link(art, _tag('file', 'file'), 'files', file_id)
+        self._udfs(art, udfs)
+
+    def add_file(self, lims_id, content_location, attached_to=None):
+        file_node = self._new('files', lims_id)
+        if attached_to:
+            _sub(file_node, 'attached-to', self.uri('artifacts', attached_to))
+        _sub(file_node, 'content-location', content_location)
+        _sub(file_node, 'original-location', content_location.split('/')[-1])
+        _sub(file_node, 'is-published', 'false')
+
+    def add_processtype(self, lims_id, name):
+        self._new('processtypes', lims_id, name=name)
+
+    def add_process(self, lims_id, process_type, io_maps, date_run=None, udfs=None):
+        """A process of type process_type (a name). io_maps is a list of
+        (input artifact id, output artifact id or None, output-generation-type).
+        The output-type of the outputs is taken from the artifacts."""
+
+        type_ids = dict((element.get('name'), type_id)
+                        for type_id, element in self.entities['processtypes'].items())
+        if process_type not in type_ids:
+            type_ids[process_type] = str(len(type_ids) + 1)
+            self.add_processtype(type_ids[process_type], process_type)
+        process = self._new('processes', lims_id)
+        _sub(process, 'type', process_type, uri=self.uri('processtypes', type_ids[process_type]))
+        if date_run:
+            _sub(process, 'date-run', date_run)
+        for input_id, output_id, generation_type in io_maps:
+            io_map = _sub(process, 'input-output-map')
+            node = self._link(io_map, 'input', 'artifacts', input_id)
+            parent = self.entities['artifacts'].get(input_id)
+            if parent is not None and parent.find('parent-process') is not None:
+                _sub(node, 'parent-process', uri=parent.find('parent-process').get('uri'))
+            if output_id:
+                node = self._link(io_map, 'output', 'artifacts', output_id)
+                node.set('output-generation-type', generation_type)
+                node.set('output-type', self.entities['artifacts'][output_id].findtext('output-type'))
+        self._udfs(process, udfs)
+
+    def add_reagenttype(self, lims_id, name, sequence, category='Illumina IDT'):
+        reagent_type = self._new('reagenttypes', lims_id, name=name)
+        special_type = _sub(reagent_type, 'special-type', name='Index')
+        _sub(special_type, 'attribute', name='Sequence', value=sequence)
+        _sub(reagent_type, 'reagent-category', category)
+
+    def udfs(self, kind, lims_id):
+        """name -> text of the UDFs of an entity, to compare states after runs."""
+
+        return dict((field.get('name'), field.text) for field in
+                    self.entities[kind][lims_id].findall(_tag('udf', 'field')))
+
+    def query(self, kind, args):
+        """The entities of kind matching the query parameters."""
+
+        entities = self.entities[kind]
+        if kind == 'processes':
+            types = args.getlist('type')
+            inputs = set(args.getlist('inputartifactlimsid'))
+            return [(lims_id, element) for lims_id, element in entities.items()
+                    if (not types or element.findtext('type') in types) and
+                    (not inputs or inputs & set(node.get('limsid') for node in element.iter('input')))]
+        if kind == 'artifacts':
+            samples = set(args.getlist('samplelimsid'))
+            types = args.getlist('process-type')
+            qc_flags = args.getlist('qc-flag')
+            matches = []
+            for lims_id, element in entities.items():
+                if samples and not samples & set(node.get('limsid') for node in element.findall('sample')):
+                    continue
+                if qc_flags and element.findtext('qc-flag') not in qc_flags:
+                    continue
+                if types:
+                    parent = element.find('parent-process')
+                    process = self.entities['processes'].get(parent.get('limsid')) if parent is not None else None
+                    if process is None or process.findtext('type') not in types:
+                        continue
+                matches.append((lims_id, element))
+            return matches
+        names = args.getlist('name')
+        return [(lims_id, element) for lims_id, element in entities.items()
+                if not names or (element.findtext('name') or element.get('name')) in names]
+
+
+def create_app(data, latency=0):
+    """The Flask app serving data, waiting latency seconds per request."""
+
+    app = Flask(__name__)
+
+    def _xml(element):
+        body = ElementTree.tostring(element).replace(b' uri="/api/', (' uri="%s/api/' % data.base).encode())
+        return Response(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>' + body,
+                        mimetype='application/xml')
+
+    @app.before_request
+    def count_and_wait():
+        with data.lock:
+            name = endpoint(request.method, request.url)[0]
+            data.requests[name if name.strip() != request.method else name + 'versions'] += 1
+        time.sleep(latency)
+
+    @app.route('/api')
+    def versions():
+        root = ElementTree.Element(_tag('ver', 'versions'))
+        _sub(root, 'version', major='v2', minor='0', uri='/api/v2')
+        return _xml(root)
+
+    @app.route('/api/v2/<kind>', methods=['GET'])
+    def entity_list(kind):
+        prefix, tag = KINDS[kind]
+        root = ElementTree.Element(_tag(prefix, kind))
+        for lims_id, element in data.query(kind, request.args):
+            node = _sub(root, tag.split('-')[-1] if kind == 'processtypes' else tag, uri=element.get('uri'))
+            if element.get('limsid'):
+                node.set('limsid', lims_id)
+            if element.get('name'):
+                node.set('name', element.get('name'))
+        return _xml(root)
+
+    @app.route('/api/v2/<kind>/<lims_id>', methods=['GET', 'PUT'])
+    def entity(kind, lims_id):
+        if lims_id not in data.entities.get(kind, {}):
+            return Response('Not found: %s/%s' % (kind, lims_id), status=404)
+        if request.method == 'PUT':
+            with data.lock:
+                data.entities[kind][lims_id] = ElementTree.fromstring(request.get_data())
+        return _xml(data.entities[kind][lims_id])
+
+    @app.route('/api/v2/<kind>/batch/<action>', methods=['POST'])
+    def batch(kind, action):
+        if kind not in BATCH_KINDS:
+            return Response('No batch endpoint for ' + kind, status=404)
+        root = ElementTree.fromstring(request.get_data())
+        prefix = KINDS[kind][0]
+        if action == 'retrieve':
+            details = ElementTree.Element(_tag(prefix, 'details'))
+            for link in root.iter('link'):
+                lims_id = link.get('uri').split('?')[0].rstrip('/').split('/')[-1]
+                if lims_id in data.entities[kind]:
+                    details.append(data.entities[kind][lims_id])
+            return _xml(details)
+        links = ElementTree.Element(_tag('ri', 'links'))
+        with data.lock:
+            for node in list(root):
+                data.entities[kind][node.get('limsid')] = node
+                _sub(links, 'link', uri=data.uri(kind, node.get('limsid')), rel=kind)
+        return _xml(links)
+
+    return app
+
+
+def start_server(data, latency=0, port=0):
+    """Serve data in a thread on port, by default a free one. Sets
+    data.base and returns the server and its base URI."""
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, create_app(data, latency), threaded=True)
+    data.base = 'http://127.0.0.1:%s' % server.server_port
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, data.base
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+
+from genologics.entities import Sample
+from clinical_EPPs.lims_client import PooledLims, LimsSession
+from clinical_EPPs.parallel import pmap
+from session_pool import ThreadingServer
+
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from urlparse import urlparse, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlparse, parse_qs
+
+
+DESC = """Wall clock benchmark of per sample LIMS loops run serially and with
+clinical_EPPs.parallel.pmap.
+
+Starts a local mock LIMS with a fixed latency per request, where every sample
+has a number of sequencing artifacts, each from its own process. Two per
+sample functions are timed with 1 (serial) and more workers:
+
+reads    the passed reads of a sample, as reads_aggregation LimsReads: one
+         artifact query and one GET per artifact
+amount   the udf of the latest artifact of a sample, as make_kapa_txt
+         get_amount: one artifact query, and one GET per artifact and per
+         parent process
+
+The results of all worker counts are checked to be equal to the serial ones.
+"""
+
+NS = ('xmlns:art="http://genologics.com/ri/artifact" '
+      'xmlns:udf="http://genologics.com/ri/userdefined" '
+      'xmlns:prc="http://genologics.com/ri/process"')
+
+ARTIFACT = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<art:artifact %(ns)s limsid="%(id)s" uri="%(base)s/api/v2/artifacts/%(id)s">'
+            '<name>%(sample)s</name><type>Analyte</type><output-type>Analyte</output-type>'
+            '<parent-process limsid="%(process)s" uri="%(base)s/api/v2/processes/%(process)s"/>'
+            '<qc-flag>%(qc_flag)s</qc-flag>'
+            '<sample limsid="%(sample)s" uri="%(base)s/api/v2/samples/%(sample)s"/>'
+            '<udf:field name="# Reads" type="Numeric">%(reads)s</udf:field>'
+            '<udf:field name="Amount needed (ng)" type="Numeric">%(amount)s</udf:field>'
+            '</art:artifact>')
+
+PROCESS = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<prc:process %(ns)s limsid="%(id)s" uri="%(base)s/api/v2/processes/%(id)s">'
+           '<type>Sequencing</type><date-run>2019-%(month)02d-%(day)02d</date-run></prc:process>')
+
+
+def make_handler(base, latency):
+    """Artifacts are named <sample>-<lane> and their processes 24-<lane>-<sample>."""
+
+    class MockLimsHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def _artifact(self, art_id):
+            sample, lane = art_id.rsplit('-', 1)
+            number = sum(ord(c) for c in art_id)
+            return ARTIFACT % dict(ns=NS, base=base, id=art_id, sample=sample,
+                                   process='24-%s-%s' % (lane, sample),
+                                   qc_flag='FAILED' if number % 7 == 0 else 'PASSED',
+                                   reads=number * 1000, amount=[10, 50, 250][number % 3])
+
+        def do_GET(self):
+            time.sleep(latency)
+            url = urlparse(self.path)
+            parts = url.path.rstrip('/').split('/')
+            if parts[-1] == 'artifacts':
+                sample = parse_qs(url.query)['samplelimsid'][0]
+                body = '<art:artifacts %s>%s</art:artifacts>' % (NS, ''.join(
+                    '<artifact limsid="%s-%s" uri="%s/api/v2/artifacts/%s-%s"/>' % (sample, lane, base, sample, lane)
+                    for lane in range(1, self.server.lanes + 1)))
+            elif parts[-2] == 'artifacts':
+                body = self._artifact(parts[-1])
+            else:
+                lane, sample = parts[-1].split('-', 2)[1:]
+                body = PROCESS % dict(ns=NS, base=base, id=parts[-1], month=int(lane), day=len(sample))
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return MockLimsHandler
+
+
+def start_server(latency, lanes):
+    server = ThreadingServer(('127.0.0.1', 0), None)
+    server.lanes = lanes
+    base = 'http://127.0.0.1:%s' % server.server_address[1]
+    server.RequestHandlerClass = make_handler(base, latency)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, base
+
+
+def passed_reads(lims, sample):
+    total_reads = 0.0
+    nr_lanes = 0
+    for art in lims.get_artifacts(samplelimsid=sample.id, process_type=['Sequencing']):
+        if art.qc_flag == 'PASSED' and '# Reads' in art.udf:
+            total_reads += float(art.udf.get('# Reads'))
+            nr_lanes += 1
+    return total_reads, nr_lanes
+
+
+def latest_amount(lims, sample):
+    amount_arts = lims.get_artifacts(samplelimsid=sample.id, process_type=['Sequencing'])
+    amount_arts = [a for a in amount_arts if a.output_type == 'Analyte']
+    amount_art = amount_arts[0]
+    for art in amount_arts:
+        if art.parent_process.date_run >= amount_art.parent_process.date_run:
+            amount_art = art
+    return amount_art.udf.get('Amount needed (ng)')
+
+
+def main(args):
+    server, base = start_server(args.latency / 1000.0, args.lanes)
+    for name, func in [('reads', passed_reads), ('amount', latest_amount)]:
+        serial = None
+        for workers in [1] + args.workers:
+            # A new Lims for every run, so that no entity is cached
+            lims = PooledLims(base, 'user', 'password', session=LimsSession(pool_size=max(args.workers)))
+            samples = [Sample(lims, id='ACC%03dA%d' % (i // 10, i % 10)) for i in range(args.samples)]
+            start = time.time()
+            results = pmap(lambda sample: func(lims, sample), samples, workers)
+            seconds = time.time() - start
+            lims.request_session.close()
+            if serial is None:
+                serial = (results, seconds)
+            assert results == serial[0], (name, workers)
+            print('%-7s %4d samples  %2d workers  %7.2f s  speedup %5.1f' % (
+                name, args.samples, workers, seconds, serial[1] / seconds))
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('-n', dest = 'samples', type=int, default=96,
+                        help='Number of samples')
+    parser.add_argument('-k', dest = 'lanes', type=int, default=2,
+                        help='Number of sequencing artifacts per sample')
+    parser.add_argument('-l', dest = 'latency', type=float, default=20,
+                        help='Latency in ms added by the mock server to each request')
+    parser.add_argument('-w', dest = 'workers', type=int, nargs='+', default=[4, 8, 16],
+                        help='Numbers of workers to compare with the serial loop')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+from __future__ import division
+from argparse import ArgumentParser
+
+from clinical_EPPs.plate_layout import get_layout
+from clinical_EPPs.qpcr import DilutionPlate
+
+from statistics import mean
+from StringIO import StringIO
+
+import copy
+import numpy
+import random
+import time
+
+DESC = """Benchmark of the whole plate qPCR dilution check in clinical_EPPs.qpcr
+against the former per sample PerArtifact checks of qPCR_dilution.
+
+Random 384 well plates are made with the default plate layout: 32 samples
+with triplicates of three dilutions. Some replicates are made outlyers, some
+are missing, and some samples get dilution series out of range. Both methods
+are timed, and checked to give the same removed replicates, failures, log
+messages and concentrations for every sample.
+"""
+
+SIZE_BP = 470
+
+
+class PerArtifact():
+    """The per sample checks of qPCR_dilution before the plate engine,
+    without the artifact."""
+
+    def __init__(self, dilution_data, well, log):
+        self.log = log
+        self.dilution_data = dilution_data
+        self.size_bp = SIZE_BP
+        self.well = well
+        self.Cq = { '1E03' : self.dilution_data[self.well]['Cq']['1E03'],
+                    '2E03' : self.dilution_data[self.well]['Cq']['2E03'],
+                    '1E04' : self.dilution_data[self.well]['Cq']['1E04']}
+        self.index = {'1E03' : None, '2E03' : None, '1E04' : None}
+        self.poped_dilutes = {'1E03' : None, '2E03' : None, '1E04' : None}
+        self.failed_sample = False
+
+    def check_dilution_range(self):
+        for dil, values in self.Cq.items():
+            error_msg = 'To vide range of values for dilution: ' + dil + ' : ' + str(values)
+            array = numpy.array(self.Cq[dil])
+            diff_from_mean = numpy.absolute(array - mean(array))
+            while max(self.Cq[dil])-min(self.Cq[dil])> 0.4:
+                ind = self.index[dil]
+                if type(ind)==int:
+                    self.log.write(error_msg)
+                    self.failed_sample = True
+                    self.index[dil] = 'Fail'
+                    return
+                else:
+                    ind = numpy.argmax(diff_from_mean)
+                    self.index[dil] = int(ind)
+                    self.poped_dilutes[dil] = self.Cq[dil].pop(ind)
+                    array = numpy.array(self.Cq[dil])
+                    diff_from_mean = numpy.absolute(array - mean(array))
+
+    def check_distance_find_outlyer(self):
+        D1_in_range, D2_in_range = self._check_distance()
+        while not (D1_in_range and D2_in_range):
+            self._find_outlyer(D1_in_range, D2_in_range)
+            if self.failed_sample:
+                return
+            for dilute, ind in self.index.items():
+                if type(ind)==int and len(self.Cq[dilute])==3:
+                    self.poped_dilutes[dilute] = self.Cq[dilute].pop(ind)
+            D1_in_range, D2_in_range = self._check_distance()
+
+    def concentration(self):
+        for dilute, ind in self.index.items():
+            if type(ind)==int:
+                self.dilution_data[self.well]['SQ'][dilute].pop(ind)
+        SQ_1E03 = mean(self.dilution_data[self.well]['SQ']['1E03'])
+        SQ_2E03 = mean(self.dilution_data[self.well]['SQ']['2E03'])
+        SQ_1E04 = mean(self.dilution_data[self.well]['SQ']['1E04'])
+        orig_conc = (SQ_1E03*1000+SQ_2E03*2000+SQ_1E04*10000)/3
+        return orig_conc*(452/self.size_bp)
+
+    def _error_log_msg(self, dil):
+        self.log.write(dil + ' Measurements : ' + str(self.Cq[dil]) + '\n')
+        self.log.write('Removed measurement: ' + str(self.poped_dilutes[dil]) + '\n')
+        self.log.write('One outlyer removed, but distance still to big. \n\n')
+
+    def _check_distance(self):
+        D1 = mean(self.Cq['1E04'])-mean(self.Cq['1E03'])
+        D1_in_range = 2.5 < D1 < 5
+        D2 = mean(self.Cq['2E03'])-mean(self.Cq['1E03'])
+        D2_in_range = 0.7 < D2 < 1.5
+        return D1_in_range, D2_in_range
+
+    def _find_outlyer(self, D1_in_range, D2_in_range):
+        control_1E03 = False
+        if not D1_in_range:
+            array = numpy.array(self.Cq['1E03'])
+            diff_from_mean_1E03 = numpy.absolute(array - mean(array))
+            outlyer_1E03 = max(diff_from_mean_1E03)
+            array = numpy.array(self.Cq['1E04'])
+            diff_from_mean_1E04 = numpy.absolute(array - mean(array))
+            outlyer_1E04 = max(diff_from_mean_1E04)
+            if outlyer_1E03 > outlyer_1E04:
+                ind = self.index['1E03']
+                if type(ind)==int:
+                    self._error_log_msg('1E03')
+                    self.failed_sample = True
+                    self.index['1E03'] = 'Fail'
+                    return
+                else:
+                    control_1E03 = True
+                    self.index['1E03'] = int(numpy.argmax(diff_from_mean_1E03))
+            else:
+                ind = self.index['1E04']
+                if type(ind)==int:
+                    self._error_log_msg('1E04')
+                    self.failed_sample = True
+                    self.index['1E04'] = 'Fail'
+                    return
+                else:
+                    self.index['1E04'] = int(numpy.argmax(diff_from_mean_1E04))
+        if not D2_in_range:
+            array = numpy.array(self.Cq['2E03'])
+            diff_from_mean_2E03 = numpy.absolute(array - numpy.median(array))/numpy.median(array).tolist()
+            outlyer_2E03 = max(diff_from_mean_2E03)
+            array = numpy.array(self.Cq['1E03'])
+            diff_from_mean_1E03 = numpy.absolute(array - numpy.median(array))/numpy.median(array).tolist()
+            outlyer_1E03 = max(diff_from_mean_1E03)
+            if outlyer_2E03 > outlyer_1E03:
+                ind = self.index['2E03']
+                if type(ind)==int:
+                    self._error_log_msg('2E03')
+                    self.failed_sample = True
+                    self.index['2E03'] = 'Fail'
+                    return
+                else:
+                    self.index['2E03'] = int(numpy.argmax(diff_from_mean_2E03))
+            else:
+                if self.index['1E03'] is not None:
+                    if control_1E03 and self.index['1E03'] != numpy.argmax(outlyer_1E03):
+                        self.log.write('Distance to big. Conflicting outlyers. ')
+                        self.failed_sample = True
+                        self.index['1E03'] = 'Fail'
+                        return
+                    elif not control_1E03:
+                        self._error_log_msg('1E03')
+                        self.failed_sample = True
+                        self.index['1E03'] = 'Fail'
+                        return
+                else:
+                    self.index['1E03'] = int(numpy.argmax(diff_from_mean_1E03))
+
+
+def per_artifact(dilution_data, wells):
+    """(index, poped, Cq, failed, error, log, concentration) per well."""
+
+    results = []
+    for well in wells:
+        log = StringIO()
+        index = poped = Cq = concentration = None
+        failed = error = False
+        try:
+            PA = PerArtifact(dilution_data, well, log)
+            PA.check_dilution_range()
+            PA.check_distance_find_outlyer()
+            index, poped, Cq, failed = PA.index, PA.poped_dilutes, PA.Cq, PA.failed_sample
+            if not failed:
+                concentration = PA.concentration()
+        except Exception:
+            error = True
+        results.append((index, poped, Cq, failed, error, log.getvalue(), concentration))
+    return results
+
+
+def whole_plate(dilution_data, wells):
+    plate = DilutionPlate(dilution_data, wells)
+    plate.check_dilution_range()
+    plate.check_distance_find_outlyer()
+    results = []
+    for result in plate.results(SIZE_BP):
+        if result.error:
+            results.append((None, None, None, False, True, result.log, None))
+        else:
+            results.append((result.index, result.poped_dilutes, result.Cq, result.failed_sample,
+                            False, result.log, result.concentration))
+    return results
+
+
+def make_plate(plate_nr, outlyer_rate, missing_rate):
+    """dilution_data of a random plate, like QpcrDilution.make_dilution_data."""
+
+    dilution_data = {}
+    base = {}
+    layout = get_layout()
+    for sample_well, d in zip(layout.sample_well, layout.dilution):
+        if d < 0:
+            continue
+        dilut = layout.dilutions[d]
+        orwell = '%s-%d' % (sample_well, plate_nr)
+        if orwell not in base:
+            shift = random.choice([0, 0, 0, 0, 0, 0, 0, 0, 0.6, 1.5])
+            base[orwell] = (random.uniform(12, 30), random.uniform(0.8, 1.4) + shift / 2,
+                            random.uniform(2.5, 5) + shift)
+        start, step_2E03, step_1E04 = base[orwell]
+        Cq = start + {'1E03': 0, '2E03': step_2E03, '1E04': step_1E04}[dilut] + random.gauss(0, 0.08)
+        if random.random() < outlyer_rate:
+            Cq += random.choice([-1, 1]) * random.uniform(0.2, 2)
+        if random.random() < missing_rate:
+            continue
+        Cq = round(Cq, 3)
+        SQ = 10 ** (-(Cq - 35) / 3.32) * 1e-15
+        data = dilution_data.setdefault(orwell, {'SQ': {'1E03': [], '2E03': [], '1E04': []},
+                                                 'Cq': {'1E03': [], '2E03': [], '1E04': []}})
+        data['SQ'][dilut].append(SQ)
+        data['Cq'][dilut].append(Cq)
+    return dilution_data
+
+
+def main(args):
+    random.seed(args.seed)
+    for nr_plates in args.sizes:
+        dilution_data = {}
+        for plate_nr in range(nr_plates):
+            dilution_data.update(make_plate(plate_nr, args.outlyer_rate, args.missing_rate))
+        wells = sorted(dilution_data) + ['missing']
+        old_data = copy.deepcopy(dilution_data)
+        start = time.time()
+        old = per_artifact(old_data, wells)
+        old_time = time.time() - start
+        start = time.time()
+        new = whole_plate(dilution_data, wells)
+        new_time = time.time() - start
+        for well, old_result, new_result in zip(wells, old, new):
+            assert old_result == new_result, (well, old_result, new_result)
+        print('%3d plates %5d samples  per sample %8.2f ms  whole plate %7.2f ms  %4d failed  %4d with removed replicates' % (
+            nr_plates, len(wells), 1000 * old_time, 1000 * new_time,
+            sum(1 for result in new if result[3] or result[4]),
+            sum(1 for result in new if result[0] and any(type(ind) == int for ind in result[0].values()))))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('-n', dest = 'sizes', type=int, nargs='+', default=[1, 3, 12],
+                        help='Numbers of 384 well plates to check')
+    parser.add_argument('-o', dest = 'outlyer_rate', type=float, default=0.05,
+                        help='Fraction of replicates made outlyers')
+    parser.add_argument('-m', dest = 'missing_rate', type=float, default=0.02,
+                        help='Fraction of replicates missing')
+    parser.add_argument('-s', dest = 'seed', type=int, default=1,
+                        help='Random seed')
+    args = parser.parse_args()
+    main(args)
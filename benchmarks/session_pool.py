@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+
+from genologics.lims import Lims
+from clinical_EPPs.lims_client import PooledLims, LimsSession
+
+import threading
+import time
+import sys
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+
+DESC = """Benchmark of LIMS round-trip latency with and without the pooled
+keep-alive session from clinical_EPPs.lims_client.
+
+Starts a local mock LIMS serving one artifact and times GETs and PUTs of it,
+with a configurable cost for opening a new connection,
+first with genologics.lims.Lims (PUT opens a new connection per request) and
+then with clinical_EPPs.lims_client.PooledLims.
+"""
+
+ARTIFACT = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<art:artifact xmlns:art="http://genologics.com/ri/artifact" '
+            'xmlns:udf="http://genologics.com/ri/userdefined" limsid="2-1" '
+            'uri="%(base)s/api/v2/artifacts/2-1"><name>sample</name>'
+            '<udf:field name="Concentration" type="Numeric">1.0</udf:field>'
+            '</art:artifact>')
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    """connect_latency is added to every new connection, as a stand in for
+    the TCP and TLS handshakes with the real LIMS server."""
+
+    daemon_threads = True
+    connect_latency = 0
+
+    def get_request(self):
+        request = HTTPServer.get_request(self)
+        time.sleep(self.connect_latency)
+        return request
+
+
+def make_handler(base, latency):
+    class MockLimsHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def _respond(self):
+            length = int(self.headers.get('content-length') or 0)
+            if length:
+                self.rfile.read(length)
+            time.sleep(latency)
+            body = (ARTIFACT % {'base': base}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = _respond
+        do_PUT = _respond
+        do_POST = _respond
+
+        def log_message(self, *args):
+            pass
+    return MockLimsHandler
+
+
+def start_server(latency, connect_latency):
+    server = ThreadingServer(('127.0.0.1', 0), None)
+    server.connect_latency = connect_latency
+    base = 'http://127.0.0.1:%s' % server.server_address[1]
+    server.RequestHandlerClass = make_handler(base, latency)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, base
+
+
+def time_requests(lims, method, nr_requests):
+    uri = lims.get_uri('artifacts', '2-1')
+    data = ARTIFACT % {'base': lims.baseuri.rstrip('/')}
+    times = []
+    for i in range(nr_requests):
+        start = time.time()
+        if method == 'GET':
+            lims.get(uri)
+        else:
+            lims.put(uri, data)
+        times.append(time.time() - start)
+    return times
+
+
+def report(name, method, times):
+    times = sorted(times)
+    print('%-12s %-4s n=%-5d mean %7.2f ms  median %7.2f ms  p95 %7.2f ms  total %7.2f s' % (
+        name, method, len(times), 1000 * sum(times) / len(times),
+        1000 * times[len(times) // 2], 1000 * times[int(len(times) * 0.95)], sum(times)))
+
+
+def main(args):
+    server, base = start_server(args.latency / 1000.0, args.connect_latency / 1000.0)
+    clients = [('Lims', Lims(base, 'user', 'password')),
+               ('PooledLims', PooledLims(base, 'user', 'password',
+                                         session=LimsSession(pool_size=args.pool_size)))]
+    for method in ['GET', 'PUT']:
+        for name, lims in clients:
+            report(name, method, time_requests(lims, method, args.requests))
+    for name, lims in clients:
+        lims.request_session.close()
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('-n', dest = 'requests', type=int, default=500,
+                        help='Number of requests per client and method')
+    parser.add_argument('-l', dest = 'latency', type=float, default=0,
+                        help='Latency in ms added by the mock server to each request')
+    parser.add_argument('-c', dest = 'connect_latency', type=float, default=20,
+                        help='Latency in ms added to each new connection (handshakes)')
+    parser.add_argument('-s', dest = 'pool_size', type=int, default=10,
+                        help='Connection pool size of the pooled session')
+    args = parser.parse_args()
+    main(args)
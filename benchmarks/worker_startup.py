@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+from argparse import ArgumentParser
+
+from mock_clarity import ClarityData, start_server
+
+import epp_suite
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+DESC = """Benchmark of EPP runs started as new Python processes against runs in
+the EPP worker daemon (EPPs/epp_worker.py) through epp_client.py.
+
+The fixtures of the EPPs are those of benchmarks/epp_suite.py, on a mock
+Clarity LIMS. Each EPP is run a number of times both ways, and the median
+wall time of a run is reported. The exit status and the last line of stderr
+of the runs in the worker are checked to be the same as the direct ones.
+"""
+
+EPPS = os.path.join(epp_suite.REPO, 'EPPs')
+
+
+def run(argv, tmp, env):
+    start = time.time()
+    process = subprocess.Popen(argv, cwd=tmp, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+    return time.time() - start, process.returncode, lines[-1] if lines else ''
+
+
+def start_worker(tmp, env):
+    worker = subprocess.Popen([sys.executable, os.path.join(EPPS, 'epp_worker.py')], cwd=tmp, env=env,
+                              stderr=open(os.path.join(tmp, 'worker.log'), 'w'))
+    socket_path = os.path.join(tmp, '.cache', 'clinical_EPPs', 'epp_worker.sock')
+    start = time.time()
+    while not os.path.exists(socket_path):
+        if worker.poll() is not None or time.time() - start > 60:
+            sys.exit('The EPP worker did not start, see ' + os.path.join(tmp, 'worker.log'))
+        time.sleep(0.05)
+    return worker, time.time() - start
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(args):
+    tmp = tempfile.mkdtemp(prefix='worker_startup_')
+    data = ClarityData()
+    server, base = start_server(data, args.latency / 1000.0)
+    epp_suite.write_config(tmp, base)
+    env = dict(os.environ, HOME=tmp, PYTHONPATH=epp_suite.REPO)
+    epp_args = {}
+    for epp in args.epps:
+        random.seed(args.seed)
+        data.entities = ClarityData().entities
+        epp_args[epp] = epp_suite.FIXTURES[epp](data, tmp, args.samples)
+        epp_args[epp] = (epp_args[epp], dict((kind, dict(entities)) for kind, entities in data.entities.items()))
+    worker, startup = start_worker(tmp, env)
+    print('EPP worker started in %.2f s' % startup)
+    print('%-20s %9s %9s %9s' % ('EPP', 'direct s', 'worker s', 'speedup'))
+    try:
+        for epp in args.epps:
+            argv, entities = epp_args[epp]
+            data.entities = entities
+            direct = [run([sys.executable, os.path.join(EPPS, epp + '.py')] + argv, tmp, env)
+                      for i in range(args.runs)]
+            in_worker = [run([sys.executable, os.path.join(EPPS, 'epp_client.py'), epp + '.py'] + argv, tmp, env)
+                         for i in range(args.runs)]
+            assert set(result[1:] for result in direct) == set(result[1:] for result in in_worker), (
+                direct[0], in_worker[0])
+            direct_seconds = median([result[0] for result in direct])
+            worker_seconds = median([result[0] for result in in_worker])
+            print('%-20s %9.3f %9.3f %9.1f' % (epp, direct_seconds, worker_seconds, direct_seconds / worker_seconds))
+    finally:
+        worker.terminate()
+        worker.wait()
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('-e', dest = 'epps', nargs='+', choices=list(epp_suite.FIXTURES),
+                        default=['set_qc', 'calc_volumes_nova', 'reads_aggregation', 'make_placement_map'],
+                        help='EPPs to run')
+    parser.add_argument('-n', dest = 'samples', type=int, default=8,
+                        help='Number of samples')
+    parser.add_argument('-r', dest = 'runs', type=int, default=5,
+                        help='Number of runs of each EPP each way')
+    parser.add_argument('-l', dest = 'latency', type=float, default=1,
+                        help='Latency in ms added by the mock server to each request')
+    parser.add_argument('-s', dest = 'seed', type=int, default=1,
+                        help='Random seed of the fixtures')
+    args = parser.parse_args()
+    main(args)
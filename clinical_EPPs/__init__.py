@@ -1,384 +1,37 @@
-WELL_TRANSFORMER = {"A01":{"well":"A:1","dilut":"1E03"},
-"A02":{"well":"A:1","dilut":"1E03"},
-"A03":{"well":"A:2","dilut":"1E03"},
-"A04":{"well":"A:2","dilut":"1E03"},
-"A05":{"well":"A:3","dilut":"1E03"},
-"A06":{"well":"A:3","dilut":"1E03"},
-"A07":{"well":"A:4","dilut":"1E03"},
-"A08":{"well":"A:4","dilut":"1E03"},
-"A09":{"well":"A:1","dilut":"2E03"},
-"A10":{"well":"A:1","dilut":"2E03"},
-"A11":{"well":"A:2","dilut":"2E03"},
-"A12":{"well":"A:2","dilut":"2E03"},
-"A13":{"well":"A:3","dilut":"2E03"},
-"A14":{"well":"A:3","dilut":"2E03"},
-"A15":{"well":"A:4","dilut":"2E03"},
-"A16":{"well":"A:4","dilut":"2E03"},
-"A17":{"well":"A:1","dilut":"1E04"},
-"A18":{"well":"A:1","dilut":"1E04"},
-"A19":{"well":"A:2","dilut":"1E04"},
-"A20":{"well":"A:2","dilut":"1E04"},
-"A21":{"well":"A:3","dilut":"1E04"},
-"A22":{"well":"A:3","dilut":"1E04"},
-"A23":{"well":"A:4","dilut":"1E04"},
-"A24":{"well":"A:4","dilut":"1E04"},
-"B01":{"well":"A:1","dilut":"1E03"},
-"B02":{"well":"Std:1","dilut":""},
-"B03":{"well":"A:2","dilut":"1E03"},
-"B04":{"well":"Std:1","dilut":""},
-"B05":{"well":"A:3","dilut":"1E03"},
-"B06":{"well":"Std:1","dilut":""},
-"B07":{"well":"A:4","dilut":"1E03"},
-"B08":{"well":"","dilut":""},
-"B09":{"well":"A:1","dilut":"2E03"},
-"B10":{"well":"","dilut":""},
-"B11":{"well":"A:2","dilut":"2E03"},
-"B12":{"well":"","dilut":""},
-"B13":{"well":"A:3","dilut":"2E03"},
-"B14":{"well":"","dilut":""},
-"B15":{"well":"A:4","dilut":"2E03"},
-"B16":{"well":"","dilut":""},
-"B17":{"well":"A:1","dilut":"1E04"},
-"B18":{"well":"","dilut":""},
-"B19":{"well":"A:2","dilut":"1E04"},
-"B20":{"well":"","dilut":""},
-"B21":{"well":"A:3","dilut":"1E04"},
-"B22":{"well":"","dilut":""},
-"B23":{"well":"A:4","dilut":"1E04"},
-"B24":{"well":"","dilut":""},
-"C01":{"well":"B:1","dilut":"1E03"},
-"C02":{"well":"B:1","dilut":"1E03"},
-"C03":{"well":"B:2","dilut":"1E03"},
-"C04":{"well":"B:2","dilut":"1E03"},
-"C05":{"well":"B:3","dilut":"1E03"},
-"C06":{"well":"B:3","dilut":"1E03"},
-"C07":{"well":"B:4","dilut":"1E03"},
-"C08":{"well":"B:4","dilut":"1E03"},
-"C09":{"well":"B:1","dilut":"2E03"},
-"C10":{"well":"B:1","dilut":"2E03"},
-"C11":{"well":"B:2","dilut":"2E03"},
-"C12":{"well":"B:2","dilut":"2E03"},
-"C13":{"well":"B:3","dilut":"2E03"},
-"C14":{"well":"B:3","dilut":"2E03"},
-"C15":{"well":"B:4","dilut":"2E03"},
-"C16":{"well":"B:4","dilut":"2E03"},
-"C17":{"well":"B:1","dilut":"1E04"},
-"C18":{"well":"B:1","dilut":"1E04"},
-"C19":{"well":"B:2","dilut":"1E04"},
-"C20":{"well":"B:2","dilut":"1E04"},
-"C21":{"well":"B:3","dilut":"1E04"},
-"C22":{"well":"B:3","dilut":"1E04"},
-"C23":{"well":"B:4","dilut":"1E04"},
-"C24":{"well":"B:4","dilut":"1E04"},
-"D01":{"well":"B:1","dilut":"1E03"},
-"D02":{"well":"Std:2","dilut":""},
-"D03":{"well":"B:2","dilut":"1E03"},
-"D04":{"well":"Std:2","dilut":""},
-"D05":{"well":"B:3","dilut":"1E03"},
-"D06":{"well":"Std:2","dilut":""},
-"D07":{"well":"B:4","dilut":"1E03"},
-"D08":{"well":"","dilut":""},
-"D09":{"well":"B:1","dilut":"2E03"},
-"D10":{"well":"","dilut":""},
-"D11":{"well":"B:2","dilut":"2E03"},
-"D12":{"well":"","dilut":""},
-"D13":{"well":"B:3","dilut":"2E03"},
-"D14":{"well":"","dilut":""},
-"D15":{"well":"B:4","dilut":"2E03"},
-"D16":{"well":"","dilut":""},
-"D17":{"well":"B:1","dilut":"1E04"},
-"D18":{"well":"","dilut":""},
-"D19":{"well":"B:2","dilut":"1E04"},
-"D20":{"well":"","dilut":""},
-"D21":{"well":"B:3","dilut":"1E04"},
-"D22":{"well":"","dilut":""},
-"D23":{"well":"B:4","dilut":"1E04"},
-"D24":{"well":"","dilut":""},
-"E01":{"well":"C:1","dilut":"1E03"},
-"E02":{"well":"C:1","dilut":"1E03"},
-"E03":{"well":"C:2","dilut":"1E03"},
-"E04":{"well":"C:2","dilut":"1E03"},
-"E05":{"well":"C:3","dilut":"1E03"},
-"E06":{"well":"C:3","dilut":"1E03"},
-"E07":{"well":"C:4","dilut":"1E03"},
-"E08":{"well":"C:4","dilut":"1E03"},
-"E09":{"well":"C:1","dilut":"2E03"},
-"E10":{"well":"C:1","dilut":"2E03"},
-"E11":{"well":"C:2","dilut":"2E03"},
-"E12":{"well":"C:2","dilut":"2E03"},
-"E13":{"well":"C:3","dilut":"2E03"},
-"E14":{"well":"C:3","dilut":"2E03"},
-"E15":{"well":"C:4","dilut":"2E03"},
-"E16":{"well":"C:4","dilut":"2E03"},
-"E17":{"well":"C:1","dilut":"1E04"},
-"E18":{"well":"C:1","dilut":"1E04"},
-"E19":{"well":"C:2","dilut":"1E04"},
-"E20":{"well":"C:2","dilut":"1E04"},
-"E21":{"well":"C:3","dilut":"1E04"},
-"E22":{"well":"C:3","dilut":"1E04"},
-"E23":{"well":"C:4","dilut":"1E04"},
-"E24":{"well":"C:4","dilut":"1E04"},
-"F01":{"well":"C:1","dilut":"1E03"},
-"F02":{"well":"Std:3","dilut":""},
-"F03":{"well":"C:2","dilut":"1E03"},
-"F04":{"well":"Std:3","dilut":""},
-"F05":{"well":"C:3","dilut":"1E03"},
-"F06":{"well":"Std:3","dilut":""},
-"F07":{"well":"C:4","dilut":"1E03"},
-"F08":{"well":"","dilut":""},
-"F09":{"well":"C:1","dilut":"2E03"},
-"F10":{"well":"","dilut":""},
-"F11":{"well":"C:2","dilut":"2E03"},
-"F12":{"well":"","dilut":""},
-"F13":{"well":"C:3","dilut":"2E03"},
-"F14":{"well":"","dilut":""},
-"F15":{"well":"C:4","dilut":"2E03"},
-"F16":{"well":"","dilut":""},
-"F17":{"well":"C:1","dilut":"1E04"},
-"F18":{"well":"","dilut":""},
-"F19":{"well":"C:2","dilut":"1E04"},
-"F20":{"well":"","dilut":""},
-"F21":{"well":"C:3","dilut":"1E04"},
-"F22":{"well":"","dilut":""},
-"F23":{"well":"C:4","dilut":"1E04"},
-"F24":{"well":"","dilut":""},
-"G01":{"well":"D:1","dilut":"1E03"},
-"G02":{"well":"D:1","dilut":"1E03"},
-"G03":{"well":"D:2","dilut":"1E03"},
-"G04":{"well":"D:2","dilut":"1E03"},
-"G05":{"well":"D:3","dilut":"1E03"},
-"G06":{"well":"D:3","dilut":"1E03"},
-"G07":{"well":"D:4","dilut":"1E03"},
-"G08":{"well":"D:4","dilut":"1E03"},
-"G09":{"well":"D:1","dilut":"2E03"},
-"G10":{"well":"D:1","dilut":"2E03"},
-"G11":{"well":"D:2","dilut":"2E03"},
-"G12":{"well":"D:2","dilut":"2E03"},
-"G13":{"well":"D:3","dilut":"2E03"},
-"G14":{"well":"D:3","dilut":"2E03"},
-"G15":{"well":"D:4","dilut":"2E03"},
-"G16":{"well":"D:4","dilut":"2E03"},
-"G17":{"well":"D:1","dilut":"1E04"},
-"G18":{"well":"D:1","dilut":"1E04"},
-"G19":{"well":"D:2","dilut":"1E04"},
-"G20":{"well":"D:2","dilut":"1E04"},
-"G21":{"well":"D:3","dilut":"1E04"},
-"G22":{"well":"D:3","dilut":"1E04"},
-"G23":{"well":"D:4","dilut":"1E04"},
-"G24":{"well":"D:4","dilut":"1E04"},
-"H01":{"well":"D:1","dilut":"1E03"},
-"H02":{"well":"Std:4","dilut":""},
-"H03":{"well":"D:2","dilut":"1E03"},
-"H04":{"well":"Std:4","dilut":""},
-"H05":{"well":"D:3","dilut":"1E03"},
-"H06":{"well":"Std:4","dilut":""},
-"H07":{"well":"D:4","dilut":"1E03"},
-"H08":{"well":"","dilut":""},
-"H09":{"well":"D:1","dilut":"2E03"},
-"H10":{"well":"","dilut":""},
-"H11":{"well":"D:2","dilut":"2E03"},
-"H12":{"well":"","dilut":""},
-"H13":{"well":"D:3","dilut":"2E03"},
-"H14":{"well":"","dilut":""},
-"H15":{"well":"D:4","dilut":"2E03"},
-"H16":{"well":"","dilut":""},
-"H17":{"well":"D:1","dilut":"1E04"},
-"H18":{"well":"","dilut":""},
-"H19":{"well":"D:2","dilut":"1E04"},
-"H20":{"well":"","dilut":""},
-"H21":{"well":"D:3","dilut":"1E04"},
-"H22":{"well":"","dilut":""},
-"H23":{"well":"D:4","dilut":"1E04"},
-"H24":{"well":"","dilut":""},
-"I01":{"well":"E:1","dilut":"1E03"},
-"I02":{"well":"E:1","dilut":"1E03"},
-"I03":{"well":"E:2","dilut":"1E03"},
-"I04":{"well":"E:2","dilut":"1E03"},
-"I05":{"well":"E:3","dilut":"1E03"},
-"I06":{"well":"E:3","dilut":"1E03"},
-"I07":{"well":"E:4","dilut":"1E03"},
-"I08":{"well":"E:4","dilut":"1E03"},
-"I09":{"well":"E:1","dilut":"2E03"},
-"I10":{"well":"E:1","dilut":"2E03"},
-"I11":{"well":"E:2","dilut":"2E03"},
-"I12":{"well":"E:2","dilut":"2E03"},
-"I13":{"well":"E:3","dilut":"2E03"},
-"I14":{"well":"E:3","dilut":"2E03"},
-"I15":{"well":"E:4","dilut":"2E03"},
-"I16":{"well":"E:4","dilut":"2E03"},
-"I17":{"well":"E:1","dilut":"1E04"},
-"I18":{"well":"E:1","dilut":"1E04"},
-"I19":{"well":"E:2","dilut":"1E04"},
-"I20":{"well":"E:2","dilut":"1E04"},
-"I21":{"well":"E:3","dilut":"1E04"},
-"I22":{"well":"E:3","dilut":"1E04"},
-"I23":{"well":"E:4","dilut":"1E04"},
-"I24":{"well":"E:4","dilut":"1E04"},
-"J01":{"well":"E:1","dilut":"1E03"},
-"J02":{"well":"Std5","dilut":""},
-"J03":{"well":"E:2","dilut":"1E03"},
-"J04":{"well":"Std5","dilut":""},
-"J05":{"well":"E:3","dilut":"1E03"},
-"J06":{"well":"Std5","dilut":""},
-"J07":{"well":"E:4","dilut":"1E03"},
-"J08":{"well":"","dilut":""},
-"J09":{"well":"E:1","dilut":"2E03"},
-"J10":{"well":"","dilut":""},
-"J11":{"well":"E:2","dilut":"2E03"},
-"J12":{"well":"","dilut":""},
-"J13":{"well":"E:3","dilut":"2E03"},
-"J14":{"well":"","dilut":""},
-"J15":{"well":"E:4","dilut":"2E03"},
-"J16":{"well":"","dilut":""},
-"J17":{"well":"E:1","dilut":"1E04"},
-"J18":{"well":"","dilut":""},
-"J19":{"well":"E:2","dilut":"1E04"},
-"J20":{"well":"","dilut":""},
-"J21":{"well":"E:3","dilut":"1E04"},
-"J22":{"well":"","dilut":""},
-"J23":{"well":"E:4","dilut":"1E04"},
-"J24":{"well":"","dilut":""},
-"K01":{"well":"F:1","dilut":"1E03"},
-"K02":{"well":"F:1","dilut":"1E03"},
-"K03":{"well":"F:2","dilut":"1E03"},
-"K04":{"well":"F:2","dilut":"1E03"},
-"K05":{"well":"F:3","dilut":"1E03"},
-"K06":{"well":"F:3","dilut":"1E03"},
-"K07":{"well":"F:4","dilut":"1E03"},
-"K08":{"well":"F:4","dilut":"1E03"},
-"K09":{"well":"F:1","dilut":"2E03"},
-"K10":{"well":"F:1","dilut":"2E03"},
-"K11":{"well":"F:2","dilut":"2E03"},
-"K12":{"well":"F:2","dilut":"2E03"},
-"K13":{"well":"F:3","dilut":"2E03"},
-"K14":{"well":"F:3","dilut":"2E03"},
-"K15":{"well":"F:4","dilut":"2E03"},
-"K16":{"well":"F:4","dilut":"2E03"},
-"K17":{"well":"F:1","dilut":"1E04"},
-"K18":{"well":"F:1","dilut":"1E04"},
-"K19":{"well":"F:2","dilut":"1E04"},
-"K20":{"well":"F:2","dilut":"1E04"},
-"K21":{"well":"F:3","dilut":"1E04"},
-"K22":{"well":"F:3","dilut":"1E04"},
-"K23":{"well":"F:4","dilut":"1E04"},
-"K24":{"well":"F:4","dilut":"1E04"},
-"L01":{"well":"F:1","dilut":"1E03"},
-"L02":{"well":"Std6","dilut":""},
-"L03":{"well":"F:2","dilut":"1E03"},
-"L04":{"well":"Std6","dilut":""},
-"L05":{"well":"F:3","dilut":"1E03"},
-"L06":{"well":"Std6","dilut":""},
-"L07":{"well":"F:4","dilut":"1E03"},
-"L08":{"well":"","dilut":""},
-"L09":{"well":"F:1","dilut":"2E03"},
-"L10":{"well":"","dilut":""},
-"L11":{"well":"F:2","dilut":"2E03"},
-"L12":{"well":"","dilut":""},
-"L13":{"well":"F:3","dilut":"2E03"},
-"L14":{"well":"","dilut":""},
-"L15":{"well":"F:4","dilut":"2E03"},
-"L16":{"well":"","dilut":""},
-"L17":{"well":"F:1","dilut":"1E04"},
-"L18":{"well":"","dilut":""},
-"L19":{"well":"F:2","dilut":"1E04"},
-"L20":{"well":"","dilut":""},
-"L21":{"well":"F:3","dilut":"1E04"},
-"L22":{"well":"","dilut":""},
-"L23":{"well":"F:4","dilut":"1E04"},
-"L24":{"well":"","dilut":""},
-"M01":{"well":"G:1","dilut":"1E03"},
-"M02":{"well":"G:1","dilut":"1E03"},
-"M03":{"well":"G:2","dilut":"1E03"},
-"M04":{"well":"G:2","dilut":"1E03"},
-"M05":{"well":"G:3","dilut":"1E03"},
-"M06":{"well":"G:3","dilut":"1E03"},
-"M07":{"well":"G:4","dilut":"1E03"},
-"M08":{"well":"G:4","dilut":"1E03"},
-"M09":{"well":"G:1","dilut":"2E03"},
-"M10":{"well":"G:1","dilut":"2E03"},
-"M11":{"well":"G:2","dilut":"2E03"},
-"M12":{"well":"G:2","dilut":"2E03"},
-"M13":{"well":"G:3","dilut":"2E03"},
-"M14":{"well":"G:3","dilut":"2E03"},
-"M15":{"well":"G:4","dilut":"2E03"},
-"M16":{"well":"G:4","dilut":"2E03"},
-"M17":{"well":"G:1","dilut":"1E04"},
-"M18":{"well":"G:1","dilut":"1E04"},
-"M19":{"well":"G:2","dilut":"1E04"},
-"M20":{"well":"G:2","dilut":"1E04"},
-"M21":{"well":"G:3","dilut":"1E04"},
-"M22":{"well":"G:3","dilut":"1E04"},
-"M23":{"well":"G:4","dilut":"1E04"},
-"M24":{"well":"G:4","dilut":"1E04"},
-"N01":{"well":"G:1","dilut":"1E03"},
-"N02":{"well":"NTC","dilut":""},
-"N03":{"well":"G:2","dilut":"1E03"},
-"N04":{"well":"NTC","dilut":""},
-"N05":{"well":"G:3","dilut":"1E03"},
-"N06":{"well":"NTC","dilut":""},
-"N07":{"well":"G:4","dilut":"1E03"},
-"N08":{"well":"","dilut":""},
-"N09":{"well":"G:1","dilut":"2E03"},
-"N10":{"well":"","dilut":""},
-"N11":{"well":"G:2","dilut":"2E03"},
-"N12":{"well":"","dilut":""},
-"N13":{"well":"G:3","dilut":"2E03"},
-"N14":{"well":"","dilut":""},
-"N15":{"well":"G:4","dilut":"2E03"},
-"N16":{"well":"","dilut":""},
-"N17":{"well":"G:1","dilut":"1E04"},
-"N18":{"well":"","dilut":""},
-"N19":{"well":"G:2","dilut":"1E04"},
-"N20":{"well":"","dilut":""},
-"N21":{"well":"G:3","dilut":"1E04"},
-"N22":{"well":"","dilut":""},
-"N23":{"well":"G:4","dilut":"1E04"},
-"N24":{"well":"","dilut":""},
-"O01":{"well":"H:1","dilut":"1E03"},
-"O02":{"well":"H:1","dilut":"1E03"},
-"O03":{"well":"H:2","dilut":"1E03"},
-"O04":{"well":"H:2","dilut":"1E03"},
-"O05":{"well":"H:3","dilut":"1E03"},
-"O06":{"well":"H:3","dilut":"1E03"},
-"O07":{"well":"H:4","dilut":"1E03"},
-"O08":{"well":"H:4","dilut":"1E03"},
-"O09":{"well":"H:1","dilut":"2E03"},
-"O10":{"well":"H:1","dilut":"2E03"},
-"O11":{"well":"H:2","dilut":"2E03"},
-"O12":{"well":"H:2","dilut":"2E03"},
-"O13":{"well":"H:3","dilut":"2E03"},
-"O14":{"well":"H:3","dilut":"2E03"},
-"O15":{"well":"H:4","dilut":"2E03"},
-"O16":{"well":"H:4","dilut":"2E03"},
-"O17":{"well":"H:1","dilut":"1E04"},
-"O18":{"well":"H:1","dilut":"1E04"},
-"O19":{"well":"H:2","dilut":"1E04"},
-"O20":{"well":"H:2","dilut":"1E04"},
-"O21":{"well":"H:3","dilut":"1E04"},
-"O22":{"well":"H:3","dilut":"1E04"},
-"O23":{"well":"H:4","dilut":"1E04"},
-"O24":{"well":"H:4","dilut":"1E04"},
-"P01":{"well":"H:1","dilut":"1E03"},
-"P02":{"well":"","dilut":""},
-"P03":{"well":"H:2","dilut":"1E03"},
-"P04":{"well":"","dilut":""},
-"P05":{"well":"H:3","dilut":"1E03"},
-"P06":{"well":"","dilut":""},
-"P07":{"well":"H:4","dilut":"1E03"},
-"P08":{"well":"","dilut":""},
-"P09":{"well":"H:1","dilut":"2E03"},
-"P10":{"well":"","dilut":""},
-"P11":{"well":"H:2","dilut":"2E03"},
-"P12":{"well":"","dilut":""},
-"P13":{"well":"H:3","dilut":"2E03"},
-"P14":{"well":"","dilut":""},
-"P15":{"well":"H:4","dilut":"2E03"},
-"P16":{"well":"","dilut":""},
-"P17":{"well":"H:1","dilut":"1E04"},
-"P18":{"well":"","dilut":""},
-"P19":{"well":"H:2","dilut":"1E04"},
-"P20":{"well":"","dilut":""},
-"P21":{"well":"H:3","dilut":"1E04"},
-"P22":{"well":"","dilut":""},
-"P23":{"well":"H:4","dilut":"1E04"},
-"P24":{"well":"","dilut":""}}
+"""Shared code of the clinical EPPs.
+
+WELL_TRANSFORMER, the 384 -> 96 well and dilution table of the qPCR plates,
+is kept for older scripts. It is computed from clinical_EPPs.plate_layout the
+first time it is used, so importing the package does not import NumPy.
+"""
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+class _WellTransformer(Mapping):
+    """well -> {'well': sample well, 'dilut': dilution} of the default
+    qPCR plate layout, computed on first use."""
+
+    def __init__(self):
+        self._table = None
+
+    def _get_table(self):
+        if self._table is None:
+            from clinical_EPPs.plate_layout import get_layout
+            self._table = get_layout().well_transformer()
+        return self._table
+
+    def __getitem__(self, well):
+        return self._get_table()[well]
+
+    def __iter__(self):
+        return iter(self._get_table())
+
+    def __len__(self):
+        return len(self._get_table())
+
+
+WELL_TRANSFORMER = _WellTransformer()
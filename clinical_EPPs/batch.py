@@ -0,0 +1,312 @@
+"""Batch access to the Clarity LIMS REST API.
+
+The genologics entities fetch their XML lazily, one GET per entity, the first
+time an attribute is read. The functions here load many entities at once with
+the <entity>/batch/retrieve endpoints instead, so that later attribute access
+on the entities makes no further requests. Changed entities are saved the
+same way, with <entity>/batch/update, through a WriteBuffer.
+
+For steps that read or write thousands of entities, the chunks can be sent
+max_workers at a time (see clinical_EPPs.parallel), and get_entities also
+GETs the entities without batch endpoints, eg. processes, concurrently.
+"""
+
+from genologics.entities import Artifact, Sample, Container
+from genologics.constants import nsmap
+
+from xml.etree import ElementTree
+from collections import OrderedDict
+from requests.exceptions import HTTPError
+
+from clinical_EPPs.parallel import pmap, MapError
+
+BATCH_SIZE = 100
+
+# Entity classes with batch/retrieve and batch/update endpoints
+BATCH_CLASSES = (Artifact, Sample, Container)
+
+
+def chunks(items, size=BATCH_SIZE):
+    """Split items in lists of at most size items."""
+
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _group_by_class(entities):
+    """Group entities on class, and within each class on LIMS id.
+    Several instances can share a LIMS id, eg. artifacts with and without ?state="""
+
+    groups = OrderedDict()
+    for entity in entities:
+        if entity is None:
+            continue
+        klass_group = groups.setdefault(entity.__class__, OrderedDict())
+        klass_group.setdefault(entity.id, [])
+        if entity not in klass_group[entity.id]:
+            klass_group[entity.id].append(entity)
+    return groups
+
+
+def _map_calls(func, calls, max_workers):
+    """pmap func over calls. If calls failed, the error of the first one is
+    raised, as from a loop over the calls, eg. HTTPError."""
+
+    try:
+        return pmap(func, calls, max_workers)
+    except MapError as e:
+        raise e.errors[0][2]
+
+
+def _post_batch_retrieve(lims, klass, instance_map, lims_ids):
+    """POST one batch/retrieve call and hydrate the instances of lims_ids.
+    Returns the number of instances hydrated."""
+
+    links = ElementTree.Element(nsmap('ri:links'))
+    for lims_id in lims_ids:
+        ElementTree.SubElement(links, 'link',
+            dict(uri=instance_map[lims_id][0].uri, rel=klass._URI))
+    uri = lims.get_uri(klass._URI, 'batch/retrieve')
+    root = lims.post(uri, lims.tostring(ElementTree.ElementTree(links)))
+    fetched = 0
+    for node in list(root):
+        for instance in instance_map.get(node.attrib.get('limsid'), []):
+            instance.root = node
+            fetched += 1
+    return fetched
+
+
+def get_batch(lims, entities, force=False, batch_size=BATCH_SIZE, max_workers=1):
+    """Get the XML of artifacts, samples or containers with chunked
+    batch/retrieve calls, max_workers calls at a time, and hydrate the given
+    entity instances.
+
+    Entities that already have their XML are skipped unless force is True.
+    Returns the number of entities that were fetched."""
+
+    calls = []
+    for klass, instance_map in _group_by_class(entities).items():
+        lims_ids = [lims_id for lims_id, instances in instance_map.items()
+                    if force or any(instance.root is None for instance in instances)]
+        for chunk in chunks(lims_ids, batch_size):
+            calls.append((klass, instance_map, chunk))
+    return sum(_map_calls(lambda call: _post_batch_retrieve(lims, *call), calls, max_workers))
+
+
+def get_entities(lims, entities, force=False, batch_size=BATCH_SIZE, max_workers=1):
+    """Hydrate entities of any class: artifacts, samples and containers with
+    batch/retrieve calls, others with one GET each, max_workers requests at
+    a time. Returns the entities."""
+
+    entities = [entity for entity in entities if entity is not None]
+    batch_entities = [entity for entity in entities if isinstance(entity, BATCH_CLASSES)]
+    get_batch(lims, batch_entities, force, batch_size, max_workers)
+    single = OrderedDict()
+    for entity in entities:
+        if not isinstance(entity, BATCH_CLASSES) and (force or entity.root is None):
+            single.setdefault(entity.uri, entity)
+    _map_calls(lambda entity: entity.get(force=force), list(single.values()), max_workers)
+    return entities
+
+
+def prefetch_artifacts(lims, artifacts, samples=True, containers=True):
+    """Hydrate artifacts, and optionally their samples and containers,
+    in as few batch calls as possible."""
+
+    get_batch(lims, artifacts)
+    related = []
+    for art in artifacts:
+        if samples:
+            related += art.samples
+        if containers:
+            related.append(art.location[0])
+    get_batch(lims, related)
+
+
+def prefetch_process(process, inputs=True, outputs=True, samples=True, containers=True):
+    """Hydrate all input and/or output artifacts of a process.
+
+    Both the instances from process.input_output_maps (uris with ?state=) and
+    the ones returned by process.all_inputs()/all_outputs() are hydrated,
+    since the EPPs use both."""
+
+    lims = process.lims
+    artifacts = []
+    for inp, outp in process.input_output_maps:
+        for io, wanted in [(inp, inputs), (outp, outputs)]:
+            if wanted and io and io.get('limsid'):
+                artifacts.append(io['uri'])
+                artifacts.append(Artifact(lims, id=io['limsid']))
+    prefetch_artifacts(lims, artifacts, samples=samples, containers=containers)
+
+
+def _post_batch_update(lims, klass, entities):
+    """POST one batch/update call for entities of the same class."""
+
+    namespace = entities[0].root.tag.split('}')[0].lstrip('{')
+    details = ElementTree.Element('{%s}details' % namespace)
+    for entity in entities:
+        details.append(entity.root)
+    uri = lims.get_uri(klass._URI, 'batch/update')
+    lims.post(uri, lims.tostring(ElementTree.ElementTree(details)))
+
+
+def _put_chunk(lims, klass, chunk):
+    """Save a chunk of entities of the same class. Returns a list of
+    (entity, error message) for entities that were not saved."""
+
+    if issubclass(klass, BATCH_CLASSES):
+        try:
+            _post_batch_update(lims, klass, chunk)
+            return []
+        except HTTPError:
+            pass
+    failed = []
+    for instance in chunk:
+        try:
+            instance.put()
+        except HTTPError as e:
+            failed.append((instance, str(e)))
+    return failed
+
+
+def put_batch(lims, entities, batch_size=BATCH_SIZE, max_workers=1):
+    """Save artifacts, samples or containers with chunked batch/update calls,
+    max_workers calls at a time. Entities of other classes, eg. processes,
+    are saved one by one with put().
+
+    Clarity rejects a whole batch/update call if one of its entities is
+    invalid. The entities of a rejected chunk are therefore saved one by one
+    with put(), to find out which of them actually failed.
+
+    Returns a list of (entity, error message) for entities that were not saved."""
+
+    calls = []
+    for klass, instance_map in _group_by_class(entities).items():
+        instances = [instances[0] for instances in instance_map.values()]
+        for chunk in chunks(instances, batch_size):
+            calls.append((klass, chunk))
+    failed = []
+    for chunk_failed in _map_calls(lambda call: _put_chunk(lims, *call), calls, max_workers):
+        failed += chunk_failed
+    return failed
+
+
+def _state(entity):
+    """The UDF values and qc-flag of an entity, as tracked by WriteBuffer."""
+
+    return dict(entity.udf.items()), getattr(entity, 'qc_flag', None)
+
+
+def _changes(entity, snapshot):
+    """The UDF values and qc-flag of entity that differ from snapshot, as
+    (udfs, qc_flag), with qc_flag None if unchanged. Without a snapshot all
+    UDF values and the qc-flag are returned."""
+
+    udfs, qc_flag = _state(entity)
+    if snapshot is None:
+        return udfs, qc_flag
+    old_udfs, old_qc_flag = snapshot
+    changed = dict((key, value) for key, value in udfs.items()
+                   if key not in old_udfs or old_udfs[key] != value)
+    return changed, qc_flag if qc_flag != old_qc_flag else None
+
+
+def _merge_changes(entity, other, snapshot):
+    """Copy the UDF values and qc-flag that other changed since snapshot onto
+    entity, when they are two different instances of the same LIMS entity."""
+
+    if other.root is None or other.root is entity.root:
+        return
+    udfs, qc_flag = _changes(other, snapshot)
+    for key, value in udfs.items():
+        entity.udf[key] = value
+    if qc_flag is not None:
+        entity.qc_flag = qc_flag
+
+
+class WriteBuffer():
+    """Collects changed artifacts or samples and saves them with batch/update
+    calls when flushed, instead of one PUT per entity.
+
+    Entities are kept by LIMS id, so an entity added many times, eg. a sample
+    that is part of several pools, is written once. If different instances of
+    the same entity were changed, the UDF values and qc-flags they changed are
+    merged onto the first one before writing, with the instance added last
+    taking precedence.
+
+    Entities given to track() before they are changed get their UDF values
+    and qc-flag recorded. Instances of a tracked entity that were not tracked
+    themselves are compared with the values recorded for the entity. Without
+    a recording, all values of the later instances are merged. On flush,
+    tracked entities that still have the same values are not written at all.
+
+        write_buffer = WriteBuffer(lims)
+        write_buffer.track(artifacts)
+        for art in artifacts:
+            art.udf['Concentration'] = 1
+            write_buffer.add(art)
+        failed_arts = write_buffer.flush()
+    """
+
+    def __init__(self, lims, batch_size=BATCH_SIZE, max_workers=1):
+        self.lims = lims
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.entities = OrderedDict()
+        self.snapshots = {}
+        self.instance_snapshots = {}
+        self.errors = {}
+        self.skipped = 0
+
+    def track(self, entities):
+        """Record the current UDF values and qc-flags of entities, so that
+        unchanged entities can be skipped on flush."""
+
+        for entity in entities:
+            state = _state(entity)
+            self.snapshots.setdefault((entity.__class__, entity.id), state)
+            self.instance_snapshots.setdefault(entity, state)
+
+    def _snapshot(self, entity):
+        """The values recorded for the instance entity, or else for its LIMS
+        entity, or None."""
+
+        if entity in self.instance_snapshots:
+            return self.instance_snapshots[entity]
+        return self.snapshots.get((entity.__class__, entity.id))
+
+    def add(self, entity):
+        """Mark entity to be saved on the next flush."""
+
+        instances = self.entities.setdefault((entity.__class__, entity.id), [])
+        if entity not in instances:
+            instances.append(entity)
+
+    def flush(self):
+        """Save all added entities. Returns the entities that failed.
+        Their error messages are kept in self.errors."""
+
+        entities = []
+        for key, instances in self.entities.items():
+            for other in instances[1:]:
+                _merge_changes(instances[0], other, self._snapshot(other))
+            if self._snapshot(instances[0]) == _state(instances[0]):
+                self.skipped += 1
+                continue
+            entities.append(instances)
+        failed = put_batch(self.lims, [instances[0] for instances in entities],
+                           self.batch_size, self.max_workers)
+        self.entities = OrderedDict()
+        for entity, error in failed:
+            self.errors[entity] = error
+        failed = [entity for entity, error in failed]
+        for instances in entities:
+            key = (instances[0].__class__, instances[0].id)
+            if key not in self.snapshots or instances[0] in failed:
+                continue
+            self.snapshots[key] = _state(instances[0])
+            for instance in instances:
+                if instance in self.instance_snapshots:
+                    self.instance_snapshots[instance] = _state(instance)
+        return failed
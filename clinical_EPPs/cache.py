@@ -0,0 +1,31 @@
+"""Local SQLite caches of LIMS data that rarely or never changes.
+
+The cache files are kept in CACHE_DIR, in the home directory of the user
+running the EPPs (glsai). Many EPPs can run at the same time, so the
+databases are opened in WAL mode with a busy timeout: readers never block,
+and concurrent writers wait for each other instead of failing.
+"""
+
+import os
+import sqlite3
+
+CACHE_DIR = os.path.expanduser('~/.cache/clinical_EPPs')
+BUSY_TIMEOUT = 30
+
+
+def connect(file_name, schema, cache_dir=None):
+    """Open (and create if needed) the cache database file_name in cache_dir,
+    by default CACHE_DIR. schema is a string of SQL statements creating its
+    tables if not existing."""
+
+    cache_dir = cache_dir or CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # Created by a parallel EPP run
+            pass
+    connection = sqlite3.connect(os.path.join(cache_dir, file_name), timeout=BUSY_TIMEOUT)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(schema)
+    return connection
@@ -0,0 +1,285 @@
+"""Record and replay of the LIMS traffic of an EPP run.
+
+With --record <dir>, all requests of the Lims session of an EPP and their
+responses are written, when the EPP exits, to a cassette in dir,
+<dir>/<script>.cassette.json.gz. With --replay <dir> (or the cassette
+file), the responses are served from the cassette instead of the LIMS, and
+nothing is sent over the network, so that a production run can be run again
+offline, eg. under a profiler or with --profile:
+
+    parser.add_argument('--record', metavar='DIR', help=RECORD_HELP)
+    parser.add_argument('--replay', metavar='DIR', help=REPLAY_HELP)
+    args = parser.parse_args()
+    lims = get_lims()
+    use_cassette(lims, args)
+
+The EPPs do this through clinical_EPPs.epp_run.
+
+A cassette is gzipped JSON: the exchanges in the order they were sent
+(method, path, status, content type and seconds), and the request and
+response bodies stored once each by SHA-1. Paths include the query but not
+the host, so a cassette recorded against production replays with any
+BASEURI.
+
+In replay, a request is answered with the next recorded response of the
+same method, path and body, or else of the same method and path; once they
+are used up the last one is repeated. Requests that were not recorded, eg.
+after an optimisation of the EPP, are answered from the entities in the
+cassette where possible: GET and batch/retrieve of any entity seen in a
+response, and PUT and batch/update, which also update those entities. Other
+requests get a 404.
+
+Only the requests of the Lims session are recorded, not eg. file transfers.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from xml.etree import ElementTree
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+RECORD_HELP = 'Record the LIMS requests and responses of the run to a cassette in DIR'
+REPLAY_HELP = 'Serve the LIMS responses from the cassette recorded in DIR, without network access'
+
+CASSETTE_VERSION = 1
+
+# /api/v2/<entities>/<id> and /api/v2/<entities>/batch/<action>
+ENTITY_PATH = re.compile('^/api/v2/([a-z]+)/([^/]+)$')
+BATCH_PATH = re.compile('^/api/v2/([a-z]+)/batch/(retrieve|update)$')
+
+
+def cassette_path(path):
+    """The cassette file of the script run in directory path, or path if it
+    is a file."""
+
+    if os.path.isfile(path):
+        return path
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    return os.path.join(path, script + '.cassette.json.gz')
+
+
+def request_path(url):
+    """The path and query of url, without scheme and host."""
+
+    url = urlparse(url)
+    return url.path + ('?' + url.query if url.query else '')
+
+
+def _text(body):
+    if body is None:
+        return None
+    return body.decode('utf-8') if isinstance(body, bytes) else body
+
+
+def _sha1(text):
+    return None if text is None else hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class RecordingAdapter(BaseAdapter):
+    """Transport adapter sending requests with adapter, and keeping the
+    exchanges for the cassette."""
+
+    def __init__(self, adapter):
+        super(RecordingAdapter, self).__init__()
+        self.adapter = adapter
+        self.started = time.time()
+        self.exchanges = []
+        self.bodies = {}
+        self.lock = threading.Lock()
+
+    def _body(self, text):
+        key = _sha1(text)
+        if key is not None:
+            self.bodies.setdefault(key, text)
+        return key
+
+    def send(self, request, **kwargs):
+        start = time.time()
+        response = self.adapter.send(request, **kwargs)
+        content = response.content
+        seconds = time.time() - start
+        with self.lock:
+            self.exchanges.append(OrderedDict([
+                ('method', request.method),
+                ('path', request_path(request.url)),
+                ('request', self._body(_text(request.body))),
+                ('status', response.status_code),
+                ('content_type', response.headers.get('content-type')),
+                ('response', self._body(content.decode('utf-8', 'replace') if content else None)),
+                ('seconds', round(seconds, 6))]))
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+    def write(self, path):
+        """Write the cassette, by default for the script run, to path."""
+
+        path = cassette_path(path)
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with self.lock:
+            cassette = OrderedDict([('version', CASSETTE_VERSION),
+                                    ('script', os.path.basename(sys.argv[0])),
+                                    ('argv', sys.argv[1:]),
+                                    ('started', datetime.fromtimestamp(self.started).isoformat()),
+                                    ('exchanges', self.exchanges),
+                                    ('bodies', self.bodies)])
+            with gzip.open(path, 'wb') as cassette_file:
+                cassette_file.write(json.dumps(cassette, separators=(',', ':')).encode('utf-8'))
+        return path
+
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter answering requests from a cassette."""
+
+    def __init__(self, path):
+        super(ReplayAdapter, self).__init__()
+        with gzip.open(cassette_path(path), 'rb') as cassette_file:
+            cassette = json.loads(cassette_file.read().decode('utf-8'))
+        if cassette.get('version') != CASSETTE_VERSION:
+            raise ValueError('Unknown cassette version: %s' % cassette.get('version'))
+        self.bodies = cassette['bodies']
+        self.by_body = OrderedDict()
+        self.by_path = OrderedDict()
+        self.entities = {}
+        self.served = {}
+        self.lock = threading.Lock()
+        for exchange in cassette['exchanges']:
+            self.by_body.setdefault((exchange['method'], exchange['path'], exchange['request']), []).append(exchange)
+            self.by_path.setdefault((exchange['method'], exchange['path']), []).append(exchange)
+            if exchange['status'] not in (200, 201, 202):
+                continue
+            batch = BATCH_PATH.match(exchange['path'].split('?')[0])
+            if batch and batch.group(2) == 'update' and exchange['request']:
+                self._store_details(self.bodies[exchange['request']])
+            elif batch and exchange['response']:
+                self._store_details(self.bodies[exchange['response']])
+            elif exchange['method'] in ('GET', 'PUT') and exchange['response']:
+                self._store(exchange['path'], self.bodies[exchange['response']])
+
+    def _store(self, path, text):
+        """Keep the entity of an entity response by its path."""
+
+        path = path.split('?')[0]
+        if ENTITY_PATH.match(path):
+            try:
+                self.entities[path] = ElementTree.fromstring(text.encode('utf-8'))
+            except ElementTree.ParseError:
+                pass
+
+    def _store_details(self, text):
+        """Keep the entities of a batch details document by their paths."""
+
+        try:
+            root = ElementTree.fromstring(text.encode('utf-8'))
+        except ElementTree.ParseError:
+            return
+        for node in list(root):
+            if node.get('uri'):
+                self.entities[urlparse(node.get('uri')).path] = node
+
+    def _next(self, key, exchanges):
+        served = self.served.get(key, 0)
+        self.served[key] = served + 1
+        exchange = exchanges[min(served, len(exchanges) - 1)]
+        return exchange
+
+    def _from_entities(self, method, path, body):
+        """(status, text) of a request not in the cassette."""
+
+        path = path.split('?')[0]
+        batch = BATCH_PATH.match(path)
+        if method == 'GET' and path in self.entities:
+            return 200, ElementTree.tostring(self.entities[path])
+        if method == 'PUT' and ENTITY_PATH.match(path) and body:
+            self._store(path, body)
+            return 200, body
+        if method == 'POST' and batch and body:
+            root = ElementTree.fromstring(body.encode('utf-8'))
+            if batch.group(2) == 'update':
+                self._store_details(body)
+                links = ElementTree.Element('{http://genologics.com/ri}links')
+                for node in list(root):
+                    ElementTree.SubElement(links, 'link', uri=node.get('uri'), rel=batch.group(1))
+                return 200, ElementTree.tostring(links)
+            paths = [urlparse(link.get('uri')).path for link in root.iter('link')]
+            if all(link_path in self.entities for link_path in paths):
+                namespace = self.entities[paths[0]].tag.split('}')[0].lstrip('{') if paths else ''
+                details = ElementTree.Element('{%s}details' % namespace)
+                for link_path in paths:
+                    details.append(self.entities[link_path])
+                return 200, ElementTree.tostring(details)
+        return 404, 'Not in cassette: %s %s' % (method, path)
+
+    def send(self, request, **kwargs):
+        path = request_path(request.url)
+        body = _text(request.body)
+        body_key = (request.method, path, _sha1(body))
+        path_key = (request.method, path)
+        with self.lock:
+            if body_key in self.by_body:
+                exchange = self._next(body_key, self.by_body[body_key])
+            elif path_key in self.by_path:
+                exchange = self._next(path_key, self.by_path[path_key])
+            else:
+                exchange = None
+                status, text = self._from_entities(request.method, path, body)
+        if exchange:
+            status = exchange['status']
+            text = self.bodies[exchange['response']] if exchange['response'] else ''
+            content_type = exchange['content_type']
+        else:
+            content_type = 'application/xml' if status == 200 else 'text/plain'
+        response = Response()
+        response.status_code = status
+        response._content = text.encode('utf-8') if not isinstance(text, bytes) else text
+        response.headers = CaseInsensitiveDict({'content-type': content_type} if content_type else {})
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK' if status < 400 else 'Not Found'
+        return response
+
+    def close(self):
+        pass
+
+
+def use_cassette(lims, args):
+    """Record the requests of lims to the cassette in args.record, written
+    when the script exits, or replay them from args.replay."""
+
+    record = getattr(args, 'record', None)
+    replay = getattr(args, 'replay', None)
+    if record and replay:
+        sys.exit('--record and --replay can not be used together')
+    session = lims.request_session
+    if record:
+        adapter = RecordingAdapter(session.get_adapter(lims.baseuri))
+        atexit.register(adapter.write, record)
+    elif replay:
+        adapter = ReplayAdapter(replay)
+    else:
+        return None
+    # The version check of the run is recorded and replayed, also in the EPP worker
+    lims.checked_versions.discard((lims.baseuri, lims.VERSION))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return adapter
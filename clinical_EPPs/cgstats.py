@@ -0,0 +1,129 @@
+"""Read access to the demultiplexing statistics database, cgstats.
+
+Plain SQLAlchemy Core: the tables are declared with only the columns the
+EPPs read, and the demultiplexing statistics of a flowcell are fetched
+with one joined query selecting just the needed columns.
+
+    engine = get_engine(SQLALCHEMY_DATABASE_URI)
+    for row in get_demux_data(engine, ['HXXXXXXXX']):
+        print row.samplename, row.lane, row.readcounts
+
+get_passed_reads sums the reads of the lanes passing QC per LIMS sample,
+grouped and filtered in the database. The samples are selected with
+prefix matches on samplename, which can use its index.
+"""
+
+from sqlalchemy import (MetaData, Table, Column, Integer, String, Numeric,
+                        ForeignKey, create_engine, select, func, case, and_, or_)
+
+metadata = MetaData()
+
+sample = Table('sample', metadata,
+    Column('sample_id', Integer, primary_key=True),
+    Column('project_id', Integer, nullable=False),
+    Column('samplename', String(255), nullable=False),
+    Column('barcode', String(255)))
+
+flowcell = Table('flowcell', metadata,
+    Column('flowcell_id', Integer, primary_key=True),
+    Column('flowcellname', String(255), nullable=False))
+
+demux = Table('demux', metadata,
+    Column('demux_id', Integer, primary_key=True),
+    Column('flowcell_id', Integer, ForeignKey('flowcell.flowcell_id'), nullable=False),
+    Column('basemask', String(255)))
+
+unaligned = Table('unaligned', metadata,
+    Column('unaligned_id', Integer, primary_key=True),
+    Column('sample_id', Integer, ForeignKey('sample.sample_id'), nullable=False),
+    Column('demux_id', Integer, ForeignKey('demux.demux_id'), nullable=False),
+    Column('lane', Integer),
+    Column('yield_mb', Integer),
+    Column('readcounts', Integer),
+    Column('perfect_indexreads_pct', Numeric(10, 5)),
+    Column('q30_bases_pct', Numeric(10, 5)),
+    Column('mean_quality_score', Numeric(10, 5)))
+
+DEMUX_COLUMNS = [flowcell.c.flowcellname,
+                 sample.c.samplename,
+                 unaligned.c.lane,
+                 unaligned.c.readcounts,
+                 unaligned.c.q30_bases_pct,
+                 unaligned.c.perfect_indexreads_pct]
+
+
+def get_engine(uri):
+    return create_engine(uri, pool_recycle=3600)
+
+
+def demux_query(flowcellnames):
+    """Select DEMUX_COLUMNS for all samples and lanes on the flowcells."""
+
+    joined = unaligned.join(sample).join(demux).join(flowcell)
+    return (select(DEMUX_COLUMNS)
+            .select_from(joined)
+            .where(flowcell.c.flowcellname.in_(flowcellnames)))
+
+
+def get_demux_data(engine, flowcellnames):
+    """Return the demultiplexing statistics of flowcellnames as rows with
+    the attributes flowcellname, samplename, lane, readcounts,
+    q30_bases_pct and perfect_indexreads_pct."""
+
+    with engine.connect() as connection:
+        return connection.execute(demux_query(list(flowcellnames))).fetchall()
+
+
+def lims_sample_id(samplename):
+    """SQL expression for the LIMS sample id part of a cgstats samplename,
+    <LIMS sample id>_<index>."""
+
+    underscore = func.instr(samplename, '_')
+    return case([(underscore > 0, func.substr(samplename, 1, underscore - 1))], else_=samplename)
+
+
+def samplename_filter(sample_ids):
+    """Condition selecting the cgstats samples of LIMS sample ids: the
+    samplename is the id, or starts with <id>_. Unlike a condition on
+    lims_sample_id, it can use the index on samplename."""
+
+    def escape(text):
+        return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    return or_(sample.c.samplename.in_(sample_ids),
+               *[sample.c.samplename.like(escape(sample_id) + '\\_%', escape='\\')
+                 for sample_id in sample_ids])
+
+
+def passed_reads_query(sample_ids, q30_threshold, reads_threshold):
+    """Select sample_id, readcounts and lanes: the sum of the reads and the
+    number of lanes passing the QC thresholds, per LIMS sample id. A lane
+    demultiplexed more than once counts once."""
+
+    sample_id = lims_sample_id(sample.c.samplename)
+    lanes = (select([sample_id.label('sample_id'), func.max(unaligned.c.readcounts).label('readcounts')])
+             .select_from(unaligned.join(sample).join(demux))
+             .where(and_(samplename_filter(sample_ids),
+                         unaligned.c.q30_bases_pct >= q30_threshold,
+                         unaligned.c.readcounts >= reads_threshold))
+             .group_by(sample.c.samplename, demux.c.flowcell_id, unaligned.c.lane)
+             .alias('lanes'))
+    return (select([lanes.c.sample_id,
+                    func.sum(lanes.c.readcounts).label('readcounts'),
+                    func.count().label('lanes')])
+            .group_by(lanes.c.sample_id))
+
+
+def get_passed_reads(engine, sample_ids, q30_threshold, reads_threshold=1000):
+    """Return a dict LIMS sample id -> (reads, lanes) for the lanes where
+    the sample has at least reads_threshold reads and q30_threshold % bases
+    >= Q30, the QC of bcl2fastq. Samples without such lanes are left out."""
+
+    sample_ids = sorted(set(sample_ids))
+    passed_reads = {}
+    with engine.connect() as connection:
+        for i in range(0, len(sample_ids), 500):
+            query = passed_reads_query(sample_ids[i:i + 500], q30_threshold, reads_threshold)
+            for row in connection.execute(query):
+                passed_reads[row.sample_id] = (int(row.readcounts), row.lanes)
+    return passed_reads
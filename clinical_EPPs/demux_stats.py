@@ -0,0 +1,134 @@
+"""Demultiplexing statistics read straight from the bcl2fastq output.
+
+An alternative to the cgstats database, for when the UDFs should not wait
+for the cgstats import. Reads, Q30 % and perfect index read % per sample
+and lane are computed from Stats/Stats.json and, if present,
+Stats/ConversionStats.xml in the bcl2fastq output directory.
+
+Both files grow with the number of samples, lanes and tiles, so neither is
+loaded whole: the lanes of Stats.json are decoded one at a time, and
+ConversionStats.xml is parsed with iterparse, clearing each lane once it
+has been summed up.
+
+The rows have the same attributes as the ones from clinical_EPPs.cgstats.
+"""
+
+from xml.etree.ElementTree import iterparse
+from collections import namedtuple
+
+import json
+import os
+
+CHUNK_SIZE = 1024 * 1024
+
+DemuxRow = namedtuple('DemuxRow', ['flowcellname', 'samplename', 'lane', 'readcounts',
+                                   'q30_bases_pct', 'perfect_indexreads_pct'])
+
+
+def _read_until(fileobj, buffer, marker):
+    """Read fileobj until marker is in buffer. Return the buffer after it."""
+
+    while marker not in buffer:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            raise ValueError('%s not found in %s' % (marker, fileobj.name))
+        buffer = buffer[-len(marker):] + chunk
+    return buffer[buffer.index(marker) + len(marker):]
+
+
+def iter_json_array(fileobj, key):
+    """Yield the elements of the array under key in a JSON file, decoding
+    one element at a time. Only that element is held in memory."""
+
+    decoder = json.JSONDecoder()
+    buffer = _read_until(fileobj, '', '"%s"' % key)
+    buffer = _read_until(fileobj, buffer, '[')
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            element, end = decoder.raw_decode(buffer)
+        except ValueError:
+            if eof:
+                raise
+            chunk = fileobj.read(max(CHUNK_SIZE, len(buffer)))
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield element
+        buffer = buffer[end:]
+
+
+def _json_value(fileobj, key):
+    """The string or number value of the first occurrence of key."""
+
+    decoder = json.JSONDecoder()
+    buffer = _read_until(fileobj, '', '"%s"' % key)
+    buffer = _read_until(fileobj, buffer, ':').lstrip()
+    return decoder.raw_decode(buffer + fileobj.read(1024))[0]
+
+
+def _pct(part, total):
+    return 100.0 * part / total if total else 0.0
+
+
+def read_stats_json(path):
+    """Yield (flowcell, sample id, lane, reads, Q30 %, perfect index %) per
+    sample and lane in a bcl2fastq Stats.json."""
+
+    with open(path) as stats:
+        flowcellname = _json_value(stats, 'Flowcell')
+    with open(path) as stats:
+        for lane in iter_json_array(stats, 'ConversionResults'):
+            for sample in lane.get('DemuxResults', []):
+                reads = sample.get('NumberReads', 0)
+                perfect = sum(metric.get('MismatchCounts', {}).get('0', 0)
+                              for metric in sample.get('IndexMetrics', []))
+                yield_bases = sum(read.get('Yield', 0) for read in sample.get('ReadMetrics', []))
+                yield_q30 = sum(read.get('YieldQ30', 0) for read in sample.get('ReadMetrics', []))
+                yield (flowcellname, sample['SampleId'], lane['LaneNumber'], reads,
+                       _pct(yield_q30, yield_bases), _pct(perfect, reads))
+
+
+def read_conversion_stats(path):
+    """Return a dict (sample name, lane) -> Q30 % of the pass filter bases,
+    from a bcl2fastq ConversionStats.xml."""
+
+    q30 = {}
+    project = sample = barcode = None
+    for event, elem in iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'Project':
+                project = elem.attrib.get('name')
+            elif elem.tag == 'Sample':
+                sample = elem.attrib.get('name')
+            elif elem.tag == 'Barcode':
+                barcode = elem.attrib.get('name')
+            continue
+        if elem.tag == 'Lane':
+            if project != 'all' and barcode == 'all':
+                yield_bases = yield_q30 = 0
+                for read in elem.iterfind('Tile/Pf/Read'):
+                    yield_bases += int(read.findtext('Yield', 0))
+                    yield_q30 += int(read.findtext('YieldQ30', 0))
+                q30[(sample, int(elem.attrib['number']))] = _pct(yield_q30, yield_bases)
+            elem.clear()
+        elif elem.tag in ('Barcode', 'Sample', 'Project'):
+            elem.clear()
+    return q30
+
+
+def get_demux_stats(stats_dir):
+    """Return DemuxRows for all samples and lanes in the Stats directory of
+    a bcl2fastq output directory, or in stats_dir itself."""
+
+    if os.path.isdir(os.path.join(stats_dir, 'Stats')):
+        stats_dir = os.path.join(stats_dir, 'Stats')
+    conversion_stats = os.path.join(stats_dir, 'ConversionStats.xml')
+    q30 = read_conversion_stats(conversion_stats) if os.path.exists(conversion_stats) else {}
+    rows = []
+    for flowcellname, sample, lane, reads, q30_pct, perfect_pct in read_stats_json(os.path.join(stats_dir, 'Stats.json')):
+        rows.append(DemuxRow(flowcellname, sample, lane, reads, q30.get((sample, lane), q30_pct), perfect_pct))
+    return rows
@@ -0,0 +1,38 @@
+"""Command line options and start of an EPP run.
+
+All EPPs take --profile (clinical_EPPs.profiling), --record and --replay
+(clinical_EPPs.cassette), and start the same way: get the Lims, set up the
+cassette, check the API version and run main under the profiler.
+
+    parser = ArgumentParser(description=DESC)
+    parser.add_argument('-p', dest = 'pid', help='Lims id for current Process')
+    add_run_options(parser)
+    args = parser.parse_args()
+    run(main, args)
+"""
+
+from clinical_EPPs.lims_client import get_lims
+from clinical_EPPs.profiling import profiled, PROFILE_HELP
+from clinical_EPPs.cassette import use_cassette, RECORD_HELP, REPLAY_HELP
+
+
+def add_run_options(parser):
+    """Add --profile, --record and --replay to parser."""
+
+    parser.add_argument('--profile', action='store_true', help=PROFILE_HELP)
+    parser.add_argument('--record', metavar='DIR', help=RECORD_HELP)
+    parser.add_argument('--replay', metavar='DIR', help=REPLAY_HELP)
+
+
+def run(main, args, lims=None, check_version=True):
+    """Run main(lims, args) with the options of add_run_options. lims is by
+    default the one of get_lims(). Its API version is checked first, unless
+    check_version is False."""
+
+    if lims is None:
+        lims = get_lims()
+    use_cassette(lims, args)
+    if check_version:
+        lims.check_version()
+    with profiled(lims, args):
+        main(lims, args)
@@ -0,0 +1,148 @@
+"""Index collision checks for pools and steps.
+
+Two indexes collide if one is a prefix of the other, eg. an 8 bp index and a
+10 bp index starting with the same 8 bases. After sorting, every index that
+starts with a given index follows directly after it, so all collisions are
+found in one sweep over the sorted indexes instead of comparing all pairs.
+
+Demultiplexing allows mismatches in the index reads, so indexes that are not
+prefixes of each other can still clash. find_close_pairs finds all index
+pairs within a given number of mismatches.
+"""
+
+from collections import OrderedDict
+from itertools import product
+
+
+def find_collisions(indexes):
+    """Group colliding indexes.
+
+    indexes is a list of (sequence, item) tuples, where item is anything the
+    caller wants back, eg. the artifact carrying the index.
+
+    Returns a list of collision groups. Each group is an OrderedDict of
+    sequence -> list of items, where the first sequence is a prefix of (or
+    equal to) all the others in the group. Only groups with more than one
+    item are returned."""
+
+    by_sequence = OrderedDict()
+    for sequence, item in indexes:
+        by_sequence.setdefault(sequence, []).append(item)
+
+    groups = []
+    group = None
+    root = None
+    for sequence in sorted(by_sequence):
+        if root is not None and sequence.startswith(root):
+            group[sequence] = by_sequence[sequence]
+        else:
+            root = sequence
+            group = OrderedDict([(sequence, by_sequence[sequence])])
+            groups.append(group)
+    return [group for group in groups if sum(len(items) for items in group.values()) > 1]
+
+
+def colliding_sequences(indexes):
+    """All sequences that collide with at least one other index."""
+
+    return [sequence for group in find_collisions(indexes) for sequence in group]
+
+
+BASE_BITS = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+LOW_BITS = int('01' * 64, 2)
+
+
+def packable(sequence):
+    """True if sequence only has the bases A, C, G and T."""
+
+    return all(base in BASE_BITS for base in sequence.upper())
+
+
+def pack(sequence):
+    """Pack a sequence into an int with two bits per base, first base highest.
+    Raises ValueError for sequences with other bases than A, C, G and T."""
+
+    if not packable(sequence):
+        raise ValueError('Can not pack index sequence %s' % sequence)
+    value = 0
+    for base in sequence.upper():
+        value = (value << 2) | BASE_BITS[base]
+    return value
+
+
+def _mismatches(packed1, length1, packed2, length2):
+    """Number of mismatching bases over the length of the shorter index."""
+
+    if length1 > length2:
+        packed1 >>= 2 * (length1 - length2)
+    elif length2 > length1:
+        packed2 >>= 2 * (length2 - length1)
+    diff = packed1 ^ packed2
+    return bin((diff | (diff >> 1)) & LOW_BITS).count('1')
+
+
+def _distance(read1, packed1, read2, packed2):
+    """Mismatches between two index reads. Reads with other bases than ACGT,
+    eg. N, have packed None and are compared as strings, N matching only N."""
+
+    if packed1 is None or packed2 is None:
+        return sum(1 for base1, base2 in zip(read1, read2) if base1 != base2)
+    return _mismatches(packed1, len(read1), packed2, len(read2))
+
+
+def find_close_pairs(indexes, max_distance=2):
+    """Find all pairs of indexes within max_distance mismatches.
+
+    indexes is a list of (sequence, item) tuples. Dual indexes are given as
+    'i7-i5'. The distance is counted per index read over the length of the
+    shorter index, and a pair of dual indexes is close only if both its i7
+    and its i5 are within max_distance, since either read alone separates the
+    samples. For a single and a dual index, only i7 is compared. Reads with
+    other bases than ACGT, eg. an N placeholder, are compared base by base
+    instead of packed.
+
+    A pair within max_distance on a read must have at least one of
+    max_distance+1 segments of that read in common. Indexes are put in
+    buckets on one segment of each read they all have, and only indexes
+    sharing a bucket are compared.
+
+    Returns a list of (sequence1, item1, sequence2, item2, distances), where
+    distances is a tuple of the mismatches for each compared index read."""
+
+    entries = []
+    for sequence, item in indexes:
+        reads = sequence.upper().split('-')
+        entries.append((sequence, item, reads, [pack(read) if packable(read) else None for read in reads]))
+    if not entries:
+        return []
+
+    nr_segments = max_distance + 1
+    nr_reads = min(len(reads) for sequence, item, reads, packed in entries)
+    segment_bounds = []
+    for read in range(nr_reads):
+        shortest = min(len(reads[read]) for sequence, item, reads, packed in entries)
+        bounds = [shortest * i // nr_segments for i in range(nr_segments + 1)]
+        segment_bounds.append([(segment, bounds[segment], bounds[segment + 1])
+                               for segment in range(nr_segments)])
+    buckets = {}
+    for i, (sequence, item, reads, packed) in enumerate(entries):
+        for segments in product(*segment_bounds):
+            key = tuple((segment, reads[read][start:end])
+                        for read, (segment, start, end) in enumerate(segments))
+            buckets.setdefault(key, []).append(i)
+
+    candidates = set()
+    for members in buckets.values():
+        for j, first in enumerate(members):
+            for second in members[j + 1:]:
+                candidates.add((first, second))
+
+    pairs = []
+    for first, second in sorted(candidates):
+        sequence1, item1, reads1, packed1 = entries[first]
+        sequence2, item2, reads2, packed2 = entries[second]
+        distances = tuple(_distance(read1, read_packed1, read2, read_packed2)
+                          for read1, read_packed1, read2, read_packed2 in zip(reads1, packed1, reads2, packed2))
+        if max(distances) <= max_distance:
+            pairs.append((sequence1, item1, sequence2, item2, distances))
+    return pairs
@@ -0,0 +1,105 @@
+"""Lims client with a tuned, pooled keep-alive HTTP session.
+
+genologics.lims.Lims keeps a requests session for its GETs only, mounted for
+http:// only, while PUT and POST open a new connection (and TLS handshake)
+for every request. get_lims returns a Lims where all requests go through one
+session with a connection pool, connect/read timeouts and retries with
+backoff on 5xx responses. A semaphore caps the requests in flight at once,
+over all the threads using the session (see clinical_EPPs.parallel), so that
+concurrent callers wait for a free connection instead of opening extra
+ones. The same session can be shared with glsapiutil helpers through
+glsapiutil2.setSession.
+"""
+
+import requests
+import threading
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from genologics.lims import Lims
+from genologics.constants import nsmap
+from genologics.config import BASEURI, USERNAME, PASSWORD
+
+POOL_SIZE = 20
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 120
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUS = (500, 502, 503, 504)
+
+XML_HEADERS = {'content-type': 'application/xml', 'accept': 'application/xml'}
+
+
+class LimsSession(requests.Session):
+    """requests Session with a sized connection pool, default timeouts and
+    retries. Only idempotent requests (GET, PUT, DELETE..) are retried.
+    At most max_requests requests, by default pool_size, are sent at once."""
+
+    def __init__(self, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, retries=RETRIES, backoff_factor=BACKOFF_FACTOR,
+                 max_requests=None):
+        super(LimsSession, self).__init__()
+        self.timeout = (connect_timeout, read_timeout)
+        self.semaphore = threading.BoundedSemaphore(max_requests or pool_size)
+        retry = Retry(total=retries, backoff_factor=backoff_factor,
+                      status_forcelist=RETRY_STATUS, raise_on_status=False)
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                   max_retries=retry)
+        self.mount('http://', self.adapter)
+        self.mount('https://', self.adapter)
+
+    def request(self, method, url, **kwargs):
+        """genologics passes its own fixed timeout. Use the session timeout instead."""
+
+        kwargs['timeout'] = self.timeout
+        with self.semaphore:
+            return super(LimsSession, self).request(method, url, **kwargs)
+
+
+class PooledLims(Lims):
+    """Lims that sends all its requests through one LimsSession."""
+
+    # (baseuri, version) of the LIMS checked by check_version in this process
+    checked_versions = set()
+
+    def __init__(self, baseuri, username, password, version=Lims.VERSION, session=None):
+        super(PooledLims, self).__init__(baseuri, username, password, version)
+        self.request_session = session or LimsSession()
+        self.request_session.auth = (username, password)
+        self.adapter = self.request_session.adapter
+
+    def put(self, uri, data, params=dict()):
+        r = self.request_session.put(uri, data=data, params=params, headers=XML_HEADERS)
+        return self.parse_response(r)
+
+    def post(self, uri, data, params=dict()):
+        r = self.request_session.post(uri, data=data, params=params, headers=XML_HEADERS)
+        return self.parse_response(r, accept_status_codes=[200, 201, 202])
+
+    def delete(self, uri, params=dict()):
+        r = self.request_session.delete(uri, params=params, headers=XML_HEADERS)
+        return self.validate_response(r, accept_status_codes=[204])
+
+    def check_version(self):
+        """Raise ValueError if the API version of the LIMS does not match.
+        A LIMS is checked once per process, and processes forked by the EPP
+        worker (clinical_EPPs.worker) use the check of the worker."""
+
+        if (self.baseuri, self.VERSION) in self.checked_versions:
+            return
+        root = self.parse_response(self.request_session.get(self.baseuri + 'api'))
+        assert root.tag == nsmap('ver:versions')
+        for node in root.findall('version'):
+            if node.attrib['major'] == self.VERSION:
+                self.checked_versions.add((self.baseuri, self.VERSION))
+                return
+        raise ValueError('version mismatch')
+
+
+def get_lims(baseuri=BASEURI, username=USERNAME, password=PASSWORD, **session_args):
+    """Return a PooledLims for the LIMS in ~/.genologicsrc.
+
+    session_args are passed to LimsSession: pool_size, connect_timeout,
+    read_timeout, retries, backoff_factor and max_requests."""
+
+    return PooledLims(baseuri, username, password, session=LimsSession(**session_args))
@@ -0,0 +1,160 @@
+"""Index of the process history upstream of a step.
+
+Following the history of each artifact of a step separately, one parent
+process at a time, fetches the inputs of the same processes over and over
+for artifacts that went through the same plates. LineageIndex follows the
+history of all artifacts together, one process generation at a time: each
+process is visited once, and the inputs and samples of all processes in a
+generation are fetched with batch calls. Which input of a process carries a
+sample is then answered from memory. Samples are identified by id, since
+their names can be edited.
+
+Completed processes are read from the ProcessCache when there, and stored
+in it when not, so walks over old history make no requests at all.
+
+    lineage = LineageIndex(lims)
+    stop_processes = lineage.walk(artifacts, ['CG002 - Aliquot Samples for Library Pooling'])
+    for art, stop_process in stop_processes.items():
+        in_art = lineage.input_for(stop_process, art.samples[0].id)
+"""
+
+from genologics.entities import Artifact, Process
+
+from clinical_EPPs.batch import prefetch_artifacts
+from clinical_EPPs.process_cache import ProcessCache, is_completed
+
+from collections import OrderedDict
+
+
+def make_record(process):
+    """The ProcessCache record of a process with hydrated inputs and samples."""
+
+    inputs = []
+    for art in process.all_inputs():
+        parent_process = art.parent_process
+        inputs.append({'id': art.id, 'type': art.type,
+                       'parent_process': parent_process.id if parent_process else None,
+                       'sample_ids': [sample.id for sample in art.samples]})
+    outputs = list(OrderedDict.fromkeys(output['limsid'] for input, output in process.input_output_maps
+                                        if output and output.get('limsid')))
+    return {'type': process.type.name, 'date_run': process.date_run,
+            'inputs': inputs, 'outputs': outputs}
+
+
+class LineageIndex():
+    """Process -> sample id -> input artifact, for the processes in the
+    history of the artifacts given to walk().
+
+    process_cache is a ProcessCache, by default the shared one. Pass False
+    to always read the processes from the LIMS."""
+
+    def __init__(self, lims, process_cache=None):
+        self.lims = lims
+        self.process_cache = ProcessCache() if process_cache is None else process_cache
+        self.records = {}
+        self.sample_inputs = {}
+
+    def load(self, processes):
+        """Get the records of processes not yet visited: from the process
+        cache, or else from the LIMS with the input artifacts and their
+        samples hydrated with batch calls."""
+
+        process_ids = set(process.id for process in processes if process is not None)
+        process_ids -= set(self.records)
+        if not process_ids:
+            return
+        if self.process_cache:
+            self.records.update(self.process_cache.get(process_ids))
+            process_ids -= set(self.records)
+        new_processes = [Process(self.lims, id=process_id) for process_id in sorted(process_ids)]
+        inputs = []
+        for process in new_processes:
+            inputs += process.all_inputs()
+        prefetch_artifacts(self.lims, inputs, containers=False)
+        completed = {}
+        for process in new_processes:
+            self.records[process.id] = make_record(process)
+            if self.process_cache and is_completed(process):
+                completed[process.id] = self.records[process.id]
+        if completed:
+            self.process_cache.put(completed)
+
+    def process_type(self, process):
+        self.load([process])
+        return self.records[process.id]['type']
+
+    def inputs(self, process):
+        """The input records of process, see ProcessCache."""
+
+        self.load([process])
+        return self.records[process.id]['inputs']
+
+    def input_for(self, process, sample_id, analytes_only=False):
+        """The first input artifact of process that contains the sample with
+        id sample_id, or None."""
+
+        key = (process.id, analytes_only)
+        if key not in self.sample_inputs:
+            self.load([process])
+            sample_inputs = {}
+            for art in self.records[process.id]['inputs']:
+                if analytes_only and art['type'] != 'Analyte':
+                    continue
+                for art_sample_id in art['sample_ids']:
+                    sample_inputs.setdefault(art_sample_id, art)
+            self.sample_inputs[key] = sample_inputs
+        art = self.sample_inputs[key].get(sample_id)
+        if art is None:
+            return None
+        return Artifact(self.lims, id=art['id'])
+
+    def _parent_process(self, process, sample_id, analytes_only):
+        art = self.input_for(process, sample_id, analytes_only)
+        if art is None:
+            return None
+        parent_process_id = self.sample_inputs[(process.id, analytes_only)][sample_id]['parent_process']
+        return Process(self.lims, id=parent_process_id) if parent_process_id else None
+
+    def history(self, artifacts, stop_processes=None, analytes_only=False):
+        """Follow the history of the (first) sample of each artifact.
+
+        Returns a dict artifact -> list of (process, input artifact) from the
+        parent process of the artifact back to the first process of the
+        sample, or to the first process of a type in stop_processes.
+        analytes_only makes the walk follow analyte inputs only."""
+
+        prefetch_artifacts(self.lims, artifacts, containers=False)
+        result = OrderedDict()
+        active = []
+        for art in artifacts:
+            result[art] = []
+            if art.parent_process is not None:
+                active.append((art, art.samples[0].id, art.parent_process))
+        while active:
+            self.load([process for art, sample_id, process in active])
+            next_active = []
+            for art, sample_id, process in active:
+                result[art].append((process, self.input_for(process, sample_id, analytes_only)))
+                if stop_processes and self.process_type(process) in stop_processes:
+                    continue
+                parent_process = self._parent_process(process, sample_id, analytes_only)
+                if parent_process is not None:
+                    next_active.append((art, sample_id, parent_process))
+            active = next_active
+        return result
+
+    def walk(self, artifacts, stop_processes=None, analytes_only=False):
+        """With stop_processes, a list of process type names, find the first
+        process of one of those types in the history of each artifact, or
+        None if the sample never passed through any of them. Without
+        stop_processes, find the first process in the history of the sample.
+
+        Returns a dict artifact -> process."""
+
+        result = OrderedDict()
+        for art, steps in self.history(artifacts, stop_processes, analytes_only).items():
+            process = steps[-1][0] if steps else None
+            if stop_processes and process and self.process_type(process) not in stop_processes:
+                process = None
+            result[art] = process
+        return result
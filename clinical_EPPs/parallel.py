@@ -0,0 +1,89 @@
+"""Bounded thread pool map for per artifact and per sample LIMS calls.
+
+Most EPP loops do one or more LIMS round trips per artifact or sample, one
+after the other, although the entities are independent. pmap runs such a
+function on at most max_workers items at a time, in threads, and returns the
+results in the order of the items:
+
+    amounts = pmap(get_amount, sample_ids, max_workers=8)
+
+All items are processed even if some fail. The failures are then raised
+together as one MapError, which also holds the results of the items that
+succeeded.
+
+The requests of all workers go through the connection pool of the Lims
+session, so max_workers should not be larger than its pool size
+(clinical_EPPs.lims_client.POOL_SIZE) or the workers wait for connections.
+"""
+
+import threading
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+MAX_WORKERS = 8
+
+
+class MapError(Exception):
+    """Raised by pmap when func failed for some items, after all items were
+    processed. errors is a list of (index, item, exception) in item order,
+    and results the results of all items, None for the failed ones."""
+
+    def __init__(self, errors, results):
+        self.errors = errors
+        self.results = results
+        messages = ['%s: %s' % (getattr(item, 'id', item), exception) for index, item, exception in errors]
+        Exception.__init__(self, '%s of %s failed. %s' % (len(errors), len(results), '; '.join(messages)))
+
+    @property
+    def failed(self):
+        """The items that failed, in item order."""
+
+        return [item for index, item, exception in self.errors]
+
+
+def pmap(func, items, max_workers=MAX_WORKERS):
+    """Return [func(item) for item in items], with func running on at most
+    max_workers items at a time. Raises MapError if func raised for any item.
+    With max_workers 1, or a single item, func runs in the calling thread."""
+
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+    if max_workers <= 1 or len(items) <= 1:
+        for index, item in enumerate(items):
+            try:
+                results[index] = func(item)
+            except Exception as e:
+                errors.append((index, item, e))
+    else:
+        queue = Queue()
+        for index_item in enumerate(items):
+            queue.put(index_item)
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                try:
+                    index, item = queue.get_nowait()
+                except Empty:
+                    return
+                try:
+                    results[index] = func(item)
+                except Exception as e:
+                    with lock:
+                        errors.append((index, item, e))
+
+        threads = [threading.Thread(target=work) for i in range(min(max_workers, len(items)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            # join with a timeout so that Ctrl-C reaches the main thread
+            while thread.is_alive():
+                thread.join(0.1)
+    if errors:
+        raise MapError(sorted(errors, key=lambda error: error[0]), results)
+    return results
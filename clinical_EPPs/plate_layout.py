@@ -0,0 +1,132 @@
+"""Layouts of the 384 well qPCR plates.
+
+A layout tells which sample well of the 96 well plate, and which dilution,
+each well of the 384 well qPCR plate holds. It is computed from rules
+instead of being listed well by well:
+
+- Each sample gets a cell of 2 x 2 wells. The samples of 96 well row A are in
+  384 well rows A and B, those of row B in rows C and D, and so on.
+- The 384 well columns are split in one block per dilution, with the cells of
+  96 well column 1, 2, 3 ... from left to right in each block.
+- The replicates fill the cell positions given by the replicate offsets, by
+  default top left, top right and bottom left (TRIPLICATE).
+- The standards are in the free position of the cells in the first dilution
+  block, one standard per row, in as many columns as there are replicates.
+
+Wells are numbered row by row, A01 = 0, A02 = 1, ... P24 = 383, and the
+layout is held in arrays of that length so that whole columns of a result
+file can be mapped at once:
+
+    layout = get_layout()
+    sample_wells, dilutions = layout.map_wells(['A01', 'A09', 'B02'])
+    # ['A:1', 'A:1', 'Std:1'], [0, 1, -1] (dilution index in layout.dilutions)
+"""
+
+import numpy
+
+ROWS = 'ABCDEFGHIJKLMNOP'
+COLUMNS = 24
+DILUTIONS = ['1E03', '2E03', '1E04']
+STANDARDS = ['Std:1', 'Std:2', 'Std:3', 'Std:4', 'Std:5', 'Std:6', 'NTC']
+
+# (row, column) offsets of the replicates within the 2 x 2 cell of a sample
+TRIPLICATE = ((0, 0), (0, 1), (1, 0))
+DUPLICATE = ((0, 0), (0, 1))
+QUADRUPLICATE = ((0, 0), (0, 1), (1, 0), (1, 1))
+
+REPLICATE_LAYOUTS = {'triplicate': TRIPLICATE,
+                     'duplicate': DUPLICATE,
+                     'quadruplicate': QUADRUPLICATE}
+
+_layouts = {}
+
+
+def well_names():
+    """The names of the 384 wells, A01 ... P24, in well number order."""
+
+    return numpy.array(['%s%02d' % (row, column) for row in ROWS for column in range(1, COLUMNS + 1)])
+
+
+class PlateLayout():
+    """The sample well, dilution and replicate of each well of a 384 well
+    qPCR plate, in arrays indexed by well number. Wells without a sample
+    have sample well '' (or the name of a standard), dilution -1 and
+    replicate -1."""
+
+    def __init__(self, replicates=TRIPLICATE, dilutions=DILUTIONS, standards=STANDARDS):
+        self.replicates = tuple(replicates)
+        self.dilutions = list(dilutions)
+        sample_rows = len(ROWS) // 2
+        sample_columns = COLUMNS // (2 * len(self.dilutions))
+        self.wells = well_names()
+        sample_well = numpy.zeros((len(ROWS), COLUMNS), dtype=object)
+        sample_well[:] = ''
+        self.dilution = numpy.full((len(ROWS), COLUMNS), -1, dtype=int)
+        self.replicate = numpy.full((len(ROWS), COLUMNS), -1, dtype=int)
+        rows, columns = numpy.meshgrid(numpy.arange(sample_rows), numpy.arange(sample_columns), indexing='ij')
+        names = numpy.array(['%s:%d' % (ROWS[row], column + 1)
+                             for row, column in zip(rows.ravel(), columns.ravel())]).reshape(rows.shape)
+        for d in range(len(self.dilutions)):
+            for r, (row_offset, column_offset) in enumerate(self.replicates):
+                plate_rows = 2 * rows + row_offset
+                plate_columns = 2 * sample_columns * d + 2 * columns + column_offset
+                sample_well[plate_rows, plate_columns] = names
+                self.dilution[plate_rows, plate_columns] = d
+                self.replicate[plate_rows, plate_columns] = r
+        free = [(row, column) for row in (0, 1) for column in (0, 1) if (row, column) not in self.replicates]
+        if free:
+            row_offset, column_offset = free[0]
+            for row, standard in enumerate(standards[:sample_rows]):
+                for column in range(min(len(self.replicates), sample_columns)):
+                    sample_well[2 * row + row_offset, 2 * column + column_offset] = standard
+        self.sample_well = sample_well.ravel().astype(str)
+        self.dilution = self.dilution.ravel()
+        self.replicate = self.replicate.ravel()
+
+    def _parse(self, wells):
+        """The well numbers of an array of well names like A01 or A1, and a
+        mask of the names that are wells of the plate. The well number of
+        the others is 0."""
+
+        wells = numpy.char.upper(numpy.char.strip(numpy.asarray(wells, dtype=str)))
+        if not wells.size:
+            return numpy.zeros(wells.shape, dtype=int), numpy.ones(wells.shape, dtype=bool), wells
+        rows = numpy.char.find(ROWS, wells.astype(wells.dtype.kind + '1'))
+        numbers = numpy.char.lstrip(wells, ROWS)
+        valid = numpy.char.isdigit(numbers) & (numpy.char.str_len(wells) > 1) & (rows >= 0)
+        columns = numpy.where(valid, numbers, '0').astype(int)
+        valid &= (columns >= 1) & (columns <= COLUMNS)
+        return numpy.where(valid, rows * COLUMNS + columns - 1, 0), valid, wells
+
+    def positions(self, wells):
+        """The well numbers of an array of well names like A01 or A1.
+        Raises ValueError for names that are not wells of the plate."""
+
+        positions, valid, wells = self._parse(wells)
+        if not valid.all():
+            raise ValueError('Not wells of a 384 well plate: %s' % ', '.join(wells[~valid]))
+        return positions
+
+    def map_wells(self, wells):
+        """Return the arrays of sample wells and dilution indexes of wells.
+        Names that are not wells of the plate, eg. a blank row, get sample
+        well '' and dilution -1, as the wells without a sample."""
+
+        positions, valid, wells = self._parse(wells)
+        return (numpy.where(valid, self.sample_well[positions], ''),
+                numpy.where(valid, self.dilution[positions], -1))
+
+    def well_transformer(self):
+        """The layout as a dict well -> {'well': sample well, 'dilut': dilution}"""
+
+        return dict((well, {'well': str(sample_well), 'dilut': self.dilutions[d] if d >= 0 else ''})
+                    for well, sample_well, d in zip(self.wells, self.sample_well, self.dilution))
+
+
+def get_layout(replicates='triplicate'):
+    """The PlateLayout with the dilutions and standards of the qPCR steps,
+    for a replicate layout in REPLICATE_LAYOUTS. Layouts are computed once."""
+
+    if replicates not in _layouts:
+        _layouts[replicates] = PlateLayout(REPLICATE_LAYOUTS[replicates])
+    return _layouts[replicates]
@@ -0,0 +1,113 @@
+"""Persistent cache of completed processes.
+
+A process can not change once its step is completed, and neither can the
+parent processes and samples of its input artifacts. Sample names can be
+edited, so the samples are kept by id. ProcessCache keeps what
+the history walks need from completed processes in an SQLite database:
+type name, date run, inputs and outputs. Processes that are still open are
+never stored, so they are always read from the LIMS.
+
+The database is shared by all EPP runs on the server (see clinical_EPPs.cache).
+When it grows over max_bytes, the least recently used processes are evicted.
+"""
+
+from requests.exceptions import HTTPError
+
+import json
+import time
+
+from clinical_EPPs.cache import connect
+
+DB_FILE = 'processes.sqlite'
+MAX_BYTES = 200 * 1024 * 1024
+COMPLETED = 'Completed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS process (
+    id TEXT PRIMARY KEY,
+    type TEXT,
+    date_run TEXT,
+    inputs TEXT NOT NULL,
+    outputs TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS process_accessed ON process (accessed);
+"""
+
+
+def is_completed(process):
+    """True if the step of the process is completed. Processes without a
+    step in the LIMS count as not completed."""
+
+    try:
+        return process.step.current_state == COMPLETED
+    except HTTPError:
+        return False
+
+
+class ProcessCache():
+    """Completed process id -> {'type', 'date_run', 'inputs', 'outputs'}
+
+    inputs is a list of dicts with the keys 'id', 'type', 'parent_process'
+    (an id or None) and 'sample_ids' for each input artifact. outputs is a
+    list of output artifact ids."""
+
+    def __init__(self, max_bytes=MAX_BYTES, db_file=DB_FILE, **connect_args):
+        self.max_bytes = max_bytes
+        self.connection = connect(db_file, SCHEMA, **connect_args)
+
+    def get(self, process_ids):
+        """Return a dict process id -> process record for the cached ones."""
+
+        process_ids = list(set(process_ids))
+        found = {}
+        for i in range(0, len(process_ids), 500):
+            chunk = process_ids[i:i + 500]
+            rows = self.connection.execute(
+                'SELECT id, type, date_run, inputs, outputs FROM process WHERE id IN (%s)'
+                % ','.join('?' * len(chunk)), chunk)
+            for process_id, type_name, date_run, inputs, outputs in rows:
+                found[process_id] = {'type': type_name, 'date_run': date_run,
+                                     'inputs': json.loads(inputs), 'outputs': json.loads(outputs)}
+        if found:
+            with self.connection:
+                self.connection.executemany('UPDATE process SET accessed = ? WHERE id = ?',
+                                            [(time.time(), process_id) for process_id in found])
+        return found
+
+    def put(self, records):
+        """Store records, a dict process id -> process record, and evict
+        the least recently used processes if the cache is too big."""
+
+        if not records:
+            return
+        now = time.time()
+        rows = []
+        for process_id, record in records.items():
+            inputs = json.dumps(record['inputs'])
+            outputs = json.dumps(record['outputs'])
+            size = len(inputs) + len(outputs) + len(process_id)
+            rows.append((process_id, record['type'], record['date_run'], inputs, outputs, size, now))
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO process (id, type, date_run, inputs, outputs, size, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used processes until the stored size is
+        below 90% of max_bytes."""
+
+        with self.connection:
+            total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM process').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            to_free = total - int(0.9 * self.max_bytes)
+            evict_ids = []
+            for process_id, size in self.connection.execute('SELECT id, size FROM process ORDER BY accessed'):
+                if to_free <= 0:
+                    break
+                evict_ids.append((process_id,))
+                to_free -= size
+            self.connection.executemany('DELETE FROM process WHERE id = ?', evict_ids)
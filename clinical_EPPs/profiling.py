@@ -0,0 +1,220 @@
+"""Per run profile of the LIMS requests and phases of an EPP.
+
+With --profile, an EPP records every request of its Lims session: count,
+bytes sent and received and a latency histogram, per endpoint (method and
+path with the LIMS ids replaced by {id}) and per entity type. It also records
+the time spent in each phase, where the phases are the methods of the
+classes of the EPP script, eg. get_artifacts and set_udfs, and any block in
+a profile.phase(name). Requests are counted in the innermost phase running
+when they are sent; requests from worker threads (clinical_EPPs.parallel)
+count in the phase of the main thread.
+
+The summary is written as JSON next to the EPP log file, as
+<log file>.profile.json, or to <script>.profile.json in the working
+directory if the EPP has no log file:
+
+    parser.add_argument('--profile', action='store_true', help=PROFILE_HELP)
+    args = parser.parse_args()
+    lims = get_lims()
+    with profiled(lims, args):
+        main(lims, args)
+
+The EPPs do this through clinical_EPPs.epp_run.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+import functools
+import inspect
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+PROFILE_HELP = 'Write the LIMS requests and the time of each phase to <log file>.profile.json'
+
+# Upper bounds in ms of the latency histogram buckets
+LATENCY_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+BUCKET_NAMES = ['<=%d' % bound for bound in LATENCY_BUCKETS] + ['>%d' % LATENCY_BUCKETS[-1]]
+
+# Path segments that are not LIMS ids
+RESOURCE_SEGMENT = re.compile('^[a-z][a-z-]*$')
+
+
+def endpoint(method, url):
+    """(endpoint, entity type) of a request, eg. ('GET artifacts/{id}',
+    'artifacts') for GET .../api/v2/artifacts/2-1234?state=5."""
+
+    path = urlparse(url).path.strip('/').split('/')
+    if 'api' in path:
+        path = path[path.index('api') + 2:]
+    path = [segment if RESOURCE_SEGMENT.match(segment) else '{id}' for segment in path]
+    return '%s %s' % (method, '/'.join(path)), path[0] if path else ''
+
+
+def _bucket(milliseconds):
+    for bound, name in zip(LATENCY_BUCKETS, BUCKET_NAMES):
+        if milliseconds <= bound:
+            return name
+    return BUCKET_NAMES[-1]
+
+
+class _Stats():
+    """Count, bytes, seconds and latency histogram of a set of requests."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.seconds = 0.0
+        self.histogram = OrderedDict((name, 0) for name in BUCKET_NAMES)
+
+    def add(self, seconds, sent, received, error):
+        self.count += 1
+        self.errors += error
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.seconds += seconds
+        self.histogram[_bucket(1000 * seconds)] += 1
+
+    def summary(self):
+        return OrderedDict([('count', self.count), ('errors', self.errors),
+                            ('bytes_sent', self.bytes_sent), ('bytes_received', self.bytes_received),
+                            ('seconds', round(self.seconds, 6)), ('latency_ms', self.histogram)])
+
+
+class Profile():
+    """Records the requests of requests sessions and the time of phases."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.total = _Stats()
+        self.endpoints = {}
+        self.entities = {}
+        self.phases = OrderedDict()
+        self.local = threading.local()
+        self.main_stack = self._stack()
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def instrument(self, session):
+        """Record the requests of a requests session, eg. lims.request_session."""
+
+        session.hooks['response'].append(self._record)
+
+    def _record(self, response, *args, **kwargs):
+        # The body is read here, so that its download counts in the latency
+        start = time.time()
+        received = len(response.content or b'')
+        seconds = response.elapsed.total_seconds() + time.time() - start
+        body = response.request.body or b''
+        sent = len(body.encode('utf-8') if not isinstance(body, bytes) else body)
+        name, entity = endpoint(response.request.method, response.request.url)
+        stack = self._stack() or self.main_stack
+        with self.lock:
+            self.total.add(seconds, sent, received, response.status_code >= 400)
+            self.endpoints.setdefault(name, _Stats()).add(seconds, sent, received, response.status_code >= 400)
+            self.entities.setdefault(entity, _Stats()).add(seconds, sent, received, response.status_code >= 400)
+            if stack:
+                self.phases[stack[-1]]['requests'] += 1
+        return response
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block as phase name. The time of a phase entered again within
+        itself, eg. by recursion, is counted once."""
+
+        stack = self._stack()
+        with self.lock:
+            phase = self.phases.setdefault(name, OrderedDict([('calls', 0), ('seconds', 0.0), ('requests', 0)]))
+            phase['calls'] += 1
+        outer = name not in stack
+        stack.append(name)
+        start = time.time()
+        try:
+            yield
+        finally:
+            stack.pop()
+            if outer:
+                with self.lock:
+                    phase['seconds'] += time.time() - start
+
+    def instrument_module(self, module):
+        """Time the methods of the classes defined in module as phases named
+        after the methods, and __init__ after the class."""
+
+        for klass in vars(module).values():
+            if not inspect.isclass(klass) or klass.__module__ != module.__name__:
+                continue
+            for attr, func in list(vars(klass).items()):
+                if not inspect.isfunction(func) or (attr.startswith('__') and attr != '__init__'):
+                    continue
+                setattr(klass, attr, self._timed(klass.__name__ if attr == '__init__' else attr, func))
+
+    def _timed(self, name, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def summary(self):
+        by_count = lambda stats: sorted(stats.items(), key=lambda item: (-item[1].count, item[0]))
+        phases = OrderedDict()
+        for name, phase in self.phases.items():
+            phases[name] = OrderedDict([('calls', phase['calls']), ('seconds', round(phase['seconds'], 6)),
+                                        ('requests', phase['requests'])])
+        return OrderedDict([
+            ('script', os.path.basename(sys.argv[0])),
+            ('argv', sys.argv[1:]),
+            ('started', datetime.fromtimestamp(self.started).isoformat()),
+            ('seconds', round(time.time() - self.started, 6)),
+            ('requests', self.total.summary()),
+            ('endpoints', OrderedDict((name, stats.summary()) for name, stats in by_count(self.endpoints))),
+            ('entities', OrderedDict((name, stats.summary()) for name, stats in by_count(self.entities))),
+            ('phases', phases)])
+
+    def write(self, path):
+        with open(path, 'w') as profile_file:
+            json.dump(self.summary(), profile_file, indent=2)
+
+
+def profile_path(log=None):
+    """<log>.profile.json, or <script>.profile.json if log is not a file name."""
+
+    if log and isinstance(log, str):
+        return log + '.profile.json'
+    return os.path.splitext(os.path.basename(sys.argv[0]))[0] + '.profile.json'
+
+
+@contextmanager
+def profiled(lims, args, module=None):
+    """Profile the block if args.profile, and write the summary when it ends,
+    also when it ends with sys.exit. The phases are the methods of the
+    classes in module, by default the script run."""
+
+    if not getattr(args, 'profile', False):
+        yield None
+        return
+    profile = Profile()
+    profile.instrument(lims.request_session)
+    profile.instrument_module(module or sys.modules['__main__'])
+    try:
+        with profile.phase('main'):
+            yield profile
+    finally:
+        profile.write(profile_path(getattr(args, 'log', None)))
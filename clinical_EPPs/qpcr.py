@@ -0,0 +1,375 @@
+"""Whole plate check of qPCR dilution series.
+
+The Cq and SQ values of all samples on a qPCR plate are held in
+(samples x dilutions x replicates) masked arrays, and the two checks of
+am doc 1499 are run as passes over all samples at once:
+
+CHECK 1. The Cq values within a dilution may differ by at most 0.4. If
+    they differ more, the value differing most from the mean is removed.
+    If the remaining values still differ more than 0.4, the sample fails.
+CHECK 2. mean(1E04) - mean(1E03) must be within 2.5 and 5, and
+    mean(2E03) - mean(1E03) within 0.7 and 1.5. While they are not, the
+    biggest outlyer of the dilutions involved is removed. A dilution that
+    already lost a value fails the sample.
+
+The rules are those for triplicates, which remove at most one replicate
+per dilution. With quadruplicates one replicate per dilution is removed the
+same way. With duplicates no outlyer can be told apart, so a dilution range
+or distance out of bounds fails the sample right away.
+
+The passes follow the per sample rules of the qPCR_dilution EPPs step by
+step, including the order in which dilutions are visited and the log
+messages written, so that removed replicates, failed samples and
+concentrations are the same as when the samples were checked one by one.
+The means are the ones of statistics.mean: the sums are exact in extended
+precision and rounded the same way. Rows where extended precision is not
+enough fall back to statistics.mean.
+
+    plate = DilutionPlate(dilution_data, wells, replicates=3)
+    plate.check_dilution_range()
+    plate.check_distance_find_outlyer()
+    for result in plate.results(size_bp=470):
+        print result.well, result.failed_sample, result.concentration
+"""
+
+from __future__ import division
+
+from statistics import mean
+
+import math
+import numpy
+import numpy.ma as ma
+
+# The dilutions in the iteration order of a dict keyed on them, which is the
+# order the per sample checks visited them in.
+DILUTIONS = list(dict.fromkeys(['1E03', '2E03', '1E04']))
+D1E03, D2E03, D1E04 = [DILUTIONS.index(dil) for dil in ['1E03', '2E03', '1E04']]
+
+MAX_RANGE = 0.4
+D1_RANGE = (2.5, 5)
+D2_RANGE = (0.7, 1.5)
+
+# Replicates per dilution needed to remove an outlyer and keep two values
+MIN_OUTLYER_REPLICATES = 3
+
+# Codes in DilutionPlate.index for no removed replicate and failed dilution
+NONE = -1
+FAIL = -2
+
+REMOVED_BY = {1: 'range', 2: 'distance'}
+
+# statistics.mean rounds the sum before dividing by n in Python 2 and before
+# Python 3.8, and rounds the exact mean in later versions.
+_PROBE = [20.178, 25.225, 23.099]
+SUM_ROUNDED_FIRST = mean(_PROBE) == math.fsum(_PROBE) / len(_PROBE)
+
+# Bits needed for an exact sum of three doubles with exponents at most
+# MAX_EXPONENT_SPREAD apart
+MAX_EXPONENT_SPREAD = 4
+EXACT_SUMS = numpy.finfo(numpy.longdouble).nmant >= 63
+
+
+def masked_means(values):
+    """statistics.mean along the last axis of a 2D masked array, for rows
+    with one to three values."""
+
+    data = values.filled(0).astype(float)
+    count = values.count(axis=-1)
+    exponents = numpy.frexp(data)[1]
+    nonzero = data != 0
+    spread = (numpy.where(nonzero, exponents, -10000).max(axis=-1) -
+              numpy.where(nonzero, exponents, 10000).min(axis=-1))
+    fast = (count > 0) & (count <= 3) & ((spread <= MAX_EXPONENT_SPREAD) | ~nonzero.any(axis=-1))
+    if not EXACT_SUMS:
+        fast[:] = False
+    means = numpy.zeros(len(data))
+    sums = data[fast].astype(numpy.longdouble).sum(axis=-1)
+    if SUM_ROUNDED_FIRST:
+        means[fast] = sums.astype(float) / count[fast]
+    else:
+        means[fast] = (sums / count[fast]).astype(float)
+    for row in numpy.nonzero(~fast)[0]:
+        means[row] = mean(list(values[row].compressed()))
+    return means
+
+
+def masked_medians(values):
+    """numpy.median along the last axis of a 2D masked array, for rows
+    with at least one value."""
+
+    count = values.count(axis=-1)
+    ordered = numpy.sort(values.filled(numpy.inf), axis=-1)
+    rows = numpy.arange(len(ordered))
+    upper = ordered[rows, count // 2]
+    lower = ordered[rows, numpy.maximum(count - 1, 0) // 2]
+    return numpy.where(count % 2 == 1, upper, (lower + upper) / 2)
+
+
+def argmax(values):
+    """Position of the first maximum of each row of a 2D masked array."""
+
+    return values.filled(-numpy.inf).argmax(axis=-1)
+
+
+class DilutionResult():
+    """The outcome of the checks for one sample.
+
+    Cq: dilution -> the Cq values left after removing outlyers
+    index: dilution -> None, the position of the removed replicate or 'Fail'
+    poped_dilutes: dilution -> the removed Cq value or None
+    removed_by: dilution -> 'range' (CHECK 1), 'distance' (CHECK 2) or None
+    log: the messages of the checks for the sample
+    error: True if the sample could not be checked, eg. a dilution without values
+    concentration: size adjusted molar concentration, for passed samples"""
+
+    def __init__(self, well, Cq, index, poped_dilutes, removed_by, failed_sample,
+                 error, log, concentration):
+        self.well = well
+        self.Cq = Cq
+        self.index = index
+        self.poped_dilutes = poped_dilutes
+        self.removed_by = removed_by
+        self.failed_sample = failed_sample
+        self.error = error
+        self.log = log
+        self.concentration = concentration
+
+
+class DilutionPlate():
+    """The qPCR dilution checks for all samples of a plate.
+
+    dilution_data is the dict well -> {'SQ'/'Cq' -> dilution -> values} read
+    from the qPCR result file, and wells the original well of each sample.
+    replicates is the number of replicates per dilution of the plate layout.
+    Wells without data give results with error set."""
+
+    def __init__(self, dilution_data, wells, replicates=3):
+        self.wells = list(wells)
+        self.replicates = replicates
+        nr_samples = len(self.wells)
+        replicates = max([replicates] + [len(values) for data in dilution_data.values()
+                                         for values in data['Cq'].values()])
+        shape = (nr_samples, len(DILUTIONS), replicates)
+        Cq = numpy.zeros(shape)
+        SQ = numpy.zeros(shape)
+        count = numpy.zeros(shape[:2], dtype=int)
+        self.error = numpy.zeros(nr_samples, dtype=bool)
+        for i, well in enumerate(self.wells):
+            if well not in dilution_data:
+                self.error[i] = True
+                continue
+            for d, dil in enumerate(DILUTIONS):
+                values = dilution_data[well]['Cq'][dil]
+                count[i, d] = len(values)
+                Cq[i, d, :len(values)] = values
+                SQ[i, d, :len(values)] = dilution_data[well]['SQ'][dil]
+        mask = numpy.arange(replicates) >= count[:, :, numpy.newaxis]
+        self.Cq = ma.masked_array(Cq, mask=mask.copy())
+        self.SQ = ma.masked_array(SQ, mask=mask.copy())
+        self.index = numpy.full(shape[:2], NONE, dtype=int)
+        self.poped = numpy.full(shape[:2], numpy.nan)
+        self.removed_by = numpy.zeros(shape[:2], dtype=int)
+        self.failed_sample = numpy.zeros(nr_samples, dtype=bool)
+        self.logs = [[] for well in self.wells]
+
+    def _values_str(self, i, d):
+        return str([float(value) for value in self.Cq[i, d].compressed()])
+
+    def _pop(self, values, rows, d, positions):
+        """Remove the replicates at positions from the dilution d of rows,
+        moving the later replicates one step forward like list.pop."""
+
+        replicates = values.shape[2]
+        source = numpy.arange(replicates) + (numpy.arange(replicates) >= positions[:, numpy.newaxis])
+        source = numpy.minimum(source, replicates - 1)
+        data = values.data[rows, d][numpy.arange(len(rows))[:, numpy.newaxis], source]
+        mask = values.mask[rows, d][numpy.arange(len(rows))[:, numpy.newaxis], source]
+        mask[numpy.arange(len(rows)), values[rows, d].count(axis=-1) - 1] = True
+        values.data[rows, d] = data
+        values.mask[rows, d] = mask
+
+    def _remove(self, rows, d, positions, reason):
+        self.poped[rows, d] = self.Cq.data[rows, d, positions]
+        self.removed_by[rows, d] = reason
+        self._pop(self.Cq, rows, d, positions)
+
+    def _range(self, rows, d):
+        values = self.Cq[rows, d]
+        return values.max(axis=-1).filled(0) - values.min(axis=-1).filled(0)
+
+    def _error_log_msg(self, rows, d):
+        """Log for failed samples"""
+        for i in rows:
+            poped = None if numpy.isnan(self.poped[i, d]) else float(self.poped[i, d])
+            self.logs[i].append(DILUTIONS[d] + ' Measurements : ' + self._values_str(i, d) + '\n')
+            self.logs[i].append('Removed measurement: ' + str(poped) + '\n')
+            self.logs[i].append('One outlyer removed, but distance still to big. \n\n')
+
+    def _fail(self, rows, d):
+        self.failed_sample[rows] = True
+        self.index[rows, d] = FAIL
+
+    def check_dilution_range(self):
+        """CHECK 1, for all samples, one dilution at a time."""
+
+        done = self.error.copy()
+        for d, dil in enumerate(DILUTIONS):
+            empty = ~done & (self.Cq[:, d].count(axis=-1) == 0)
+            self.error |= empty
+            done |= empty
+            rows = numpy.nonzero(~done)[0]
+            rows = rows[self._range(rows, d) > MAX_RANGE]
+            if not len(rows):
+                continue
+            error_msgs = ['To vide range of values for dilution: ' + dil + ' : ' + self._values_str(i, d)
+                          for i in rows]
+            if self.replicates < MIN_OUTLYER_REPLICATES:
+                for i, error_msg in zip(rows, error_msgs):
+                    self.logs[i].append(error_msg)
+                self._fail(rows, d)
+                done[rows] = True
+                continue
+            diff_from_mean = abs(self.Cq[rows, d] - masked_means(self.Cq[rows, d])[:, numpy.newaxis])
+            positions = argmax(diff_from_mean)
+            self.index[rows, d] = positions
+            self._remove(rows, d, positions, 1)
+            still_wide = self._range(rows, d) > MAX_RANGE
+            for j in numpy.nonzero(still_wide)[0]:
+                self.logs[rows[j]].append(error_msgs[j])
+            self._fail(rows[still_wide], d)
+            done[rows[still_wide]] = True
+
+    def _check_distance(self, rows):
+        means = [masked_means(self.Cq[rows, d]) for d in range(len(DILUTIONS))]
+        D1 = means[D1E04] - means[D1E03]
+        D2 = means[D2E03] - means[D1E03]
+        return ((D1_RANGE[0] < D1) & (D1 < D1_RANGE[1]),
+                (D2_RANGE[0] < D2) & (D2 < D2_RANGE[1]))
+
+    def _diff_from_mean(self, rows, d):
+        values = self.Cq[rows, d]
+        return abs(values - masked_means(values)[:, numpy.newaxis])
+
+    def _diff_from_median(self, rows, d):
+        values = self.Cq[rows, d]
+        medians = masked_medians(values)[:, numpy.newaxis]
+        return abs(values - medians) / medians
+
+    def _find_outlyer(self, rows, D1_in_range, D2_in_range):
+        """One outlyer search of CHECK 2 for rows. Returns the rows that
+        stopped the search early."""
+
+        stopped = numpy.zeros(len(rows), dtype=bool)
+        control_1E03 = numpy.zeros(len(rows), dtype=bool)
+
+        sel = ~D1_in_range
+        if sel.any():
+            diff_1E03 = self._diff_from_mean(rows[sel], D1E03)
+            diff_1E04 = self._diff_from_mean(rows[sel], D1E04)
+            pick_1E03 = diff_1E03.max(axis=-1).filled(0) > diff_1E04.max(axis=-1).filled(0)
+            for d, diff, pick in [(D1E03, diff_1E03, pick_1E03), (D1E04, diff_1E04, ~pick_1E03)]:
+                removed = self.index[rows[sel], d] >= 0
+                failing = rows[sel][pick & removed]
+                self._error_log_msg(failing, d)
+                self._fail(failing, d)
+                stopped[numpy.nonzero(sel)[0][pick & removed]] = True
+                found = pick & ~removed
+                self.index[rows[sel][found], d] = argmax(diff[found])
+                if d == D1E03:
+                    control_1E03[numpy.nonzero(sel)[0][found]] = True
+
+        sel = ~D2_in_range & ~stopped
+        if sel.any():
+            diff_2E03 = self._diff_from_median(rows[sel], D2E03)
+            diff_1E03 = self._diff_from_median(rows[sel], D1E03)
+            pick_2E03 = diff_2E03.max(axis=-1).filled(0) > diff_1E03.max(axis=-1).filled(0)
+            removed = self.index[rows[sel], D2E03] >= 0
+            failing = rows[sel][pick_2E03 & removed]
+            self._error_log_msg(failing, D2E03)
+            self._fail(failing, D2E03)
+            found = pick_2E03 & ~removed
+            self.index[rows[sel][found], D2E03] = argmax(diff_2E03[found])
+
+            control = control_1E03[sel]
+            index_1E03 = self.index[rows[sel], D1E03]
+            pick_1E03 = ~pick_2E03 & (index_1E03 != NONE)
+            conflicting = rows[sel][pick_1E03 & control & (index_1E03 != 0)]
+            for i in conflicting:
+                self.logs[i].append('Distance to big. Conflicting outlyers. ')
+            self._fail(conflicting, D1E03)
+            failing = rows[sel][pick_1E03 & ~control]
+            self._error_log_msg(failing, D1E03)
+            self._fail(failing, D1E03)
+            found = ~pick_2E03 & (index_1E03 == NONE)
+            self.index[rows[sel][found], D1E03] = argmax(diff_1E03[found])
+
+    def _fail_distance(self, rows, D1_in_range):
+        """Fail rows out of the CHECK 2 bounds without looking for an
+        outlyer, for layouts with too few replicates."""
+
+        for i in rows:
+            self.logs[i].append('Distance to big. Too few replicates to remove an outlyer. \n\n')
+        self._fail(rows[~D1_in_range], D1E04)
+        self._fail(rows[D1_in_range], D2E03)
+
+    def check_distance_find_outlyer(self):
+        """CHECK 2, for all samples that could be checked. Like the per
+        sample check, it is run also for samples that failed CHECK 1.
+        An outlyer is removed from a dilution that still has all its
+        replicates."""
+
+        counts = self.Cq.count(axis=-1)
+        self.error |= (counts == 0).any(axis=-1)
+        rows = numpy.nonzero(~self.error)[0]
+        D1_in_range, D2_in_range = self._check_distance(rows)
+        while len(rows):
+            outside = ~(D1_in_range & D2_in_range)
+            rows, D1_in_range, D2_in_range = rows[outside], D1_in_range[outside], D2_in_range[outside]
+            if not len(rows):
+                break
+            if self.replicates < MIN_OUTLYER_REPLICATES:
+                self._fail_distance(rows, D1_in_range)
+                break
+            self._find_outlyer(rows, D1_in_range, D2_in_range)
+            rows = rows[~self.failed_sample[rows]]
+            for d in range(len(DILUTIONS)):
+                positions = self.index[rows, d]
+                popping = (positions >= 0) & (self.Cq[rows, d].count(axis=-1) == self.replicates)
+                if popping.any():
+                    self._remove(rows[popping], d, positions[popping], 2)
+            D1_in_range, D2_in_range = self._check_distance(rows)
+
+    def concentrations(self, size_bp):
+        """Size adjusted molar concentration of each sample, from the SQ
+        values left after removing the outlyers. NaN for failed samples."""
+
+        passed = numpy.nonzero(~(self.error | self.failed_sample))[0]
+        SQ = self.SQ.copy()
+        for d in range(len(DILUTIONS)):
+            positions = self.index[passed, d]
+            removed = positions >= 0
+            if removed.any():
+                self._pop(SQ, passed[removed], d, positions[removed])
+        means = [masked_means(SQ[passed, d]) for d in range(len(DILUTIONS))]
+        orig_conc = (means[D1E03] * 1000 + means[D2E03] * 2000 + means[D1E04] * 10000) / 3
+        concentrations = numpy.full(len(self.wells), numpy.nan)
+        concentrations[passed] = orig_conc * (452 / size_bp)
+        return concentrations
+
+    def results(self, size_bp):
+        """A DilutionResult for each well, in the order of the wells."""
+
+        concentrations = self.concentrations(size_bp)
+        results = []
+        for i, well in enumerate(self.wells):
+            index, poped, removed_by, Cq = {}, {}, {}, {}
+            for d, dil in enumerate(DILUTIONS):
+                code = int(self.index[i, d])
+                index[dil] = {NONE: None, FAIL: 'Fail'}.get(code, code)
+                poped[dil] = None if numpy.isnan(self.poped[i, d]) else float(self.poped[i, d])
+                removed_by[dil] = REMOVED_BY.get(self.removed_by[i, d])
+                Cq[dil] = [float(value) for value in self.Cq[i, d].compressed()]
+            concentration = None if numpy.isnan(concentrations[i]) else float(concentrations[i])
+            results.append(DilutionResult(well, Cq, index, poped, removed_by, bool(self.failed_sample[i]),
+                                          bool(self.error[i]), ''.join(self.logs[i]), concentration))
+        return results
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+"""Ledger of the passed sequencing lanes of each sample.
+
+Summing the reads of a sample from all its sequencing artifacts in the LIMS
+re-reads the whole history of the sample every time reads are aggregated,
+although only the latest run changed. ReadsLedger keeps one row per
+(sample, sequencing artifact) for the lanes that passed QC, in an SQLite
+database (see clinical_EPPs.cache), and appends every change of a lane to an
+entry log. The total of a sample is kept together with the last entry it
+includes, so a new total is the old one plus the entries added since. Each
+set of sequencing process types has its own database file, so ledgers of
+different sets never share lanes or totals.
+
+Lanes get into the ledger in three ways:
+- backfill() reads all lanes of samples the ledger has not seen before.
+- refresh() lists the passed lanes of samples already in the ledger, reads
+  them all with batch calls, records the new ones and the ones whose reads
+  changed, and removes the ones that are no longer passed. It does not
+  depend on the sequencing processes being modified when their artifacts
+  are, eg. by bcl2fastq or a manual QC change.
+- sync() reads the outputs of the sequencing processes modified since the
+  last sync, so the LIMS work is proportional to the new lanes.
+
+Run as a module, the ledger refreshes and backfills the given samples and
+shows their totals:
+
+    python -m clinical_EPPs.reads_ledger -s 'CG002 - Illumina Sequencing (Illumina SBS)' ACC123A1
+
+An audit re-reads all lanes of the samples from the LIMS, recomputes the
+totals from scratch and reports the samples whose totals were off:
+
+    python -m clinical_EPPs.reads_ledger --rebuild -s 'CG002 - Illumina Sequencing (Illumina SBS)'
+"""
+
+from argparse import ArgumentParser
+
+import hashlib
+import time
+import logging
+
+from clinical_EPPs.batch import get_batch, prefetch_artifacts, chunks
+from clinical_EPPs.cache import connect
+
+DB_FILE = 'reads_ledger_%s.sqlite'
+# Processes modified this long before the last sync are read again
+SYNC_OVERLAP = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lane (
+    sample_id TEXT NOT NULL,
+    artifact_id TEXT NOT NULL,
+    reads REAL NOT NULL,
+    PRIMARY KEY (sample_id, artifact_id)
+);
+CREATE TABLE IF NOT EXISTS entry (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    sample_id TEXT NOT NULL,
+    artifact_id TEXT NOT NULL,
+    reads REAL NOT NULL,
+    lanes INTEGER NOT NULL,
+    recorded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entry_sample ON entry (sample_id, seq);
+CREATE TABLE IF NOT EXISTS total (
+    sample_id TEXT PRIMARY KEY,
+    reads REAL NOT NULL,
+    lanes INTEGER NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sample (
+    sample_id TEXT PRIMARY KEY,
+    backfilled REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync (
+    process_types TEXT PRIMARY KEY,
+    synced REAL NOT NULL
+);
+"""
+
+
+def passed_lanes(artifacts):
+    """(sample id, artifact id, reads) for each sample of the artifacts with
+    QC flag PASSED and # Reads set. Artifacts with other QC flags give
+    (sample id, artifact id, None)."""
+
+    lanes = []
+    for art in artifacts:
+        passed = art.qc_flag == 'PASSED' and '# Reads' in art.udf
+        reads = float(art.udf.get('# Reads')) if passed else None
+        for sample in art.samples:
+            lanes.append((sample.id, art.id, reads))
+    return lanes
+
+
+def ledger_file(process_types, db_file=DB_FILE):
+    """The database file of the ledger of a set of process types."""
+
+    key = '|'.join(sorted(process_types)).encode('utf-8')
+    return db_file % hashlib.sha1(key).hexdigest()[:12]
+
+
+def _last_modified(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(timestamp))
+
+
+class ReadsLedger():
+    """Sample id -> passed lanes and total reads of the sequencing processes
+    of process_types. db_file is by default the file of the process types,
+    see ledger_file."""
+
+    def __init__(self, lims, process_types, db_file=None, **connect_args):
+        self.lims = lims
+        self.process_types = sorted(process_types)
+        self.connection = connect(db_file or ledger_file(self.process_types), SCHEMA, **connect_args)
+
+    def _in(self, query, ids):
+        """Run query, with %s for a list of placeholders, on ids in chunks."""
+
+        rows = []
+        for chunk in chunks(list(ids), 500):
+            rows += self.connection.execute(query % ','.join('?' * len(chunk)), chunk).fetchall()
+        return rows
+
+    def record(self, lanes, sample_ids=None):
+        """Store lanes, (sample id, artifact id, reads or None if not passed),
+        and log the changes as entries. With sample_ids, lanes is the complete
+        list of lanes of those samples, and stored lanes missing in it are
+        removed. Returns the number of changed lanes."""
+
+        new = dict(((sample_id, art_id), reads) for sample_id, art_id, reads in lanes)
+        lane_samples = set(sample_id for sample_id, art_id in new)
+        if sample_ids is not None:
+            lane_samples |= set(sample_ids)
+        stored = dict(((sample_id, art_id), reads) for sample_id, art_id, reads in
+                      self._in('SELECT sample_id, artifact_id, reads FROM lane WHERE sample_id IN (%s)', lane_samples))
+        if sample_ids is not None:
+            sample_ids = set(sample_ids)
+            for key in stored:
+                if key[0] in sample_ids and key not in new:
+                    new[key] = None
+        now = time.time()
+        entries = []
+        for key, reads in new.items():
+            old_reads = stored.get(key)
+            if reads == old_reads:
+                continue
+            entries.append(key + ((reads or 0.0) - (old_reads or 0.0),
+                                  (reads is not None) - (old_reads is not None), now))
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO entry (sample_id, artifact_id, reads, lanes, recorded) VALUES (?, ?, ?, ?, ?)', entries)
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO lane (sample_id, artifact_id, reads) VALUES (?, ?, ?)',
+                [key + (reads,) for key, reads in new.items() if reads is not None])
+            self.connection.executemany(
+                'DELETE FROM lane WHERE sample_id = ? AND artifact_id = ?',
+                [key for key, reads in new.items() if reads is None and key in stored])
+        return len(entries)
+
+    def sync(self):
+        """Record the lanes of the sequencing processes modified since the
+        last sync. The first sync only sets the starting point; earlier lanes
+        are read by backfill(). Returns the number of changed lanes."""
+
+        key = '|'.join(self.process_types)
+        now = time.time()
+        row = self.connection.execute('SELECT synced FROM sync WHERE process_types = ?', (key,)).fetchone()
+        changed = 0
+        if row:
+            processes = self.lims.get_processes(type=self.process_types,
+                                                last_modified=_last_modified(row[0] - SYNC_OVERLAP))
+            artifacts = []
+            for process in processes:
+                artifacts += process.all_outputs(unique=True)
+            prefetch_artifacts(self.lims, artifacts, containers=False)
+            changed = self.record(passed_lanes(artifacts))
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO sync (process_types, synced) VALUES (?, ?)', (key, now))
+        return changed
+
+    def _lims_artifacts(self, sample_ids, qc_flag=None):
+        """The sequencing artifacts of the samples, not hydrated."""
+
+        artifacts = []
+        for chunk in chunks(sorted(sample_ids), 100):
+            artifacts += self.lims.get_artifacts(samplelimsid=chunk, process_type=self.process_types,
+                                                 qc_flag=qc_flag)
+        return artifacts
+
+    def _lims_lanes(self, sample_ids):
+        """All lanes of the samples, from the LIMS. Pooled artifacts give
+        lanes for all their samples, so that a stored artifact is stored
+        for all its samples."""
+
+        artifacts = self._lims_artifacts(sample_ids)
+        get_batch(self.lims, artifacts)
+        return passed_lanes(artifacts)
+
+    def refresh(self, sample_ids):
+        """Check the lanes of the backfilled samples among sample_ids against
+        the passed artifacts in the LIMS: read all passed ones, record the
+        ones that are new or whose reads changed, and remove the stored ones
+        that are no longer passed. Returns the number of changed lanes."""
+
+        sample_ids = set(row[0] for row in self._in('SELECT sample_id FROM sample WHERE sample_id IN (%s)',
+                                                    set(sample_ids)))
+        if not sample_ids:
+            return 0
+        listed = dict((art.id, art) for art in self._lims_artifacts(sample_ids, qc_flag='PASSED'))
+        artifacts = [art for art_id, art in sorted(listed.items())]
+        get_batch(self.lims, artifacts, force=True)
+        lanes = passed_lanes(artifacts)
+        for sample_id, art_id in self._in('SELECT sample_id, artifact_id FROM lane WHERE sample_id IN (%s)',
+                                          sample_ids):
+            if art_id not in listed:
+                lanes.append((sample_id, art_id, None))
+        return self.record(lanes)
+
+    def backfill(self, sample_ids):
+        """Read all lanes of the samples that were never backfilled."""
+
+        sample_ids = set(sample_ids)
+        known = set(row[0] for row in self._in('SELECT sample_id FROM sample WHERE sample_id IN (%s)', sample_ids))
+        missing = sample_ids - known
+        if not missing:
+            return 0
+        self.record(self._lims_lanes(missing), missing)
+        now = time.time()
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO sample (sample_id, backfilled) VALUES (?, ?)',
+                                        [(sample_id, now) for sample_id in missing])
+        return len(missing)
+
+    def totals(self, sample_ids):
+        """Return a dict sample id -> (reads, lanes), the stored totals plus
+        the entries added since they were stored."""
+
+        totals = dict((sample_id, (0.0, 0, 0)) for sample_id in sample_ids)
+        for sample_id, reads, lanes, seq in self._in(
+                'SELECT sample_id, reads, lanes, seq FROM total WHERE sample_id IN (%s)', totals):
+            totals[sample_id] = (reads, lanes, seq)
+        updates = []
+        for sample_id, (reads, lanes, seq) in totals.items():
+            delta = self.connection.execute(
+                'SELECT SUM(reads), SUM(lanes), MAX(seq) FROM entry WHERE sample_id = ? AND seq > ?',
+                (sample_id, seq)).fetchone()
+            if delta[2] is not None:
+                totals[sample_id] = (reads + delta[0], lanes + delta[1], delta[2])
+                updates.append((sample_id,) + totals[sample_id])
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO total (sample_id, reads, lanes, seq) VALUES (?, ?, ?, ?)', updates)
+        return dict((sample_id, (reads, lanes)) for sample_id, (reads, lanes, seq) in totals.items())
+
+    def rebuild(self, sample_ids=None):
+        """Audit: re-read all lanes of the samples, by default all backfilled
+        ones, from the LIMS and recompute their totals from the lanes.
+        Returns a dict sample id -> (ledger total, rebuilt total) for the
+        samples where the two differ."""
+
+        if sample_ids is None:
+            sample_ids = [row[0] for row in self.connection.execute('SELECT sample_id FROM sample')]
+        sample_ids = set(sample_ids)
+        before = self.totals(sample_ids)
+        lims_lanes = self._lims_lanes(sample_ids)
+        self.record(lims_lanes, sample_ids)
+        rebuilt = dict((sample_id, (0.0, 0)) for sample_id in sample_ids)
+        for sample_id, art_id, reads in lims_lanes:
+            if reads is not None and sample_id in rebuilt:
+                rebuilt[sample_id] = (rebuilt[sample_id][0] + reads, rebuilt[sample_id][1] + 1)
+        max_seq = self.connection.execute('SELECT COALESCE(MAX(seq), 0) FROM entry').fetchone()[0]
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO total (sample_id, reads, lanes, seq) VALUES (?, ?, ?, ?)',
+                [(sample_id, reads, lanes, max_seq) for sample_id, (reads, lanes) in rebuilt.items()])
+            self.connection.executemany('INSERT OR REPLACE INTO sample (sample_id, backfilled) VALUES (?, ?)',
+                                        [(sample_id, now) for sample_id in sample_ids])
+        return dict((sample_id, (before[sample_id], rebuilt[sample_id])) for sample_id in sample_ids
+                    if before[sample_id] != rebuilt[sample_id])
+
+
+def main(args):
+    from clinical_EPPs.lims_client import get_lims
+
+    ledger = ReadsLedger(get_lims(), args.process_types)
+    if args.rebuild:
+        differences = ledger.rebuild(args.samples or None)
+        for sample_id, (before, rebuilt) in sorted(differences.items()):
+            logging.warning('%s: ledger %s reads from %s lanes, LIMS %s reads from %s lanes'
+                            % ((sample_id,) + before + rebuilt))
+        logging.info('Rebuilt the totals. %s sample(s) differed.' % len(differences))
+    elif args.sync:
+        logging.info('Synced %s changed lane(s).' % ledger.sync())
+    else:
+        changed = ledger.refresh(args.samples)
+        backfilled = ledger.backfill(args.samples)
+        logging.info('Refreshed %s changed lane(s), backfilled %s sample(s).' % (changed, backfilled))
+    for sample_id, (reads, lanes) in sorted(ledger.totals(args.samples).items()):
+        logging.info('%s: %s reads from %s lanes' % (sample_id, reads, lanes))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-s', dest = 'process_types', nargs='+', required=True,
+                        help='Sequencing process types to sum reads from')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Re-read all lanes from the LIMS and recompute the totals')
+    parser.add_argument('--sync', action='store_true',
+                        help='Read the lanes of the sequencing processes modified since the last sync')
+    parser.add_argument('samples', nargs='*',
+                        help='Sample ids to refresh and show totals for, and to rebuild (default all)')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""Local index of reagent type (index) sequences.
+
+Resolving a reagent label with lims.get_reagent_types(name=name) costs two
+requests per label. The sequences of the reagent types almost never change,
+so ReagentTypeIndex keeps them in an SQLite cache, loads the whole cache to
+memory in one query, and only asks the LIMS for labels that are missing,
+without a sequence or older than the TTL. Labels that are not reagent types
+in the LIMS are not cached, so a reagent type created later is found at its
+next lookup. The cache can be filled in advance with:
+
+    python -m clinical_EPPs.reagent_types --refresh
+"""
+
+from argparse import ArgumentParser
+from genologics.entities import ReagentType
+
+import time
+import logging
+
+from clinical_EPPs.cache import connect
+
+DB_FILE = 'reagent_types.sqlite'
+TTL = 30 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reagent_type (
+    name TEXT PRIMARY KEY,
+    uri TEXT,
+    sequence TEXT,
+    fetched REAL NOT NULL
+);
+"""
+
+
+def _parse_sequence(root):
+    """Get the index sequence from reagent type XML, as ReagentType does."""
+
+    for special_type in root.findall('special-type'):
+        if special_type.attrib.get('name') == 'Index':
+            for attribute in special_type.findall('attribute'):
+                if attribute.attrib.get('name') == 'Sequence':
+                    return attribute.attrib.get('value')
+    return None
+
+
+class ReagentTypeIndex():
+    """Reagent label name -> index sequence, from the cache or the LIMS."""
+
+    def __init__(self, lims, ttl=TTL, db_file=DB_FILE, **connect_args):
+        self.lims = lims
+        self.ttl = ttl
+        self.connection = connect(db_file, SCHEMA, **connect_args)
+        self.index = {}
+        self.fetched = 0
+        self.load()
+
+    def load(self):
+        """Load the whole cache to memory."""
+
+        rows = self.connection.execute('SELECT name, uri, sequence, fetched FROM reagent_type')
+        self.index = dict((name, (uri, sequence, fetched)) for name, uri, sequence, fetched in rows)
+
+    def _expired(self, name):
+        if name not in self.index or self.index[name][1] is None:
+            return True
+        return time.time() - self.index[name][2] > self.ttl
+
+    def _store(self, entries):
+        """entries: list of (name, uri, sequence)"""
+
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO reagent_type (name, uri, sequence, fetched) VALUES (?, ?, ?, ?)',
+                [(name, uri, sequence, now) for name, uri, sequence in entries])
+        for name, uri, sequence in entries:
+            self.index[name] = (uri, sequence, now)
+
+    def _fetch(self, name):
+        reagent_types = self.lims.get_reagent_types(name=name)
+        self.fetched += 1
+        if not reagent_types:
+            return (name, None, None)
+        # Will never be more than one. Names are unique
+        return (name, reagent_types[0].uri, reagent_types[0].sequence)
+
+    def sequences(self, names):
+        """Return a dict name -> sequence for all names. Names missing in the
+        cache, without a sequence or expired, are fetched from the LIMS, and
+        stored if they are reagent types. The sequence is None for names that
+        are not reagent types in the LIMS, or have no index sequence."""
+
+        missing = [name for name in set(names) if self._expired(name)]
+        if missing:
+            fetched = [self._fetch(name) for name in missing]
+            self._store([entry for entry in fetched if entry[1] is not None])
+        return dict((name, self.index[name][1] if name in self.index else None) for name in names)
+
+    def sequence(self, name):
+        return self.sequences([name])[name]
+
+    def refresh(self):
+        """List all reagent types in the LIMS, and fetch the ones that are
+        missing in the cache or expired."""
+
+        listed = []
+        root = self.lims.get(self.lims.get_uri(ReagentType._URI))
+        while True:
+            for node in root.findall(ReagentType._TAG):
+                listed.append((node.attrib['name'], node.attrib['uri']))
+            next_page = root.find('next-page')
+            if next_page is None:
+                break
+            root = self.lims.get(next_page.attrib['uri'])
+        entries = []
+        for name, uri in listed:
+            if self._expired(name):
+                entries.append((name, uri, _parse_sequence(self.lims.get(uri))))
+                self.fetched += 1
+        self._store(entries)
+        return len(listed), len(entries)
+
+
+def main(args):
+    from clinical_EPPs.lims_client import get_lims
+
+    index = ReagentTypeIndex(get_lims())
+    if args.refresh:
+        listed, fetched = index.refresh()
+        logging.info('%s reagent types in the LIMS. Fetched %s new or expired.' % (listed, fetched))
+    for name in args.names:
+        logging.info('%s: %s' % (name, index.sequence(name)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--refresh', action='store_true',
+                        help='Fetch all reagent types that are missing in the cache or expired')
+    parser.add_argument('names', nargs='*',
+                        help='Reagent label names to look up')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,96 @@
+"""Reader for instrument result files, eg. qPCR and Quant-iT results.
+
+The result files are read row by row, with openpyxl in read-only mode for
+Excel files (.xlsx, .xlsm), xlrd for legacy Excel files (.xls) and the csv
+module for CSV exports (.csv, .txt), and only the well column and the
+requested columns are kept. Only the first sheet is loaded, and not pandas.
+Other files are refused with a ValueError.
+
+    values = read_result_file(path, ['Cq', 'SQ'])
+    Cq, SQ = values['A01']
+
+Columns are given by header name, or by position with header=False.
+"""
+
+from collections import OrderedDict
+
+import csv
+import numpy
+import os
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+LEGACY_EXCEL_EXTENSIONS = ('.xls',)
+CSV_EXTENSIONS = ('.csv', '.txt')
+
+
+def _to_float(value):
+    """The value as a float, NaN for blank or non numeric cells."""
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return numpy.nan
+
+
+def iter_rows(path, max_col=None):
+    """Yield the rows of the first sheet of an Excel file, or of a CSV
+    file, as tuples of cell values. max_col limits the columns read.
+    Raises ValueError for other file types."""
+
+    extensions = EXCEL_EXTENSIONS + LEGACY_EXCEL_EXTENSIONS + CSV_EXTENSIONS
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in extensions:
+        raise ValueError('Can not read result file %s: only %s files are supported' % (
+            path, ', '.join(extensions)))
+    if extension in CSV_EXTENSIONS:
+        with open(path) as csv_file:
+            for row in csv.reader(csv_file):
+                yield tuple(row[:max_col])
+        return
+    if extension in LEGACY_EXCEL_EXTENSIONS:
+        import xlrd
+        workbook = xlrd.open_workbook(path, on_demand=True)
+        try:
+            sheet = workbook.sheet_by_index(0)
+            for i in range(sheet.nrows):
+                yield tuple(sheet.row_values(i)[:max_col])
+        finally:
+            workbook.release_resources()
+        return
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(max_col=max_col, values_only=True):
+            yield row
+    finally:
+        workbook.close()
+
+
+def read_result_file(path, columns, well_column='Well', header=True):
+    """Return an OrderedDict well -> numpy array with the values of columns,
+    in file order. Blank and non numeric cells are NaN, and rows without a
+    well are skipped. If a well is on several rows, the last one is kept.
+
+    With header, the first row holds the column names and columns and
+    well_column are names. Without, they are column positions."""
+
+    if header:
+        header_rows = iter_rows(path)
+        names = [None if name is None else str(name).strip() for name in next(header_rows, ())]
+        header_rows.close()
+        missing = [name for name in [well_column] + list(columns) if name not in names]
+        if missing:
+            raise ValueError('Columns %s not found in %s' % (', '.join(missing), path))
+        well_column = names.index(well_column)
+        columns = [names.index(name) for name in columns]
+    rows = iter_rows(path, max_col=max([well_column] + list(columns)) + 1)
+    if header:
+        next(rows, None)
+    values = OrderedDict()
+    for row in rows:
+        well = row[well_column] if well_column < len(row) else None
+        if well is None or not str(well).strip():
+            continue
+        values[str(well).strip()] = numpy.array(
+            [_to_float(row[column]) if column < len(row) else numpy.nan for column in columns])
+    return values
@@ -0,0 +1,301 @@
+"""Worker daemon running EPP scripts with warm imports, and its client.
+
+Every EPP run by the LIMS starts a new Python, which imports genologics,
+NumPy, SQLAlchemy and the clinical_EPPs modules, reads the config files and
+checks the LIMS API version before doing any work. The worker daemon
+(EPPs/epp_worker.py) does all that once and listens on a Unix socket. The
+client shim (EPPs/epp_client.py) is run by the automation string instead of
+the EPP, and sends the daemon the script name, arguments, working directory
+and environment:
+
+    bash -c "/home/glsai/miniconda2/envs/epp_master/bin/epp_client.py bcl2fastq.py -p {processLuid}"
+
+For each run the daemon forks a process that runs the script as __main__.
+The stdout and stderr of the script are streamed back to the client, which
+writes them to its own stdout and stderr and exits with the exit status of
+the script. The forked process starts with all that the daemon imported and
+read, and get_lims skips the version check already done by the daemon. The
+HTTP connections are not shared with the daemon: a connection can not be
+used by two processes at once.
+
+If no daemon is listening, the client runs the script itself, as before.
+"""
+
+from clinical_EPPs.cache import CACHE_DIR
+
+import atexit
+import errno
+import importlib
+import json
+import os
+import pkgutil
+import runpy
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+import traceback
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+SOCKET_PATH = os.path.join(CACHE_DIR, 'epp_worker.sock')
+
+# Imported by the daemon before serving, if installed
+PRELOAD = ['numpy', 'sqlalchemy', 'requests', 'openpyxl', 'pandas',
+           'genologics.lims', 'genologics.entities', 'genologics.epp', 'genologics.config']
+
+# Frames sent to the client: stream (EXIT, STDOUT or STDERR) and data length,
+# followed by the data. The data of the EXIT frame is the exit status.
+FRAME = struct.Struct('!BI')
+EXIT, STDOUT, STDERR = 0, 1, 2
+CHUNK_SIZE = 65536
+
+
+def _send_frame(sock, stream, data):
+    sock.sendall(FRAME.pack(stream, len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _recv_frame(sock):
+    """(stream, data) of the next frame, or (None, None) if the connection
+    was closed."""
+
+    header = _recv_exact(sock, FRAME.size)
+    if header is None:
+        return None, None
+    stream, size = FRAME.unpack(header)
+    return stream, _recv_exact(sock, size) if size else b''
+
+
+def preload(modules=PRELOAD):
+    """Import modules and all clinical_EPPs modules. Modules that can not be
+    imported, eg. clinical_EPPs.config without ~/.clinical_eppsrc, are
+    skipped. Returns the names of the modules imported."""
+
+    import clinical_EPPs
+    modules = list(modules) + ['clinical_EPPs.' + name for loader, name, is_pkg
+                               in pkgutil.iter_modules(clinical_EPPs.__path__)]
+    loaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception as e:
+            sys.stderr.write('Not preloaded: %s (%s)\n' % (name, e))
+    return loaded
+
+
+def _exit_code(code):
+    """The exit status of sys.exit(code), printing code if it is a message."""
+
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write('%s\n' % code)
+    return 1
+
+
+def run_script(path, argv):
+    """Run the script path as __main__ with sys.argv[1:] = argv, and the
+    exit functions it registered, as at the exit of Python. Returns the exit
+    status."""
+
+    sys.argv = [path] + list(argv)
+    sys.path[0] = os.path.dirname(path)
+    try:
+        runpy.run_path(path, run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        code = _exit_code(e.code)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    atexit._run_exitfuncs()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return code
+
+
+class EppRequestHandler(socketserver.StreamRequestHandler):
+    """Runs the script of a request in a forked process, and streams its
+    stdout and stderr and its exit status to the client. Runs in a process
+    forked by the server for the request."""
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        name = os.path.basename(request['script'])
+        path = os.path.join(self.server.scripts_dir, name)
+        if not os.path.isfile(path):
+            _send_frame(self.connection, STDERR, ('No such EPP script: %s\n' % name).encode('utf-8'))
+            _send_frame(self.connection, EXIT, b'2')
+            return
+        start = time.time()
+        code = self._run(path, request)
+        if code is None:
+            sys.stderr.write('%s: the client closed the connection\n' % name)
+            return
+        sys.stderr.write('%s %s: exit status %s in %.3f s\n' % (
+            name, ' '.join(request['argv']), code, time.time() - start))
+        _send_frame(self.connection, EXIT, str(code).encode('utf-8'))
+
+    def _run(self, path, request):
+        """Run the script in a forked process, forwarding its output. Returns
+        its exit status, or None if the client closed the connection."""
+
+        pipes = dict((stream, os.pipe()) for stream in (STDOUT, STDERR))
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                # Not the daemon's handler raising SystemExit(0), which the
+                # bare excepts of the EPPs would swallow: SIGTERM kills
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                devnull = os.open(os.devnull, os.O_RDONLY)
+                os.dup2(devnull, 0)
+                for stream, (read_fd, write_fd) in pipes.items():
+                    os.dup2(write_fd, stream)
+                    os.close(read_fd)
+                    os.close(write_fd)
+                self.connection.close()
+                self.server.socket.close()
+                os.chdir(request['cwd'])
+                os.environ.clear()
+                os.environ.update(request['env'])
+                code = run_script(path, request['argv'])
+            finally:
+                os._exit(code)
+        streams = {}
+        for stream, (read_fd, write_fd) in pipes.items():
+            os.close(write_fd)
+            streams[read_fd] = stream
+        try:
+            while streams:
+                readable = select.select(list(streams) + [self.connection], [], [])[0]
+                if self.connection in readable:
+                    # The client sends nothing after the request, so this is
+                    # the end of the connection
+                    if not self.connection.recv(1):
+                        raise socket.error('Connection closed')
+                    readable.remove(self.connection)
+                for read_fd in readable:
+                    data = os.read(read_fd, CHUNK_SIZE)
+                    if data:
+                        _send_frame(self.connection, streams[read_fd], data)
+                    else:
+                        os.close(read_fd)
+                        del streams[read_fd]
+        except socket.error:
+            # The client is gone, eg. killed by the LIMS
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+            return None
+        status = os.waitpid(pid, 0)[1]
+        if os.WIFSIGNALED(status):
+            return 128 + os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
+
+
+class EppWorker(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server running the EPP scripts in scripts_dir. The socket
+    can only be used by the user running the server."""
+
+    def __init__(self, socket_path, scripts_dir):
+        self.scripts_dir = os.path.abspath(scripts_dir)
+        if os.path.exists(socket_path):
+            if _connect(socket_path):
+                raise RuntimeError('An EPP worker is already listening on ' + socket_path)
+            os.unlink(socket_path)
+        elif not os.path.isdir(os.path.dirname(socket_path)):
+            os.makedirs(os.path.dirname(socket_path))
+        socketserver.UnixStreamServer.__init__(self, socket_path, EppRequestHandler, bind_and_activate=False)
+        old_umask = os.umask(0o177)
+        try:
+            self.server_bind()
+        finally:
+            os.umask(old_umask)
+        self.server_activate()
+
+
+def serve(socket_path=SOCKET_PATH, scripts_dir=None, check_version=True):
+    """Preload the modules, check the LIMS version and run the worker until
+    it is killed. scripts_dir is by default the directory of the script run."""
+
+    scripts_dir = scripts_dir or os.path.dirname(os.path.abspath(sys.argv[0]))
+    start = time.time()
+    loaded = preload()
+    if check_version:
+        from clinical_EPPs.lims_client import get_lims
+        try:
+            get_lims().check_version()
+        except Exception as e:
+            sys.stderr.write('Could not check the LIMS version, it is checked by each run: %s\n' % e)
+    server = EppWorker(socket_path, scripts_dir)
+    sys.stderr.write('Preloaded %s modules in %.2f s. Running the EPPs in %s on %s\n' % (
+        len(loaded), time.time() - start, scripts_dir, socket_path))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def _connect(socket_path):
+    """A socket connected to the worker on socket_path, or None if no worker
+    is listening."""
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error as e:
+        sock.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    return sock
+
+
+def _write(stream, data):
+    stream = getattr(stream, 'buffer', stream)
+    stream.write(data)
+    stream.flush()
+
+
+def call(script, argv, socket_path=SOCKET_PATH):
+    """Run script with argv in the worker, writing its stdout and stderr to
+    ours. Returns the exit status, or None if no worker is listening."""
+
+    sock = _connect(socket_path)
+    if sock is None:
+        return None
+    try:
+        request = {'script': script, 'argv': list(argv), 'cwd': os.getcwd(), 'env': dict(os.environ)}
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        while True:
+            stream, data = _recv_frame(sock)
+            if stream is None:
+                _write(sys.stderr, b'The EPP worker closed the connection\n')
+                return 1
+            if stream == EXIT:
+                return int(data)
+            _write(sys.stdout if stream == STDOUT else sys.stderr, data)
+    finally:
+        sock.close()
@@ -2,8 +2,10 @@
 from __future__ import division
 from argparse import ArgumentParser
 
-from genologics.lims import Lims
-from genologics.config import BASEURI,USERNAME,PASSWORD
+from clinical_EPPs.lims_client import get_lims
+from clinical_EPPs.batch import get_entities, put_batch
+from clinical_EPPs.parallel import MAX_WORKERS
+from collections import OrderedDict
 from datetime import datetime
 
 import logging
@@ -12,16 +14,34 @@ import sys
 DESC = """
 One time script to set historical dates on samples. 
 
+With -w, the dates are set in bulk: the steps are read with -w requests at
+a time, their artifacts and samples with concurrent batch retrieve calls, and
+each sample gets its latest date written once, with batch update calls.
+
 Written by Maya Brandi, Science for Life Laboratory, Stockholm, Sweden
 """
 
+PREP_STEPS = ['CG002 - Aggregate QC (Library Validation) (Dev)',
+              'CG002 - Aggregate QC (Library Validation)',
+              'Aggregate QC (Library Validation) TWIST v1',
+              'Aggregate QC (Library Validation) (RNA) v2',
+              'Aggregate QC (Library Validation)']
+SEQ_STEPS = ['CG002 - Sequence Aggregation']
+REC_STEPS = ['CG002 - Reception Control (Dev)', 
+             'CG002 - Reception Control', 
+             'Reception Control TWIST v1',
+             'Reception Control no placement v1',
+             'Reception Control (RNA) v1']
+DELIV_STEPS = ['CG002 - Delivery', 'Delivery v1']
+
+# date -> (steps, sample udf, step udf with the date, sample udf required to be set)
+DATES = OrderedDict([('prep', (PREP_STEPS, 'Library Prep Finished', None, None)),
+                     ('seq', (SEQ_STEPS, 'Sequencing Finished', 'Finish Date', 'Passed Sequencing QC')),
+                     ('rec', (REC_STEPS, 'Received at', 'date arrived at clinical genomics', None)),
+                     ('deliv', (DELIV_STEPS, 'Delivered at', 'Date delivered', None))])
+
 def set_prep_dates(lims):
-    process_types = ['CG002 - Aggregate QC (Library Validation) (Dev)',
-                  'CG002 - Aggregate QC (Library Validation)',
-                  'Aggregate QC (Library Validation) TWIST v1',
-                  'Aggregate QC (Library Validation) (RNA) v2',
-                  'Aggregate QC (Library Validation)']
-    steps = lims.get_processes(type=process_types)
+    steps = lims.get_processes(type=PREP_STEPS)
     print(len(steps))
     for i, step in enumerate(steps):
         if not step.date_run:
@@ -40,8 +60,7 @@ def set_prep_dates(lims):
         
 
 def set_seq_dates(lims):
-    process_types = ['CG002 - Sequence Aggregation']
-    steps = lims.get_processes(type=process_types)
+    steps = lims.get_processes(type=SEQ_STEPS)
     print(len(steps)) 
     for i, step in enumerate(steps):
         if not step.date_run:
@@ -65,12 +84,7 @@ def set_seq_dates(lims):
 
 
 def set_rec_dates(lims):
-    process_types = ['CG002 - Reception Control (Dev)', 
-                   'CG002 - Reception Control', 
-                   'Reception Control TWIST v1',
-                   'Reception Control no placement v1',
-                   'Reception Control (RNA) v1']
-    steps = lims.get_processes(type=process_types)
+    steps = lims.get_processes(type=REC_STEPS)
     print(len(steps))
     for i, step in enumerate(steps):
         if not step.date_run:
@@ -91,9 +105,7 @@ def set_rec_dates(lims):
 
 
 def set_deliv_dates(lims):
-    process_types = ['CG002 - Delivery', 'Delivery v1']
-
-    steps = lims.get_processes(type=process_types)
+    steps = lims.get_processes(type=DELIV_STEPS)
     print(len(steps))
     for i, step in enumerate(steps):
         if not step.date_run:
@@ -112,7 +124,57 @@ def set_deliv_dates(lims):
                 samp.udf['Delivered at'] = date
                 samp.put()
 
+
+def set_dates(lims, process_types, sample_udf, date_udf=None, passed_udf=None, max_workers=MAX_WORKERS):
+    """Bulk version of the set_*_dates functions. Set sample_udf of the samples
+    of all steps of process_types to the latest date of their steps, unless
+    they already have a later date. The date of a step is its date_udf, or
+    else its run date. With passed_udf, only samples with it set are updated.
+    Returns the steps, the updated samples and (sample, error) for samples
+    that could not be saved."""
+
+    steps = lims.get_processes(type=process_types)
+    get_entities(lims, steps, max_workers=max_workers)
+    step_dates = []
+    for step in steps:
+        if not step.date_run:
+            continue
+        date = step.udf.get(date_udf) if date_udf else None
+        if not date:
+            date = datetime.strptime(step.date_run, '%Y-%m-%d').date()
+        step_dates.append((step.all_inputs(), date))
+    get_entities(lims, [art for arts, date in step_dates for art in arts], max_workers=max_workers)
+    latest = OrderedDict()
+    for arts, date in step_dates:
+        for art in arts:
+            for samp in art.samples:
+                if samp.id not in latest or latest[samp.id][1] < date:
+                    latest[samp.id] = (samp, date)
+    get_entities(lims, [samp for samp, date in latest.values()], max_workers=max_workers)
+    updated = []
+    for samp, date in latest.values():
+        if passed_udf and not samp.udf.get(passed_udf):
+            continue
+        old_date = samp.udf.get(sample_udf)
+        if old_date and old_date >= date:
+            continue
+        samp.udf[sample_udf] = date
+        updated.append(samp)
+    failed = put_batch(lims, updated, max_workers=max_workers)
+    return steps, updated, failed
+
+
 def main(lims, args):
+    if args.workers:
+        for name, (process_types, sample_udf, date_udf, passed_udf) in DATES.items():
+            if not getattr(args, name):
+                continue
+            steps, updated, failed = set_dates(lims, process_types, sample_udf, date_udf, passed_udf,
+                                               args.workers)
+            print('%s: %s steps, %s samples updated' % (sample_udf, len(steps), len(updated) - len(failed)))
+            for samp, error in failed:
+                print('%s not saved: %s' % (samp.id, error))
+        return
     if args.prep:
         set_prep_dates(lims)
     if args.seq:
@@ -132,7 +194,9 @@ if __name__ == "__main__":
                         help='Set received date. (First reception comtrol step)')
     parser.add_argument('-d', dest='deliv', action='store_true', default=False,
                         help='Set delivered date. (Last delivery step)')
+    parser.add_argument('-w', dest='workers', type=int, nargs='?', const=MAX_WORKERS,
+                        help='Set the dates in bulk, with this many concurrent requests (default %s)' % MAX_WORKERS)
 
     args = parser.parse_args()
-    lims = Lims(BASEURI, USERNAME, PASSWORD)
+    lims = get_lims()
     main(lims, args)
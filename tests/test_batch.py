@@ -0,0 +1,103 @@
+"""Tests of clinical_EPPs.batch. Run from the repository root with
+
+    python -m unittest discover tests
+"""
+
+from genologics.lims import Lims
+from genologics.entities import Artifact
+from xml.etree import ElementTree
+
+from clinical_EPPs.batch import WriteBuffer
+
+import unittest
+
+ARTIFACT_XML = """<art:artifact xmlns:art="http://genologics.com/ri/artifact"
+    xmlns:udf="http://genologics.com/ri/userdefined"
+    uri="http://lims.test/api/v2/artifacts/2-1" limsid="2-1">
+  <name>Sample 1</name>
+  <qc-flag>UNKNOWN</qc-flag>
+  <udf:field name="Concentration" type="Numeric">0</udf:field>
+  <udf:field name="Size (bp)" type="Numeric">350</udf:field>
+</art:artifact>"""
+
+
+class RecordingLims(Lims):
+    """Lims keeping the batch/update calls instead of posting them."""
+
+    def __init__(self):
+        Lims.__init__(self, 'http://lims.test', 'user', 'password')
+        self.posted = []
+
+    def post(self, uri, data, params=dict()):
+        self.posted.append((uri, ElementTree.fromstring(data)))
+
+
+class TestWriteBufferInstances(unittest.TestCase):
+    """Two instances of one artifact, as from process.all_inputs() and from
+    the ?state= uris of process.input_output_maps."""
+
+    def setUp(self):
+        self.lims = RecordingLims()
+        self.artifact = Artifact(self.lims, id='2-1')
+        self.state_artifact = Artifact(self.lims, uri=self.artifact.uri + '?state=5')
+        for instance in (self.artifact, self.state_artifact):
+            instance.root = ElementTree.fromstring(ARTIFACT_XML)
+        self.write_buffer = WriteBuffer(self.lims)
+
+    def written_root(self):
+        """The one artifact written, as an unsaved Artifact."""
+
+        self.assertEqual(len(self.lims.posted), 1)
+        uri, details = self.lims.posted[0]
+        self.assertTrue(uri.endswith('/artifacts/batch/update'))
+        self.assertEqual(len(details), 1)
+        written = Artifact(self.lims, id='2-written')
+        written.root = details[0]
+        return written
+
+    def test_changes_of_both_instances_are_written(self):
+        self.write_buffer.track([self.artifact])
+        self.artifact.udf['Concentration'] = 5
+        self.state_artifact.qc_flag = 'PASSED'
+        self.write_buffer.add(self.artifact)
+        self.write_buffer.add(self.state_artifact)
+
+        self.assertEqual(self.write_buffer.flush(), [])
+        self.assertEqual(self.write_buffer.skipped, 0)
+        written = self.written_root()
+        self.assertEqual(written.udf['Concentration'], 5)
+        self.assertEqual(written.qc_flag, 'PASSED')
+
+    def test_stale_values_do_not_overwrite_changes(self):
+        self.write_buffer.track([self.artifact, self.state_artifact])
+        self.artifact.udf['Concentration'] = 5
+        self.state_artifact.udf['Size (bp)'] = 400
+        self.write_buffer.add(self.artifact)
+        self.write_buffer.add(self.state_artifact)
+
+        self.assertEqual(self.write_buffer.flush(), [])
+        written = self.written_root()
+        self.assertEqual(written.udf['Concentration'], 5)
+        self.assertEqual(written.udf['Size (bp)'], 400)
+        self.assertEqual(written.qc_flag, 'UNKNOWN')
+
+    def test_unchanged_instances_are_skipped(self):
+        self.write_buffer.track([self.artifact])
+        self.write_buffer.add(self.artifact)
+        self.write_buffer.add(self.state_artifact)
+
+        self.assertEqual(self.write_buffer.flush(), [])
+        self.assertEqual(self.write_buffer.skipped, 1)
+        self.assertEqual(self.lims.posted, [])
+
+    def test_untracked_instances_are_merged_whole(self):
+        self.state_artifact.udf['Concentration'] = 5
+        self.write_buffer.add(self.artifact)
+        self.write_buffer.add(self.state_artifact)
+
+        self.assertEqual(self.write_buffer.flush(), [])
+        self.assertEqual(self.written_root().udf['Concentration'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
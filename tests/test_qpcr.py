@@ -0,0 +1,81 @@
+"""Tests of the replicate layouts in clinical_EPPs.qpcr. Run from the
+repository root with
+
+    python -m unittest discover tests
+"""
+
+from clinical_EPPs.qpcr import DilutionPlate
+
+import unittest
+
+PASSING = {'1E03': [20.0, 20.1, 20.2, 20.1],
+           '2E03': [21.0, 21.1, 21.2, 21.1],
+           '1E04': [23.4, 23.5, 23.6, 23.5]}
+
+
+def check(Cq, replicates):
+    """The DilutionResult of one sample with the Cq values of the passing
+    sample, replaced by Cq, keeping the first replicates values of each."""
+
+    values = dict(PASSING, **Cq)
+    values = dict((dil, Cq_values[:replicates]) for dil, Cq_values in values.items())
+    dilution_data = {'A1': {'Cq': values,
+                            'SQ': dict((dil, [1e-12] * len(Cq_values)) for dil, Cq_values in values.items())}}
+    plate = DilutionPlate(dilution_data, ['A1'], replicates)
+    plate.check_dilution_range()
+    plate.check_distance_find_outlyer()
+    return plate.results(size_bp=470)[0]
+
+
+class TestReplicates(unittest.TestCase):
+
+    def test_passing_sample(self):
+        for replicates in (2, 3, 4):
+            result = check({}, replicates)
+            self.assertFalse(result.failed_sample)
+            self.assertFalse(result.error)
+            self.assertEqual(result.index, {'1E03': None, '2E03': None, '1E04': None})
+
+    def test_triplicate_distance_outlyer_is_removed(self):
+        result = check({'1E04': [25.05, 25.1, 25.45]}, 3)
+        self.assertFalse(result.failed_sample)
+        self.assertEqual(result.poped_dilutes['1E04'], 25.45)
+        self.assertEqual(result.removed_by['1E04'], 'distance')
+        self.assertEqual(result.Cq['1E04'], [25.05, 25.1])
+
+    def test_quadruplicate_range_outlyer_is_removed(self):
+        result = check({'1E03': [20.0, 20.1, 20.2, 22.0]}, 4)
+        self.assertFalse(result.failed_sample)
+        self.assertEqual(result.poped_dilutes['1E03'], 22.0)
+        self.assertEqual(result.removed_by['1E03'], 'range')
+        self.assertEqual(result.Cq['1E03'], [20.0, 20.1, 20.2])
+
+    def test_quadruplicate_distance_outlyer_is_removed(self):
+        result = check({'1E04': [25.0, 25.05, 25.1, 25.4]}, 4)
+        self.assertFalse(result.failed_sample)
+        self.assertEqual(result.poped_dilutes['1E04'], 25.4)
+        self.assertEqual(result.removed_by['1E04'], 'distance')
+        self.assertEqual(result.Cq['1E04'], [25.0, 25.05, 25.1])
+        self.assertIsNotNone(result.concentration)
+
+    def test_quadruplicate_second_outlyer_fails(self):
+        result = check({'1E04': [25.0, 25.05, 25.7, 25.75]}, 4)
+        self.assertTrue(result.failed_sample)
+
+    def test_duplicate_range_fails_without_removal(self):
+        result = check({'1E03': [20.0, 21.0]}, 2)
+        self.assertTrue(result.failed_sample)
+        self.assertEqual(result.index['1E03'], 'Fail')
+        self.assertIsNone(result.poped_dilutes['1E03'])
+        self.assertEqual(result.Cq['1E03'], [20.0, 21.0])
+
+    def test_duplicate_distance_fails_without_removal(self):
+        result = check({'1E04': [27.0, 27.1]}, 2)
+        self.assertTrue(result.failed_sample)
+        self.assertEqual(result.index['1E04'], 'Fail')
+        self.assertIsNone(result.poped_dilutes['1E04'])
+        self.assertIn('Too few replicates', result.log)
+
+
+if __name__ == '__main__':
+    unittest.main()